@@ -0,0 +1,18 @@
+"""
+ASGI config for GYWAN project.
+
+Serves the async content views (main/views_async.py). Run it with the
+uvicorn worker, see gywan_project/gunicorn_asgi.py.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gywan_project.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+# Connections belong to threads and every request gets a new sync thread,
+# so persistent connections would only pile up
+os.environ.setdefault('CONN_MAX_AGE', '0')
+
+application = get_asgi_application()
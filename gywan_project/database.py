@@ -0,0 +1,89 @@
+"""
+SQLite connection settings and read/write routing.
+
+Every connection runs in WAL mode with the pragmas below, so readers don't
+block on a writer and a writer waits (``busy_timeout``) instead of failing
+with "database is locked". Writes open their transactions with ``BEGIN
+IMMEDIATE``, which takes the write lock up front: a deferred transaction that
+reads and then writes can't wait for the lock and fails straight away.
+
+``ReadOnlyRouter`` sends reads to a second alias opened on the same file in
+read-only mode, except inside a write transaction, where they must see its
+uncommitted rows.
+"""
+from pathlib import Path
+
+DEFAULT_ALIAS = 'default'
+READ_ONLY_ALIAS = 'readonly'
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable across application crashes; only a power loss can drop the last commits
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Negative: KiB, i.e. 64 MB of page cache per connection
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# journal_mode and synchronous can't be changed on a read-only connection
+READ_ONLY_PRAGMAS = dict(
+    {name: value for name, value in PRAGMAS.items() if name not in ('journal_mode', 'synchronous')},
+    query_only='ON',
+)
+
+
+def init_command(pragmas):
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
+def sqlite_database(path, read_only=False, tuned=True, conn_max_age=0):
+    """A ``DATABASES`` entry for the SQLite file at ``path``"""
+    options = {}
+    if read_only:
+        name = f'file:{path}?mode=ro'
+    else:
+        name = str(path)
+    if tuned:
+        options['init_command'] = init_command(READ_ONLY_PRAGMAS if read_only else PRAGMAS)
+        if not read_only:
+            options['transaction_mode'] = 'IMMEDIATE'
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': options,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': conn_max_age != 0,
+    }
+    if read_only:
+        # Tests share the default test database instead of creating another
+        database['TEST'] = {'MIRROR': DEFAULT_ALIAS}
+    else:
+        # A file rather than Django's shared-cache in-memory database, whose
+        # table locks fail at once instead of honouring busy_timeout
+        database['TEST'] = {'NAME': str(Path(path).with_name(f'test_{Path(path).name}'))}
+    return database
+
+
+class ReadOnlyRouter:
+    """Read from the read-only alias outside write transactions"""
+
+    def db_for_read(self, model, **hints):
+        from django.conf import settings
+        from django.db import connections
+
+        if READ_ONLY_ALIAS not in settings.DATABASES or connections[DEFAULT_ALIAS].in_atomic_block:
+            return DEFAULT_ALIAS
+        return READ_ONLY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_ALIAS, READ_ONLY_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_ALIAS
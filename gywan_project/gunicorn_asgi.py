@@ -0,0 +1,48 @@
+"""
+Gunicorn config for the ASGI entry point (gywan_project/asgi.py).
+
+    pip install uvicorn-worker 'uvicorn[standard]'
+    METRICS_DIR=/run/gywan/metrics gunicorn -c gywan_project/gunicorn_asgi.py
+
+Gunicorn manages the processes and uvicorn workers run an event loop in
+each, so a worker holds many slow clients and keep-alive connections for
+the memory of one. The views still run their queries and templates in
+threads, ``ASGI_MAX_ACTIVE_REQUESTS`` at a time per worker (see
+main/concurrency.py), so size the workers by CPU rather than by the
+number of clients as with sync workers; ``manage.py bench_asgi`` compares
+the two at equal memory.
+
+Everything can be overridden with GUNICORN_* environment variables.
+"""
+import multiprocessing
+
+from decouple import config
+
+wsgi_app = 'gywan_project.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+bind = config('GUNICORN_BIND', default='127.0.0.1:8000')
+# One per core: the event loop doesn't wait on I/O, queries wait in threads
+workers = config('GUNICORN_WORKERS', default=multiprocessing.cpu_count(), cast=int)
+# Passed on to uvicorn, as are max_requests and forwarded_allow_ips
+keepalive = config('GUNICORN_KEEPALIVE', default=5, cast=int)
+timeout = config('GUNICORN_TIMEOUT', default=30, cast=int)
+graceful_timeout = config('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+# Recycle workers now and then to cap memory growth, staggered so they
+# don't all restart together
+max_requests = config('GUNICORN_MAX_REQUESTS', default=10000, cast=int)
+max_requests_jitter = config('GUNICORN_MAX_REQUESTS_JITTER', default=1000, cast=int)
+# Load Django once in the master so workers share its pages copy-on-write
+preload_app = config('GUNICORN_PRELOAD', default=True, cast=bool)
+
+accesslog = config('GUNICORN_ACCESSLOG', default='-')
+errorlog = '-'
+# The nginx in front (see README) sets X-Forwarded-For and X-Forwarded-Proto
+forwarded_allow_ips = config('GUNICORN_FORWARDED_ALLOW_IPS', default='127.0.0.1')
+
+
+def on_starting(server):
+    # Counters of the previous run's workers would otherwise add to this one's
+    if preload_app:
+        from main import metrics
+        metrics.clear_directory()
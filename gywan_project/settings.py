@@ -6,6 +6,8 @@ from pathlib import Path
 import os
 from decouple import config
 
+from . import database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,13 +36,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole stack; removes itself when sampling is off
+    'main.profiling.ProfilingMiddleware',
+    # Before the page cache, to count its hits and misses
+    'main.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, plus the .zst siblings written by collectstatic
+    'main.storage.StaticFilesMiddleware',
+    # ASGI only: how many requests a worker renders at once
+    'main.concurrency.ActiveRequestLimitMiddleware',
+    'main.querybudget.QueryBudgetMiddleware',
+    'main.streaming.RangeRequestMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'main.pagecache.PageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -58,21 +70,128 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'main.context_processors.site_context',
+                # Must come last: replaces the CSRF token in pages being cached
+                'main.pagecache.csrf_context',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'gywan_project.wsgi.application'
+ASGI_APPLICATION = 'gywan_project.asgi.application'
+
+# Route the content pages to the async views (main/views_async.py); set by
+# gywan_project/asgi.py, as under WSGI they'd only add a thread hop
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+# Requests an ASGI worker lets into the middleware and views at once (see
+# main/concurrency.py), like the thread count of a sync worker; 0 for no limit
+ASGI_MAX_ACTIVE_REQUESTS = config('ASGI_MAX_ACTIVE_REQUESTS', default=8, cast=int)
 
 # Database
+# SQLite in WAL mode with per-connection pragmas; reads go to a read-only
+# connection on the same file (see gywan_project/database.py).
+DATABASE_PATH = config('DATABASE_PATH', default=str(BASE_DIR / 'db.sqlite3'))
+# Set to False for the stock SQLite settings (e.g. to benchmark against them)
+SQLITE_TUNING = config('SQLITE_TUNING', default=True, cast=bool)
+# Seconds to keep a connection open between requests; 0 closes it after each one.
+# gywan_project/asgi.py defaults it to 0, as each ASGI request runs its
+# queries in a thread of its own
+CONN_MAX_AGE = config('CONN_MAX_AGE', default=600, cast=int)
 DATABASES = {
+    'default': database.sqlite_database(DATABASE_PATH, tuned=SQLITE_TUNING, conn_max_age=CONN_MAX_AGE),
+}
+if SQLITE_TUNING and config('DATABASE_READ_ONLY_ALIAS', default=True, cast=bool):
+    DATABASES[database.READ_ONLY_ALIAS] = database.sqlite_database(
+        DATABASE_PATH, read_only=True, conn_max_age=CONN_MAX_AGE
+    )
+    DATABASE_ROUTERS = ['gywan_project.database.ReadOnlyRouter']
+
+# Cache
+# Use a shared backend (e.g. Redis or FileBasedCache) when running several
+# workers so that homepage invalidation and page cache purges reach every
+# process; `check --deploy` warns while the page cache is in LocMemCache.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='gywan-cache'),
     }
 }
 
+# Seconds before a cached homepage section expires on its own
+HOMEPAGE_CACHE_TIMEOUT = config('HOMEPAGE_CACHE_TIMEOUT', default=60 * 15, cast=int)
+# Seconds the homepage waits for an uncached section before showing its fallback
+HOMEPAGE_SECTION_TIMEOUT = config('HOMEPAGE_SECTION_TIMEOUT', default=2.0, cast=float)
+# Threads per process loading uncached homepage sections concurrently under
+# WSGI (ASGI uses the event loop's); 0 loads them one by one in the request
+# under both
+HOMEPAGE_SECTION_WORKERS = config('HOMEPAGE_SECTION_WORKERS', default=4, cast=int)
+# Send browsers that have run the homepage's script placeholders for the
+# sections below the fold, fetched as they scroll into view; everyone else
+# gets the whole page
+HOMEPAGE_LAZY_SECTIONS = config('HOMEPAGE_LAZY_SECTIONS', default=True, cast=bool)
+HOMEPAGE_LAZY_COOKIE = 'js'
+# Seconds browsers and proxies may reuse a fetched homepage section
+HOMEPAGE_FRAGMENT_MAX_AGE = config('HOMEPAGE_FRAGMENT_MAX_AGE', default=60, cast=int)
+
+# Full-page cache for anonymous visitors (see main/pagecache.py). Needs a
+# cache shared by all workers, see CACHES above
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=60 * 10, cast=int)
+PAGE_CACHE_VIEWS = (
+    'home', 'about', 'our_team',
+    'events', 'event_detail', 'stories', 'story_detail',
+    'blog', 'blog_detail', 'resources', 'home_section',
+)
+# Cookies whose value varies a cached page: the homepage is rendered with or
+# without its lazily fetched sections
+PAGE_CACHE_VARY_COOKIES = (HOMEPAGE_LAZY_COOKIE,)
+
+# Maximum SQL queries per page for anonymous visitors, keyed by URL name.
+# Checked by main.querybudget (middleware in DEBUG, assert_query_budget in tests).
+# List and detail pages include the conditional GET validator queries
+# (main/conditional.py): one aggregate per list page and per dependency, one
+# lookup per detail page. The homepage sections count with a cold section
+# cache: they load in the request's thread while its queries are recorded.
+QUERY_BUDGETS = {
+    'home': 7,
+    'home_section': 1,
+    'about': 1,
+    'our_team': 2,
+    'contact': 0,
+    'donate2': 2,
+    'donate2_thank_you': 0,
+    'events': 5,
+    'event_detail': 4,
+    'stories': 6,
+    'story_detail': 4,
+    'blog': 5,
+    'blog_detail': 4,
+    'resources': 5,
+}
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=DEBUG, cast=bool)
+
+# Per-request profiling (see main/profiling.py): fraction of requests timed
+# into SQL/template/view with a Server-Timing header, kept in a per-process
+# buffer shown at /admin/profiling/. 0 turns the middleware off entirely.
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_BUFFER_SIZE = config('PROFILING_BUFFER_SIZE', default=500, cast=int)
+# Also run sampled requests under cProfile and keep reports for those slower than PROFILING_SLOW_MS
+PROFILING_CPROFILE = config('PROFILING_CPROFILE', default=False, cast=bool)
+PROFILING_SLOW_MS = config('PROFILING_SLOW_MS', default=500, cast=int)
+
+# Prometheus metrics at /metrics (see main/metrics.py). With several worker
+# processes set METRICS_DIR to a directory shared by them and emptied before
+# the server starts; without it each process only reports its own counters.
+METRICS_DIR = config('METRICS_DIR', default='') or None
+# Addresses let in without the token, only while DEBUG is on
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1 ::1').split()
+# Scrapers send "Authorization: Bearer <token>"; with DEBUG off /metrics is
+# closed until this is set
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Keyset pagination for the content list views (see main/pagination.py)
+CURSOR_PAGINATION = config('CURSOR_PAGINATION', default=False, cast=bool)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,10 +221,37 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# CSS/JS bundles, minified and saved under bundles/ by collectstatic (see
+# main/assets.py). Templates link them with {% bundle %}, which links the
+# source files one by one while ASSET_BUNDLING is off.
+ASSET_BUNDLING = config('ASSET_BUNDLING', default=not DEBUG, cast=bool)
+ASSET_BUNDLES = {
+    'site.css': ['css/main.css', 'css/responsive.css', 'css/navbar.css', 'css/footer.css'],
+    'site.js': ['js/main.js', 'js/animations.js'],
+    'listing.css': ['css/listing.css'],
+    'contact.css': ['css/contact.css'],
+    'donation.css': ['css/donation.css'],
+}
+# Rules of a bundle that apply above the fold of a page: the markup of these
+# templates up to their {# below the fold #} markers. Inlined by
+# {% bundle '<bundle>' critical='<page>' %}.
+CRITICAL_CSS = {
+    'index': {
+        'bundle': 'site.css',
+        'templates': ['base.html', 'partials/navbar.html', 'index.html'],
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hand resource downloads to the front-end server instead of streaming them
+# from Django: 'x-accel-redirect' (nginx, with FILE_OFFLOAD_PREFIX an internal
+# location aliased to MEDIA_ROOT) or 'x-sendfile' (Apache/lighttpd).
+FILE_OFFLOAD = config('FILE_OFFLOAD', default='') or None
+FILE_OFFLOAD_PREFIX = config('FILE_OFFLOAD_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -113,10 +259,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = 'GYWAN <noreply@gywan.org>'
+# Scheme and host for links in emails, e.g. https://gywan.org
+SITE_URL = config('SITE_URL', default='')
+
+# Outbox retries: backoff doubles from OUTBOX_BACKOFF_BASE seconds per attempt
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+OUTBOX_BACKOFF_BASE = config('OUTBOX_BACKOFF_BASE', default=60, cast=int)
 
 # Stripe Configuration
 STRIPE_PUBLIC_KEY = config('STRIPE_PUBLIC_KEY', default='pk_test_51234567890')
@@ -136,4 +289,18 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
 
 # Static files storage
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Images are recompressed and get WebP siblings during collectstatic, then
+# text files get .br/.zst/.gz siblings (brotli and zstd when the Brotli and
+# zstandard packages are installed). A codec's output is only kept when it is
+# at most STATIC_COMPRESS_MAX_RATIO of the original size. Unchanged files are
+# reused from the previous build via the STATIC_BUILD_CACHE file in STATIC_ROOT.
+STATIC_COMPRESS_MAX_RATIO = config('STATIC_COMPRESS_MAX_RATIO', default=0.95, cast=float)
+STATIC_BUILD_CACHE = 'staticfiles.build.json'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'main.storage.OptimizedStaticFilesStorage',
+    },
+}
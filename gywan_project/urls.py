@@ -9,7 +9,10 @@ from django.conf.urls.static import static
 
 from django.views.generic import TemplateView
 
+from main import profiling
+
 urlpatterns = [
+    path('admin/profiling/', admin.site.admin_view(profiling.admin_view), name='admin_profiling'),
     path('admin/', admin.site.urls),
     path('', include('main.urls')),
 ]
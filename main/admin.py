@@ -4,7 +4,14 @@ from .models import Testimonial, Announcement
 from .models import ImpactStat, MobileProvider, Bank
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Event, Story, BlogPost, Resource, Contact, Newsletter, ImpactStory, TeamMember, Comment, Supporter, Donation2, MobileProvider, Bank
+from django.utils import timezone
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Event, Story, BlogPost, Resource, Contact, Newsletter, ImpactStory, TeamMember, Comment, Supporter, Donation2, MobileProvider, Bank, OutboundEmail
+from .models import NewsletterCampaign, CampaignDelivery, DonationRollup
+from . import rollups
+from .exports import ExportMixin
+from .imports import ImportMixin
  
 
 @admin.register(Announcement)
@@ -54,7 +61,7 @@ class SupporterAdmin(admin.ModelAdmin):
 
 
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(ImportMixin, admin.ModelAdmin):
     list_display = ('title', 'date', 'location', 'featured', 'is_active')
     list_filter = ('featured', 'is_active', 'date', 'created_at')
     search_fields = ('title', 'description', 'location')
@@ -82,7 +89,7 @@ class EventAdmin(admin.ModelAdmin):
 
 
 @admin.register(Story)
-class StoryAdmin(admin.ModelAdmin):
+class StoryAdmin(ImportMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'location', 'featured', 'created_at')
     list_filter = ('featured', 'is_active', 'created_at')
     search_fields = ('title', 'content', 'author', 'location')
@@ -109,9 +116,10 @@ class StoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(BlogPost)
-class BlogPostAdmin(admin.ModelAdmin):
+class BlogPostAdmin(ImportMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'published', 'featured', 'created_at')
     list_filter = ('published', 'featured', 'author', 'created_at')
+    list_select_related = ('author',)
     search_fields = ('title', 'content', 'excerpt', 'tags')
     prepopulated_fields = {'slug': ('title',)}
     list_editable = ('published', 'featured')
@@ -150,7 +158,8 @@ class ResourceAdmin(admin.ModelAdmin):
 
 
 @admin.register(Donation2)
-class Donation2Admin(admin.ModelAdmin):
+class Donation2Admin(ExportMixin, admin.ModelAdmin):
+    change_list_template = 'admin/main/donation2/change_list.html'
     list_display = ('donor_name', 'donor_email', 'amount', 'payment_method', 'created_at')
     search_fields = ('donor_name', 'donor_email', 'mobile_number')
     list_filter = ('payment_method', 'frequency', 'is_anonymous', 'created_at')
@@ -172,10 +181,33 @@ class Donation2Admin(admin.ModelAdmin):
             )
         return self.readonly_fields
 
+    def get_urls(self):
+        urls = [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='main_donation2_dashboard'),
+        ]
+        return urls + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Donation totals read from the rollup tables only"""
+        period = request.GET.get('period')
+        if period not in (DonationRollup.PERIOD_DAY, DonationRollup.PERIOD_MONTH):
+            period = DonationRollup.PERIOD_MONTH
+        default_span = 30 if period == DonationRollup.PERIOD_DAY else 12
+        try:
+            span = min(max(int(request.GET.get('span', default_span)), 1), 366)
+        except ValueError:
+            span = default_span
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Donation dashboard',
+            data=rollups.dashboard(period, span),
+        )
+        return TemplateResponse(request, 'admin/main/donation2/dashboard.html', context)
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'subject', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
     search_fields = ('name', 'email', 'subject', 'message')
@@ -195,5 +227,40 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'text', 'created_at', 'content_type', 'object_id')
     search_fields = ('name', 'email', 'text')
     list_filter = ('content_type', 'created_at')
+    list_select_related = ('content_type',)
 
 admin.site.register(Comment, CommentAdmin)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to', 'last_error')
+    readonly_fields = ('attempts', 'last_error', 'locked_at', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_QUEUED, next_attempt_at=timezone.now(), locked_at=None, attempts=0
+        )
+        self.message_user(request, f'{updated} email(s) queued for retry.')
+
+
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'sent_count', 'failed_count', 'started_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject',)
+    # Progress is written by `manage.py send_campaign`
+    readonly_fields = ('status', 'last_subscriber_id', 'sent_count', 'failed_count', 'started_at', 'finished_at', 'created_at')
+
+
+@admin.register(CampaignDelivery)
+class CampaignDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'subscriber', 'status', 'updated_at')
+    list_filter = ('status', 'campaign')
+    search_fields = ('subscriber__email', 'error')
+    list_select_related = ('campaign', 'subscriber')
+    raw_id_fields = ('subscriber',)
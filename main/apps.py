@@ -8,4 +8,4 @@ class MainConfig(AppConfig):
     
     def ready(self):
         # Import any app-specific initialization code
-        pass
+        from . import signals  # noqa: F401
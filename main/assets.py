@@ -0,0 +1,299 @@
+"""
+CSS/JS bundles and critical CSS.
+
+``ASSET_BUNDLES`` maps a bundle name to the static files it concatenates,
+e.g. ``'site.css': ['css/main.css', 'css/responsive.css']``. During
+``collectstatic`` (see ``main.storage``) each bundle is minified and saved
+as ``bundles/<name>``, so the manifest storage content-hashes and
+precompresses it like any other file.
+
+``CRITICAL_CSS`` maps a page to the bundle and templates it's drawn from.
+The rules of the bundle that can match the templates' markup above
+``{# below the fold #}`` are saved as ``bundles/<page>.critical.css``, for
+the ``{% bundle %}`` tag to inline while the full bundle loads
+asynchronously.
+
+With ``ASSET_BUNDLING`` off (the default under DEBUG) the tag links the
+source files one by one instead.
+"""
+import posixpath
+import re
+
+from django.conf import settings
+from django.template.loader import get_template
+
+BUNDLES = getattr(settings, 'ASSET_BUNDLES', {})
+CRITICAL_CSS = getattr(settings, 'CRITICAL_CSS', {})
+ENABLED = getattr(settings, 'ASSET_BUNDLING', not settings.DEBUG)
+BUNDLE_DIR = 'bundles'
+FOLD_MARKER = '{# below the fold #}'
+
+
+def bundle_name(name):
+    return f'{BUNDLE_DIR}/{name}'
+
+
+def critical_name(page):
+    return f'{BUNDLE_DIR}/{page}.critical.css'
+
+
+_CSS_TOKEN_RE = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|/\*.*?\*/|([^"'/]+|/)''', re.S)
+_CSS_URL_RE = re.compile(r'''url\(\s*(["']?)([^"')]+)\1\s*\)''')
+
+
+def minify_css(text):
+    """Drop comments and the whitespace that doesn't change the meaning"""
+    parts = []
+    code = []
+
+    def flush():
+        chunk = re.sub(r'\s+', ' ', ''.join(code))
+        # Not around ':' (descendant pseudo-classes) or '+'/'-' (calc())
+        chunk = re.sub(r' ?([{};,>]) ?', r'\1', chunk).replace(': ', ':')
+        parts.append(chunk.replace(';}', '}'))
+        code.clear()
+
+    for match in _CSS_TOKEN_RE.finditer(text):
+        string, chunk = match.groups()
+        if string is not None:
+            flush()
+            parts.append(string)
+        else:
+            # A comment separates tokens like whitespace does
+            code.append(chunk if chunk is not None else ' ')
+    flush()
+    return ''.join(parts).strip()
+
+
+def rewrite_css_urls(text, source, target=None):
+    """Point relative ``url()``s of ``source`` at the same files from ``target``
+
+    Without a ``target`` they become absolute STATIC_URL paths, as CSS
+    inlined in a page needs.
+    """
+    source_dir = posixpath.dirname(source)
+
+    def rewrite(match):
+        quote, url = match.groups()
+        if re.match(r'^(/|#|[a-z][a-z0-9+.-]*:)', url, re.I):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(source_dir, url))
+        if target is None:
+            path = settings.STATIC_URL + path
+        else:
+            path = posixpath.relpath(path, posixpath.dirname(target) or '.')
+        return f'url({quote}{path}{quote})'
+
+    return _CSS_URL_RE.sub(rewrite, text)
+
+
+def minify_js(text):
+    """Drop comments, indentation and blank lines
+
+    Line breaks are kept so automatic semicolon insertion is unaffected;
+    strings, template literals and regular expression literals are copied
+    as they are.
+    """
+    out = []
+    code = []
+    position = 0
+    length = len(text)
+    # Whether a '/' here would start a regular expression rather than divide
+    regex_allowed = True
+
+    def flush():
+        if code:
+            out.append(''.join(code))
+            code.clear()
+
+    while position < length:
+        char = text[position]
+        pair = text[position:position + 2]
+        if pair == '//':
+            end = text.find('\n', position)
+            position = length if end == -1 else end
+        elif pair == '/*':
+            end = text.find('*/', position + 2)
+            position = length if end == -1 else end + 2
+            code.append(' ')
+        elif char in '\'"`' or (char == '/' and regex_allowed):
+            end = _literal_end(text, position)
+            flush()
+            out.append(text[position:end])
+            position = end
+            regex_allowed = False
+        else:
+            code.append(char)
+            if not char.isspace():
+                regex_allowed = char in '(,=:[!&|?{};+-*%<>~^' or _ends_with_keyword(code)
+            position += 1
+    flush()
+
+    lines = []
+    for line in ''.join(out).split('\n'):
+        line = line.strip()
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+_KEYWORD_RE = re.compile(r'(?:^|[^\w$])(?:return|typeof|case|do|else|in|of|new|delete|void|throw)$')
+
+
+def _ends_with_keyword(code):
+    return bool(_KEYWORD_RE.search(''.join(code[-8:])))
+
+
+def _literal_end(text, start):
+    """Index just past the string, template or regex literal at ``start``"""
+    quote = text[start]
+    position = start + 1
+    in_class = False
+    depth = 0
+    while position < len(text):
+        char = text[position]
+        if char == '\\':
+            position += 2
+            continue
+        if quote == '`':
+            if text.startswith('${', position):
+                depth += 1
+                position += 2
+                continue
+            if depth and char == '}':
+                depth -= 1
+            elif not depth and char == '`':
+                return position + 1
+        elif quote == '/':
+            if char == '[':
+                in_class = True
+            elif char == ']':
+                in_class = False
+            elif char == '/' and not in_class:
+                position += 1
+                while position < len(text) and (text[position].isalnum() or text[position] == '_'):
+                    position += 1
+                return position
+            elif char == '\n':
+                # Not a regex after all; treat the '/' as an operator
+                return start + 1
+        elif char == quote:
+            return position + 1
+        position += 1
+    return position
+
+
+def build(name, sources):
+    """The minified bundle ``name`` from ``[(source name, text)]``"""
+    if name.endswith('.css'):
+        return minify_css('\n'.join(
+            rewrite_css_urls(text, source, bundle_name(name)) for source, text in sources
+        ))
+    # A newline and semicolon between files so one can't run into the next
+    return '\n;\n'.join(minify_js(text) for _, text in sources)
+
+
+def above_the_fold(template_names):
+    """The template source of ``template_names`` up to their fold markers"""
+    return '\n'.join(
+        get_template(name).template.source.split(FOLD_MARKER)[0] for name in template_names
+    )
+
+
+def markup_tokens(markup):
+    """Tag names, classes and ids used in ``markup``, ignoring template tags"""
+    markup = re.sub(r'\{#.*?#\}|\{%.*?%\}|\{\{.*?\}\}', ' ', markup, flags=re.S)
+    tags = {tag.lower() for tag in re.findall(r'<([a-zA-Z][a-zA-Z0-9-]*)', markup)}
+    classes = set()
+    for value in re.findall(r'\bclass\s*=\s*["\']([^"\']*)["\']', markup):
+        classes.update(value.split())
+    ids = set(re.findall(r'\bid\s*=\s*["\']([^"\']+)["\']', markup))
+    return tags, classes, ids
+
+
+_COMPOUND_RE = re.compile(r'[^\s>+~]+')
+
+
+def _selector_matches(selector, tags, classes, ids):
+    # Pseudo-classes, pseudo-elements and attribute selectors can only be
+    # decided in a browser, so they're assumed to match
+    selector = re.sub(r'\[[^\]]*\]|::?[\w-]+(\([^)]*\))?', '', selector)
+    for compound in _COMPOUND_RE.findall(selector):
+        tag = re.match(r'^[a-zA-Z][\w-]*', compound)
+        if tag and tag.group(0).lower() not in tags:
+            return False
+        if any(name not in classes for name in re.findall(r'\.([\w-]+)', compound)):
+            return False
+        if any(name not in ids for name in re.findall(r'#([\w-]+)', compound)):
+            return False
+    return True
+
+
+def _blocks(css):
+    """Split minified CSS into ``(prelude, body)`` pairs, bodies unparsed"""
+    blocks = []
+    position = 0
+    while position < len(css):
+        start = css.find('{', position)
+        if start == -1:
+            break
+        prelude = css[position:start].strip()
+        if prelude.startswith('@') and ';' in prelude:
+            # Statements such as @import or @charset before the block
+            statement, prelude = prelude.rsplit(';', 1)
+            blocks.extend((item + ';', None) for item in statement.split(';') if item)
+        depth = 1
+        end = start + 1
+        while depth and end < len(css):
+            if css[end] == '{':
+                depth += 1
+            elif css[end] == '}':
+                depth -= 1
+            end += 1
+        blocks.append((prelude.strip(), css[start + 1:end - 1]))
+        position = end
+    return blocks
+
+
+def _critical_rules(css, tokens):
+    kept = []
+    for prelude, body in _blocks(css):
+        if body is None:
+            kept.append(prelude)
+        elif prelude.startswith(('@media', '@supports', '@layer')):
+            inner = ''.join(
+                rule if isinstance(rule, str) else f'{rule[0]}{{{rule[1]}}}'
+                for rule in _critical_rules(body, tokens)
+            )
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith(('@font-face', '@keyframes', '@-webkit-keyframes', '@page')):
+            kept.append((prelude, body))
+        elif not prelude.startswith('@'):
+            selectors = [s for s in prelude.split(',') if _selector_matches(s, *tokens)]
+            if selectors:
+                kept.append(f'{",".join(selectors)}{{{body}}}')
+    return kept
+
+
+def critical_css(css, markup, source=None):
+    """The rules of minified ``css`` that can apply to ``markup``
+
+    Keyframes are only kept when a kept rule names them. Relative URLs are
+    made absolute if the ``source`` the CSS was saved as is given.
+    """
+    if source is not None:
+        css = rewrite_css_urls(css, source)
+    tokens = markup_tokens(markup)
+    rules = _critical_rules(css, tokens)
+    used = ''.join(rule for rule in rules if isinstance(rule, str))
+    output = []
+    for rule in rules:
+        if isinstance(rule, tuple):
+            prelude, body = rule
+            name = prelude.split(' ', 1)[-1] if 'keyframes' in prelude else None
+            if name is not None and not re.search(rf'(?<![\w-]){re.escape(name)}(?![\w-])', used):
+                continue
+            rule = f'{prelude}{{{body}}}'
+        output.append(rule)
+    return ''.join(output)
@@ -0,0 +1,38 @@
+"""
+Admission control for ASGI workers.
+
+Under ASGI each request runs its ORM calls and template rendering in a sync
+thread of its own (asgiref's thread_sensitive mode), so a worker with many
+clients connected ends up rendering all of their pages at once: each holds
+its query results and template context in memory, and they share one GIL.
+``ActiveRequestLimitMiddleware`` lets ``ASGI_MAX_ACTIVE_REQUESTS`` requests
+at a time past it, much as a WSGI worker's thread count does; the rest wait
+on the event loop, which costs next to nothing. Responses are sent to the
+client after the middleware returns, so a slow client doesn't hold a slot.
+
+Under WSGI, or with a limit of 0, the middleware removes itself at startup.
+"""
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+MAX_ACTIVE_REQUESTS = getattr(settings, 'ASGI_MAX_ACTIVE_REQUESTS', 8)
+
+
+class ActiveRequestLimitMiddleware:
+    """Bound the requests an ASGI worker handles at once; put it before any middleware touching the database"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not MAX_ACTIVE_REQUESTS or not iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.semaphore = asyncio.Semaphore(MAX_ACTIVE_REQUESTS)
+        markcoroutinefunction(self)
+
+    async def __call__(self, request):
+        async with self.semaphore:
+            return await self.get_response(request)
@@ -0,0 +1,167 @@
+"""
+Conditional GET for the content pages.
+
+The mixins compute a cheap validator from the content's ``updated_at``
+before anything is rendered and answer ``304 Not Modified`` when the
+client's copy is current:
+
+* list pages: ``max(updated_at)`` and ``count`` over the filtered queryset
+  (the count catches rows deleted or filtered out), plus the same for any
+  ``conditional_dependencies`` shown alongside, such as recent comments;
+* detail pages: the object's ``updated_at`` and the count and newest
+  ``updated_at`` of its comments, fetched with one lookup on the unique
+  slug.
+
+The ETag is weak (each body carries a freshly masked CSRF token) and also
+covers the query string and the visitor's CSRF secret, so a page kept by
+the browser always has form tokens matching its current cookie.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Comment
+
+# Change to invalidate every validator, e.g. after a template change
+VERSION = getattr(settings, 'CONDITIONAL_GET_VERSION', '1')
+
+
+def make_etag(request, *parts):
+    # The CSRF secret from the visitor's cookie, or the one about to be set
+    source = '|'.join(str(part) for part in (
+        VERSION, request.get_full_path(), request.META.get('CSRF_COOKIE', ''), *parts
+    ))
+    return 'W/"%s"' % hashlib.sha1(source.encode()).hexdigest()
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt_timezone.utc)
+        return int(value.timestamp())
+    return None
+
+
+def set_validators(request, response, parts, last_modified):
+    """Add the ETag/Last-Modified for ``parts`` to a rendered response"""
+    response['ETag'] = make_etag(request, *parts)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Make browsers revalidate instead of guessing a freshness lifetime
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+class ConditionalGetMixin:
+    """Answer GET/HEAD with 304 when ``conditional_state`` hasn't changed
+
+    ``conditional_state`` returns ``(parts, last_modified)`` or None to skip
+    the check; ``parts`` go into the ETag.
+    """
+
+    def conditional_state(self):
+        raise NotImplementedError
+
+    def _state(self, request):
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return None
+        return self.conditional_state()
+
+    def _not_modified(self, request, state):
+        """The 304 for ``state``, or None after noting its validators on ``request``"""
+        parts, last_modified = state
+        last_modified = _timestamp(last_modified)
+        headers = HttpResponse()
+        set_validators(request, headers, parts, last_modified)
+        conditional = get_conditional_response(
+            request, etag=headers['ETag'], last_modified=last_modified, response=headers
+        )
+        if conditional is not headers:
+            return conditional
+        # Kept with the page by the full-page cache (main/pagecache.py)
+        request.conditional_validators = (parts, last_modified)
+        return None
+
+    def _add_validators(self, request, response):
+        if response.status_code == 200:
+            parts, last_modified = request.conditional_validators
+
+            def add_validators(rendered):
+                # Rendering may have created the visitor's CSRF secret
+                get_token(request)
+                set_validators(request, rendered, parts, last_modified)
+
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(add_validators)
+            else:
+                add_validators(response)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        state = self._state(request)
+        if state is None:
+            return super().get(request, *args, **kwargs)
+        not_modified = self._not_modified(request, state)
+        if not_modified is not None:
+            return not_modified
+        return self._add_validators(request, super().get(request, *args, **kwargs))
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    """Validator from max(updated_at) and count of the filtered queryset"""
+    # Extra (model or queryset, timestamp field) pairs shown on the page
+    conditional_dependencies = ()
+    conditional_field = 'updated_at'
+
+    def conditional_state(self):
+        if self.request.GET.get('q'):
+            # Ranked search results aren't worth validating
+            return None
+        sources = [(self.get_queryset(), self.conditional_field)] + list(self.conditional_dependencies)
+        parts, newest = [], None
+        for source, field in sources:
+            queryset = source if hasattr(source, 'query') else source._default_manager.all()
+            result = queryset.order_by().aggregate(last=Max(field), count=Count('pk'))
+            parts.extend([result['last'], result['count']])
+            if result['last'] is not None and (newest is None or result['last'] > newest):
+                newest = result['last']
+        return parts, newest
+
+
+class ConditionalDetailMixin(ConditionalGetMixin):
+    """Validator from the object's updated_at and its comments, in one query"""
+    conditional_field = 'updated_at'
+
+    def conditional_state(self):
+        queryset = self.get_queryset()
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        if slug is None:
+            return None
+        content_type = ContentType.objects.get_for_model(queryset.model)
+        comments = Comment.objects.filter(content_type=content_type, object_id=OuterRef('pk')).order_by()
+        comments = comments.values('object_id')
+        row = (
+            queryset.filter(**{self.get_slug_field(): slug})
+            .annotate(
+                comment_count=Subquery(comments.annotate(n=Count('pk')).values('n')),
+                # updated_at, so a comment edited in the admin changes it too
+                last_comment=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+            )
+            .values_list(self.conditional_field, 'comment_count', 'last_comment')
+            .first()
+        )
+        if row is None:
+            # Let the view raise its 404
+            return None
+        updated_at, comment_count, last_comment = row
+        newest = max(value for value in (updated_at, last_comment) if value is not None)
+        return [updated_at, comment_count or 0, last_comment], newest
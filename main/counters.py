@@ -0,0 +1,142 @@
+"""
+Buffered counters for hot-path increments.
+
+Clicks are added up in memory per worker process and written in batches with
+a single ``UPDATE ... SET field = field + n`` per distinct increment, so the
+request path never takes the SQLite write lock and concurrent increments are
+never lost. Buffers are flushed when they reach ``flush_threshold`` pending
+increments, every ``flush_interval`` seconds from a background thread, and
+at interpreter exit. ``update()`` sends no signals, so each flush purges the
+page cache and homepage sections itself.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import homepage, pagecache
+from .models import Resource
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedCounter:
+    """Accumulate increments of ``model.field`` and flush them with F()"""
+
+    def __init__(self, model, field, flush_interval=5.0, flush_threshold=100):
+        self.model = model
+        self.field = field
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, pk, amount=1):
+        with self._lock:
+            self._pending[pk] += amount
+            self._pending_total += amount
+            should_flush = self._pending_total >= self.flush_threshold
+        self._ensure_thread()
+        if should_flush:
+            self.flush()
+
+    def pending(self, pk):
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def flush(self):
+        """Write pending increments; returns the number of increments written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._pending_total = 0
+            if not pending:
+                return 0
+            # Rows sharing the same increment are updated in one statement
+            by_amount = defaultdict(list)
+            for pk, amount in pending.items():
+                by_amount[amount].append(pk)
+            try:
+                with transaction.atomic():
+                    for amount, pks in by_amount.items():
+                        self.model.objects.filter(pk__in=pks).update(
+                            **{self.field: F(self.field) + amount}
+                        )
+            except Exception:
+                # Put the increments back so the next flush retries them
+                with self._lock:
+                    self._pending.update(pending)
+                    self._pending_total += sum(pending.values())
+                logger.exception('Flushing %s.%s failed', self.model.__name__, self.field)
+                return 0
+            self._purge(pending)
+            return sum(pending.values())
+
+    def _purge(self, pks):
+        """Do what the post_save signals would have for the updated rows"""
+        label = pagecache.surrogate_key(self.model)
+        try:
+            homepage.invalidate_model(self.model)
+            pagecache.purge(self.model, *(f'{label}:{pk}' for pk in pks))
+        except Exception:
+            # The counts are stored; a stale page only lasts until it expires
+            logger.exception('Purging pages after flushing %s.%s failed', self.model.__name__, self.field)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f'{self.model.__name__}-{self.field}-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            # The flusher thread has its own connection; don't keep it open
+            connections.close_all()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+_counters = []
+
+
+def register(counter):
+    _counters.append(counter)
+    return counter
+
+
+def flush_all():
+    return sum(counter.flush() for counter in _counters)
+
+
+@atexit.register
+def _flush_on_exit():
+    for counter in _counters:
+        try:
+            counter.shutdown()
+        except Exception:
+            logger.exception('Could not flush %s.%s at exit', counter.model.__name__, counter.field)
+
+
+download_counter = register(BufferedCounter(
+    Resource,
+    'download_count',
+    flush_interval=getattr(settings, 'DOWNLOAD_COUNTER_FLUSH_INTERVAL', 5.0),
+    flush_threshold=getattr(settings, 'DOWNLOAD_COUNTER_FLUSH_THRESHOLD', 100),
+))
@@ -0,0 +1,242 @@
+"""
+Streaming CSV/NDJSON exports of donations and contact messages.
+
+Rows are read with ``.iterator()`` and encoded in batches into a generator
+that feeds a ``StreamingHttpResponse`` (or a file, for the management
+command), optionally gzipped on the fly, so memory use doesn't grow with
+the number of rows exported. ``ExportMixin`` adds the admin actions and an
+"export everything matching the current filters" view to a ModelAdmin.
+"""
+import csv
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.urls import path
+from django.utils import timezone
+
+from .models import Contact, Donation2
+
+CHUNK_SIZE = 2000
+# Encoded output is flushed to the client in blocks of about this size
+BUFFER_SIZE = 64 * 1024
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+# Cells starting with these are run as formulas by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Export:
+    """The columns exported for a model
+
+    ``columns`` are ``(header, attribute path)`` pairs; paths may follow
+    foreign keys with ``__``, which should be listed in ``select_related``.
+    """
+
+    def __init__(self, name, model, columns, select_related=()):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.select_related = select_related
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def queryset(self, queryset=None):
+        if queryset is None:
+            queryset = self.model.objects.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return queryset
+
+    def values(self, obj):
+        row = []
+        for _, lookup in self.columns:
+            value = obj
+            for attribute in lookup.split('__'):
+                value = getattr(value, attribute, None)
+                if value is None:
+                    break
+            if isinstance(value, datetime):
+                value = timezone.localtime(value) if timezone.is_aware(value) else value
+            row.append(value)
+        return row
+
+    def rows(self, queryset=None, chunk_size=CHUNK_SIZE):
+        for obj in self.queryset(queryset).iterator(chunk_size=chunk_size):
+            yield self.values(obj)
+
+
+EXPORTS = {
+    Donation2: Export('donations', Donation2, [
+        ('id', 'pk'),
+        ('created_at', 'created_at'),
+        ('amount', 'amount'),
+        ('donor_name', 'donor_name'),
+        ('donor_email', 'donor_email'),
+        ('payment_method', 'payment_method'),
+        ('mobile_provider', 'mobile_provider__name'),
+        ('mobile_number', 'mobile_number'),
+        ('bank', 'bank_name__name'),
+        ('frequency', 'frequency'),
+        ('is_anonymous', 'is_anonymous'),
+        ('message', 'message'),
+    ], select_related=('mobile_provider', 'bank_name')),
+    Contact: Export('contacts', Contact, [
+        ('id', 'pk'),
+        ('created_at', 'created_at'),
+        ('name', 'name'),
+        ('email', 'email'),
+        ('subject', 'subject'),
+        ('message', 'message'),
+        ('is_read', 'is_read'),
+    ]),
+}
+EXPORTS_BY_NAME = {export.name: export for export in EXPORTS.values()}
+
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back what was written"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _buffered(pieces):
+    """Join small strings into blocks of about BUFFER_SIZE bytes"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def csv_chunks(export, queryset=None):
+    writer = csv.writer(_LineBuffer())
+
+    def lines():
+        # Excel needs the BOM to read the file as UTF-8
+        yield '\ufeff' + writer.writerow(export.headers)
+        for row in export.rows(queryset):
+            yield writer.writerow([_csv_cell(value) for value in row])
+
+    return _buffered(lines())
+
+
+def ndjson_chunks(export, queryset=None):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    headers = export.headers
+
+    def lines():
+        for row in export.rows(queryset):
+            record = {
+                header: str(value) if isinstance(value, Decimal) else value
+                for header, value in zip(headers, row)
+            }
+            yield encoder.encode(record) + '\n'
+
+    return _buffered(lines())
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(export, queryset=None, fmt='csv', compress=False):
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format {fmt!r}')
+    chunks = csv_chunks(export, queryset) if fmt == 'csv' else ndjson_chunks(export, queryset)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def filename(export, fmt, compress=False):
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+    name = f'{export.name}-{stamp}.{FORMATS[fmt][1]}'
+    return name + '.gz' if compress else name
+
+
+def streaming_response(export, queryset=None, fmt='csv', compress=False):
+    content_type = 'application/gzip' if compress else FORMATS[fmt][0]
+    response = StreamingHttpResponse(export_chunks(export, queryset, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename(export, fmt, compress)}"'
+    # Stop GZipMiddleware or a proxy from buffering/recompressing the stream
+    response['Cache-Control'] = 'no-store, no-transform'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class ExportMixin:
+    """ModelAdmin mixin: export actions plus an export of the filtered changelist
+
+    The changelist gets export links carrying its current query string, so
+    exports honour the active filters and search without selecting rows.
+    """
+    change_list_template = 'admin/export_change_list.html'
+    export_actions = ['export_csv', 'export_csv_gzip', 'export_ndjson']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if self.has_view_permission(request):
+            for name in self.export_actions:
+                actions[name] = self.get_action(name)
+        return actions
+
+    def _export(self, queryset, fmt, compress=False):
+        return streaming_response(EXPORTS[self.model], queryset, fmt, compress)
+
+    @admin.action(description='Export selected as CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Export selected as CSV (gzip)')
+    def export_csv_gzip(self, request, queryset):
+        return self._export(queryset, 'csv', compress=True)
+
+    @admin.action(description='Export selected as NDJSON')
+    def export_ndjson(self, request, queryset):
+        return self._export(queryset, 'ndjson')
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [path('export/', self.admin_site.admin_view(self.export_view), name='%s_%s_export' % info)]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """Export every row matching the changelist filters in the query string"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        params = request.GET.copy()
+        fmt = params.pop('format', ['csv'])[-1]
+        compress = params.pop('gzip', [''])[-1] == '1'
+        if fmt not in FORMATS:
+            fmt = 'csv'
+        # The changelist rejects parameters it doesn't know as lookups
+        request.GET = params
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+        return self._export(queryset, fmt, compress)
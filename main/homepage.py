@@ -0,0 +1,387 @@
+"""
+Homepage sections.
+
+Each section of the homepage is declared once here with the query that loads
+it, the demo content shown when that query comes back empty, and the models
+it depends on. Sections are cached independently so that saving a Story only
+invalidates the stories section, once its transaction commits (see
+main/signals.py).
+
+Sections missing from the cache load concurrently, on a small thread pool
+(``get_sections``) or with asyncio under ASGI (``aget_sections``), so a cold
+homepage waits for its slowest section rather than for all of them in turn.
+A section that takes longer than its timeout or fails shows its fallback
+content instead; one that finishes late still fills the cache for the next
+request. Sections load one by one in the request's thread instead when a
+``QueryRecorder`` is counting its queries (query budgets, index_advisor) or
+inside a transaction, whose uncommitted rows other connections can't see.
+
+Below the fold, the page is split into fragments (``FRAGMENTS``), each a
+template under templates/partials/home/ and the sections it shows. Browsers
+that have run the homepage's script once send ``LAZY_COOKIE``; their page
+has placeholders, fetched from the ``home_section`` view as they scroll into
+view, and loads only the sections above the fold. First visits, crawlers
+and clients without JavaScript get every fragment rendered in the page.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.utils import timezone
+
+from . import metrics, querybudget
+from .models import Event, Story, BlogPost, Resource, ImpactStat, Announcement, Testimonial
+
+
+CACHE_PREFIX = 'homepage:section:'
+
+# Upcoming events drop off the page as time passes without any save, so the
+# cache entries still expire on their own.
+CACHE_TIMEOUT = getattr(settings, 'HOMEPAGE_CACHE_TIMEOUT', 60 * 15)
+# Seconds the page waits for a section before showing its fallback
+SECTION_TIMEOUT = getattr(settings, 'HOMEPAGE_SECTION_TIMEOUT', 2.0)
+# Threads per process loading sections under WSGI; 0 loads them one by one
+# in the request's thread, without timeouts
+SECTION_WORKERS = getattr(settings, 'HOMEPAGE_SECTION_WORKERS', 4)
+LAZY_SECTIONS = getattr(settings, 'HOMEPAGE_LAZY_SECTIONS', True)
+LAZY_COOKIE = getattr(settings, 'HOMEPAGE_LAZY_COOKIE', 'js')
+
+logger = logging.getLogger(__name__)
+
+
+class Section:
+    """A cacheable block of homepage content"""
+
+    def __init__(self, name, loader, models, fallback=None, timeout=None):
+        self.name = name
+        self.loader = loader
+        self.models = tuple(models)
+        self.fallback = fallback or []
+        self.timeout = SECTION_TIMEOUT if timeout is None else timeout
+
+    @property
+    def cache_key(self):
+        return CACHE_PREFIX + self.name
+
+    def load(self):
+        items = list(self.loader())
+        return items or list(self.fallback)
+
+
+def _upcoming_events():
+    return Event.objects.filter(
+        date__gte=timezone.now(),
+        is_active=True
+    ).order_by('date')[:6]
+
+
+def _recent_stories():
+    return Story.objects.filter(is_active=True).order_by('-created_at')[:6]
+
+
+def _recent_resources():
+    return Resource.objects.filter(is_active=True).order_by('-created_at')[:6]
+
+
+def _blog_posts():
+    return BlogPost.objects.filter(
+        published=True,
+        is_active=True
+    ).order_by('-created_at')[:5]
+
+
+def _impact_stats():
+    return ImpactStat.objects.filter(is_active=True)
+
+
+def _announcements():
+    return Announcement.objects.filter(is_active=True).order_by('-created_at')[:5]
+
+
+def _testimonials():
+    return Testimonial.objects.all()
+
+
+SECTIONS = [
+    Section('upcoming_events', _upcoming_events, [Event], fallback=[
+        {'title': 'STEM Bootcamp for Girls', 'date': '2025-09-10', 'description': 'A week-long immersive bootcamp introducing girls to coding, robotics, and digital skills.', 'location': 'Freetown, Sierra Leone', 'get_absolute_url': '#'},
+        {'title': 'Young Women Leadership Summit', 'date': '2025-10-05', 'description': 'Empowering young women with leadership, advocacy, and public speaking skills.', 'location': 'Accra, Ghana', 'get_absolute_url': '#'},
+        {'title': 'Health & Hygiene Workshop', 'date': '2025-08-20', 'description': 'Interactive sessions on health, hygiene, and self-care for adolescent girls.', 'location': 'Monrovia, Liberia', 'get_absolute_url': '#'}
+    ]),
+    Section('recent_stories', _recent_stories, [Story], fallback=[
+        {'author': 'Fatmata Kamara', 'title': 'From Shy to STEM Star', 'content': 'Fatmata joined our bootcamp with little confidence. Today, she leads her school’s robotics club and mentors other girls.', 'location': 'Freetown', 'get_absolute_url': '#'},
+        {'author': 'Aisha Conteh', 'title': 'Speaking Up for Change', 'content': 'Aisha’s journey from a quiet student to a passionate advocate for girls’ education inspires her whole community.', 'location': 'Bo', 'get_absolute_url': '#'},
+        {'author': 'Mariama Sesay', 'title': 'Building Healthy Habits', 'content': 'Mariama learned about health and hygiene at our workshop and now leads peer sessions at her school.', 'location': 'Kenema', 'get_absolute_url': '#'}
+    ]),
+    Section('recent_resources', _recent_resources, [Resource], fallback=[
+        {'get_category_display': 'Toolkit', 'title': 'Girls in STEM Activity Book', 'description': 'Fun activities and challenges to spark curiosity in science and tech.', 'download_count': 120, 'file': {'url': '#'}},
+        {'get_category_display': 'Guide', 'title': 'Leadership Skills for Young Women', 'description': 'A practical guide to building confidence and leadership.', 'download_count': 95, 'file': {'url': '#'}},
+        {'get_category_display': 'Report', 'title': '2025 Impact Report', 'description': 'See the results and stories from our programs this year.', 'download_count': 60, 'file': {'url': '#'}}
+    ]),
+    Section('blog_posts', _blog_posts, [BlogPost], fallback=[
+        {'category': 'Empowerment', 'title': 'Why Girls in STEM Matter', 'summary': 'Exploring the impact of STEM education for girls in Africa.', 'content': '', 'date': '2025-07-15', 'get_absolute_url': '#'},
+        {'category': 'Leadership', 'title': 'Raising the Next Generation of Leaders', 'summary': 'How our programs nurture leadership in young women.', 'content': '', 'date': '2025-06-30', 'get_absolute_url': '#'},
+        {'category': 'Health', 'title': 'Breaking Taboos: Girls’ Health Education', 'summary': 'Addressing myths and empowering girls with knowledge.', 'content': '', 'date': '2025-06-10', 'get_absolute_url': '#'},
+        {'category': 'Events', 'title': 'Highlights from the 2025 Summit', 'summary': 'A recap of our biggest event of the year.', 'content': '', 'date': '2025-05-25', 'get_absolute_url': '#'},
+        {'category': 'Community', 'title': 'Volunteers Making a Difference', 'summary': 'Stories from our dedicated volunteers.', 'content': '', 'date': '2025-05-01', 'get_absolute_url': '#'}
+    ]),
+    Section('impact_stats', _impact_stats, [ImpactStat], fallback=[
+        {'value': '10K+', 'label': 'Girls Empowered', 'description': 'Directly impacted through our programs.'},
+        {'value': '120+', 'label': 'Programs Delivered', 'description': 'Across 3 West African countries.'},
+        {'value': '50+', 'label': 'Communities Reached', 'description': 'Urban, rural, and remote areas.'}
+    ]),
+    Section('announcements', _announcements, [Announcement]),
+    Section('testimonials', _testimonials, [Testimonial]),
+]
+
+SECTIONS_BY_NAME = {section.name: section for section in SECTIONS}
+
+
+class Fragment:
+    """A below-the-fold block of the homepage that can be fetched on its own"""
+
+    def __init__(self, name, sections=()):
+        self.name = name
+        self.template = f'partials/home/{name}.html'
+        self.sections = tuple(sections)
+
+
+# In page order
+FRAGMENTS = [
+    Fragment('testimonials', ['testimonials']),
+    Fragment('events', ['upcoming_events']),
+    Fragment('stories', ['recent_stories']),
+    Fragment('blog', ['blog_posts']),
+    Fragment('resources', ['recent_resources']),
+    Fragment('mission'),
+]
+
+FRAGMENTS_BY_NAME = {fragment.name: fragment for fragment in FRAGMENTS}
+
+
+def is_lazy(request):
+    """Whether the homepage should leave its fragments to the browser"""
+    return LAZY_SECTIONS and request.COOKIES.get(LAZY_COOKIE) == '1'
+
+
+def page_sections(lazy):
+    """Names of the sections the page itself shows"""
+    if not lazy:
+        return [section.name for section in SECTIONS]
+    fetched = {name for fragment in FRAGMENTS for name in fragment.sections}
+    return [section.name for section in SECTIONS if section.name not in fetched]
+
+
+# Per-process hit/miss counters, keyed by (section name, 'hit' | 'miss')
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(name, outcome):
+    with _stats_lock:
+        _stats[(name, outcome)] += 1
+    metrics.cache_lookup('homepage', outcome == 'hit')
+
+
+def section_stats():
+    """Return {section: {'hits': n, 'misses': n}} for this process"""
+    with _stats_lock:
+        return {
+            section.name: {
+                'hits': _stats[(section.name, 'hit')],
+                'misses': _stats[(section.name, 'miss')],
+            }
+            for section in SECTIONS
+        }
+
+
+def reset_section_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_section(name):
+    """Return the cached content of a section, loading it on a miss"""
+    section = SECTIONS_BY_NAME[name]
+    items = cache.get(section.cache_key)
+    if items is not None:
+        _record(name, 'hit')
+        return items
+    _record(name, 'miss')
+    items = section.load()
+    cache.set(section.cache_key, items, CACHE_TIMEOUT)
+    return items
+
+
+def _load_into_cache(section):
+    """Load and cache ``section``; returns ``(items, seconds)``
+
+    Runs on a worker thread, which isn't part of a request cycle, so it
+    closes its connections as a request would.
+    """
+    started = time.perf_counter()
+    try:
+        items = section.load()
+        cache.set(section.cache_key, items, CACHE_TIMEOUT)
+        return items, time.perf_counter() - started
+    finally:
+        close_old_connections()
+
+
+def _loaded(section, outcome, seconds, items, timings):
+    metrics.observe('gywan_homepage_section_seconds', seconds, section=section.name, outcome=outcome)
+    if timings is not None:
+        timings[section.name] = (outcome, seconds)
+    if outcome == 'loaded':
+        return items
+    return list(section.fallback)
+
+
+def _selected(names):
+    if names is None:
+        return SECTIONS
+    return [SECTIONS_BY_NAME[name] for name in names]
+
+
+def _cached_sections(sections, cached):
+    """``(context, missing sections)`` from a ``get_many`` of the section keys"""
+    context = {}
+    missing = []
+    for section in sections:
+        items = cached.get(section.cache_key)
+        if items is None:
+            _record(section.name, 'miss')
+            missing.append(section)
+        else:
+            _record(section.name, 'hit')
+            context[section.name] = items
+    return context, missing
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(SECTION_WORKERS, thread_name_prefix='homepage')
+        return _executor
+
+
+def _must_load_inline():
+    """Whether sections must load on this thread's connections"""
+    return not SECTION_WORKERS or querybudget.is_recording() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def get_sections(timings=None, names=None):
+    """Return a context dict with the homepage sections ``names`` (default: all)
+
+    ``timings``, if given, gets ``{section: (outcome, seconds)}`` for the
+    sections that weren't cached, the outcome being 'loaded', 'timeout' or
+    'error'.
+    """
+    sections = _selected(names)
+    context, missing = _cached_sections(sections, cache.get_many([section.cache_key for section in sections]))
+    if missing and _must_load_inline():
+        for section in missing:
+            context[section.name] = _load_section_inline(section, timings)
+        return context
+
+    started = time.perf_counter()
+    futures = [(section, _get_executor().submit(_load_into_cache, section)) for section in missing]
+    for section, future in futures:
+        items, seconds, outcome = None, None, 'loaded'
+        try:
+            items, seconds = future.result(timeout=max(section.timeout - (time.perf_counter() - started), 0))
+        except TimeoutError:
+            # Not started yet: don't make the pool run it for nobody
+            future.cancel()
+            outcome = 'timeout'
+        except Exception:
+            logger.exception('Loading the homepage section %s failed', section.name)
+            outcome = 'error'
+        if seconds is None:
+            seconds = time.perf_counter() - started
+        context[section.name] = _loaded(section, outcome, seconds, items, timings)
+    return context
+
+
+def _load_section_inline(section, timings):
+    """Load ``section`` in the request's thread, with no timeout"""
+    started = time.perf_counter()
+    try:
+        items = section.load()
+    except Exception:
+        logger.exception('Loading the homepage section %s failed', section.name)
+        return _loaded(section, 'error', time.perf_counter() - started, None, timings)
+    cache.set(section.cache_key, items, CACHE_TIMEOUT)
+    return _loaded(section, 'loaded', time.perf_counter() - started, items, timings)
+
+
+async def aget_sections(timings=None, names=None):
+    """``get_sections`` for async views: the missing sections load with asyncio.gather"""
+    sections = _selected(names)
+    context, missing = _cached_sections(sections, await cache.aget_many([section.cache_key for section in sections]))
+    # The request's sync thread, where its ORM calls and recorders are
+    if missing and await sync_to_async(_must_load_inline)():
+        for section in missing:
+            context[section.name] = await sync_to_async(_load_section_inline)(section, timings)
+        return context
+
+    async def load(section):
+        started = time.perf_counter()
+        items, seconds, outcome = None, None, 'loaded'
+        try:
+            # thread_sensitive=False: on the event loop's thread pool, in parallel
+            items, seconds = await asyncio.wait_for(
+                sync_to_async(_load_into_cache, thread_sensitive=False)(section), section.timeout
+            )
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+        except Exception:
+            logger.exception('Loading the homepage section %s failed', section.name)
+            outcome = 'error'
+        if seconds is None:
+            seconds = time.perf_counter() - started
+        context[section.name] = _loaded(section, outcome, seconds, items, timings)
+
+    await asyncio.gather(*(load(section) for section in missing))
+    return context
+
+
+def server_timing(timings):
+    """Server-Timing entries for the sections a request loaded"""
+    return ', '.join(
+        f'section-{name};dur={seconds * 1000:.1f};desc="{outcome}"'
+        for name, (outcome, seconds) in timings.items()
+    )
+
+
+def sections_for_model(model):
+    return [section for section in SECTIONS if model in section.models]
+
+
+def section_models(names=None):
+    """Every model shown by the sections ``names`` (default: all)"""
+    return {model for section in _selected(names) for model in section.models}
+
+
+def invalidate_model(model):
+    """Drop the cached sections that depend on ``model``"""
+    sections = sections_for_model(model)
+    if sections:
+        cache.delete_many([section.cache_key for section in sections])
+    return sections
+
+
+def invalidate_all():
+    cache.delete_many([section.cache_key for section in SECTIONS])
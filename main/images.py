@@ -0,0 +1,195 @@
+"""
+Responsive image variants.
+
+Uploaded images are resized to a fixed set of widths and stored as WebP plus
+a JPEG/PNG fallback under ``MEDIA_ROOT/variants/``. Variant file names are
+derived from a hash of the original's bytes, so replacing an upload produces
+new URLs and old variants are never served stale. Variants are built ahead
+of time in a process pool (``manage.py build_image_variants``). One still
+missing when it's requested (``image_variant`` view) is built on a small
+thread pool that exists from startup; when that takes longer than
+``IMAGE_VARIANT_TIMEOUT`` or too many builds are waiting, the view serves
+the original image and the variant is finished in the background.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+# Width buckets, in CSS pixels of the rendered image
+WIDTHS = tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 960, 1280, 1920)))
+QUALITY = {'webp': 78, 'jpeg': 80}
+VARIANT_DIR = 'variants'
+FORMATS = ('webp', 'jpeg', 'png')
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+
+# (path, size, mtime) -> (digest, width, height), so hashing and header
+# reads happen once per upload and process
+_info_cache = {}
+_info_lock = threading.Lock()
+
+# Builds for requests: threads per process (Pillow releases the GIL while
+# resizing and encoding), at most four builds waiting per thread, and the
+# seconds a request waits for one
+REQUEST_WORKERS = getattr(settings, 'IMAGE_VARIANT_REQUEST_WORKERS', 2)
+REQUEST_TIMEOUT = getattr(settings, 'IMAGE_VARIANT_TIMEOUT', 5)
+_request_pool = ThreadPoolExecutor(max_workers=REQUEST_WORKERS, thread_name_prefix='image-variant')
+_request_slots = threading.BoundedSemaphore(REQUEST_WORKERS * 4)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool for ``build_image_variants``"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'IMAGE_VARIANT_WORKERS', None) or os.cpu_count()
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+
+def fallback_format(name):
+    """PNGs keep PNG so transparency survives; everything else becomes JPEG"""
+    return 'png' if name.lower().endswith('.png') else 'jpeg'
+
+
+def source_info(path):
+    """Return (digest, width, height) for the image at ``path``"""
+    from PIL import Image
+
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _info_lock:
+        info = _info_cache.get(key)
+    if info is not None:
+        return info
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), b''):
+            digest.update(chunk)
+    with Image.open(path) as image:
+        width, height = image.size
+    info = (digest.hexdigest()[:20], width, height)
+    with _info_lock:
+        _info_cache[key] = info
+    return info
+
+
+def variant_name(digest, width, fmt):
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}-{width}.{EXTENSIONS[fmt]}'
+
+
+def variant_path(name):
+    """Absolute path of the variant ``name``, which must be inside the variants directory"""
+    root = os.path.realpath(os.path.join(settings.MEDIA_ROOT, VARIANT_DIR))
+    path = os.path.realpath(os.path.join(settings.MEDIA_ROOT, name))
+    if not path.startswith(root + os.sep):
+        raise ValueError(f'{name} is outside {VARIANT_DIR}/')
+    return path
+
+
+def variant_widths(source_width):
+    """Bucket widths below the original's width, plus the original width"""
+    widths = [width for width in WIDTHS if width < source_width]
+    if source_width <= WIDTHS[-1]:
+        widths.append(source_width)
+    return widths or [source_width]
+
+
+def build_variant(source_path, dest_path, width, fmt):
+    """Resize ``source_path`` to ``width`` and save it as ``fmt``
+
+    Runs in a worker process. Writes to a temporary file first so a
+    half-written variant is never served.
+    """
+    from PIL import Image, ImageOps
+
+    if os.path.exists(dest_path):
+        return dest_path
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        options = {'optimize': True}
+        if fmt in QUALITY:
+            options['quality'] = QUALITY[fmt]
+        if fmt == 'jpeg':
+            options['progressive'] = True
+        if fmt == 'webp':
+            options['method'] = 6
+        # Saving without exif/icc drops camera metadata from the variant
+        tmp_path = f'{dest_path}.{os.getpid()}.tmp'
+        image.save(tmp_path, format=fmt.upper(), **options)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def ensure_variant(source_path, digest, width, fmt, timeout=None):
+    """Build a variant for a request if it isn't on disk yet
+
+    Returns its name, or None when it isn't ready within ``timeout`` seconds
+    (``IMAGE_VARIANT_TIMEOUT`` by default) or too many builds are waiting.
+    """
+    name = variant_name(digest, width, fmt)
+    dest_path = variant_path(name)
+    if os.path.exists(dest_path):
+        return name
+    if not _request_slots.acquire(blocking=False):
+        return None
+    try:
+        future = _request_pool.submit(build_variant, source_path, dest_path, width, fmt)
+    except BaseException:
+        _request_slots.release()
+        raise
+    future.add_done_callback(lambda future: _request_slots.release())
+    try:
+        future.result(REQUEST_TIMEOUT if timeout is None else timeout)
+    except TimeoutError:
+        # Still finished in the background, for the next request
+        return None
+    return name
+
+
+def variants_for(field_file):
+    """Describe the variants of an image field
+
+    Returns ``{'width', 'height', 'sources': {fmt: [(url, width), ...]}}`` or
+    None when the file is missing or unreadable. URLs point straight at
+    MEDIA_URL when the variant exists, otherwise at the ``image_variant``
+    view, which builds it on first request.
+    """
+    from django.urls import reverse
+
+    if not field_file:
+        return None
+    try:
+        path = field_file.path
+        digest, width, height = source_info(path)
+    except (OSError, ValueError, NotImplementedError):
+        return None
+
+    sources = {}
+    for fmt in ('webp', fallback_format(field_file.name)):
+        entries = []
+        for bucket in variant_widths(width):
+            name = variant_name(digest, bucket, fmt)
+            if os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+                url = settings.MEDIA_URL + name
+            else:
+                url = reverse('image_variant', kwargs={
+                    'width': bucket, 'fmt': EXTENSIONS[fmt], 'name': field_file.name,
+                })
+            entries.append((url, bucket))
+        sources[fmt] = entries
+    return {'width': width, 'height': height, 'sources': sources}
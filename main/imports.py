@@ -0,0 +1,432 @@
+"""
+Bulk import of events, stories and blog posts from CSV, JSON or NDJSON.
+
+Rows are read lazily and handled in batches. For each batch the rows are
+validated with ``full_clean`` (unique checks and foreign keys excluded),
+slugs are made unique with one ranged lookup against the existing slugs,
+``image_url`` columns on public hosts are downloaded concurrently on a
+thread pool, and the batch is written with ``bulk_create``. Since
+bulk_create sends no signals, the search index, homepage sections and page
+cache are updated here.
+"""
+import csv
+import io
+import ipaddress
+import json
+import os
+import posixpath
+import socket
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+from django import forms
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import homepage, pagecache, search
+from .models import BlogPost, Event, Story
+
+FORMATS = ('csv', 'json', 'ndjson')
+BATCH_SIZE = 250
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 15
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# Fields set by the database/model rather than the file
+SKIPPED_FIELDS = ('id', 'created_at', 'updated_at')
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n', 'off')
+
+MODELS = {
+    'events': Event,
+    'stories': Story,
+    'blog': BlogPost,
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension == 'jsonl':
+        return 'ndjson'
+    if extension not in FORMATS:
+        raise ImportFormatError(f'Unsupported file type "{extension}"; use CSV, JSON or NDJSON')
+    return extension
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line or index, dict)`` pairs from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                raise ImportFormatError(f'Line {number}: {exc}')
+            yield number, row
+    elif fmt == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as exc:
+            raise ImportFormatError(str(exc))
+        if not isinstance(data, list):
+            raise ImportFormatError('A JSON import must be a list of objects')
+        for number, row in enumerate(data, 1):
+            yield number, row
+    else:
+        raise ImportFormatError(f'Unknown format {fmt!r}')
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def check_public_url(url):
+    """Refuse URLs that aren't http(s) or whose host isn't a public address
+
+    Image URLs come from uploaded files and are fetched from the server, so
+    they mustn't reach loopback, private or link-local services.
+    """
+    parts = urlparse(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError('only http(s) image URLs are allowed')
+    if not parts.hostname:
+        raise ValueError('the image URL has no host')
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as exc:
+        raise ValueError(f'cannot resolve {parts.hostname} ({exc})')
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f'{parts.hostname} is not a public address')
+
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # A public host may redirect to an internal one
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_PublicRedirectHandler)
+
+
+def download_image(url):
+    """Fetch and check an image; returns ``(filename, bytes)``"""
+    from PIL import Image
+
+    check_public_url(url)
+    request = urllib.request.Request(url, headers={'User-Agent': 'gywan-import/1.0'})
+    with _opener.open(request, timeout=IMAGE_TIMEOUT) as response:
+        data = response.read(IMAGE_MAX_BYTES + 1)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ValueError('image is larger than 10 MB')
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+        fmt = image.format
+    if fmt not in IMAGE_EXTENSIONS:
+        raise ValueError(f'unsupported image format {fmt}')
+    stem = slugify(os.path.splitext(posixpath.basename(urlparse(url).path))[0]) or 'image'
+    return stem[:80] + IMAGE_EXTENSIONS[fmt], data
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.images = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def skipped(self):
+        return len({line for line, _ in self.errors if line is not None})
+
+    @property
+    def per_second(self):
+        return (self.created + self.skipped) / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (
+            f'Imported {self.created} rows ({self.images} images), skipped {self.skipped} '
+            f'in {self.seconds:.1f}s ({self.per_second:.0f} rows/s)'
+        )
+
+
+class Importer:
+    """Import rows into ``model`` in validated, bulk-inserted batches"""
+
+    def __init__(self, model, batch_size=BATCH_SIZE, image_workers=IMAGE_WORKERS,
+                 default_author=None, dry_run=False):
+        self.model = model
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.default_author = default_author
+        self.dry_run = dry_run
+        self.slug_field = model._meta.get_field('slug')
+        self.fields = {
+            field.name: field for field in model._meta.concrete_fields
+            if field.editable and field.name not in SKIPPED_FIELDS
+        }
+        self._taken = set()
+        self._loaded_bases = set()
+        self._counters = {}
+
+    # Rows
+
+    def _coerce(self, field, value):
+        if isinstance(value, str):
+            value = value.strip()
+        if isinstance(field, models.BooleanField) and isinstance(value, str):
+            if value.lower() in TRUE_VALUES:
+                return True
+            if value.lower() in FALSE_VALUES:
+                return False
+        if value == '' and field.null:
+            return None
+        return value
+
+    def _build(self, row, authors):
+        if not isinstance(row, dict):
+            raise ValidationError('row is not an object')
+        instance = self.model()
+        for name, value in row.items():
+            field = self.fields.get(name)
+            if field is None or name in ('slug', 'image') or value is None:
+                continue
+            if field.is_relation:
+                continue
+            setattr(instance, field.attname, self._coerce(field, value))
+
+        exclude = ['slug', 'image']
+        if self.model is BlogPost:
+            username = (row.get('author') or '').strip()
+            author = authors.get(username) if username else self.default_author
+            if author is None:
+                raise ValidationError({'author': [f'unknown user "{username}"' if username else 'required']})
+            instance.author = author
+            exclude.append('author')
+
+        instance.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+        for name, field in self.fields.items():
+            value = getattr(instance, field.attname)
+            if isinstance(field, models.DateTimeField) and isinstance(value, datetime) and timezone.is_naive(value):
+                setattr(instance, field.attname, timezone.make_aware(value))
+        instance.slug = (row.get('slug') or '').strip()
+        return instance
+
+    def _authors(self, rows):
+        if self.model is not BlogPost:
+            return {}
+        usernames = {
+            (row.get('author') or '').strip() for _, row in rows if isinstance(row, dict)
+        } - {''}
+        return {user.username: user for user in User.objects.filter(username__in=usernames)}
+
+    # Slugs
+
+    def _base_slug(self, instance):
+        max_length = self.slug_field.max_length
+        return (slugify(instance.slug or instance.title)[:max_length].strip('-')
+                or self.model._meta.model_name)
+
+    def assign_slugs(self, instances, reload=False):
+        """Give every instance a slug unused in the table and in the import
+
+        Existing slugs equal to or starting with ``<base>-`` are fetched in
+        one query per batch, for the bases this import hasn't seen yet, and
+        remembered along with the slugs it assigns.
+        """
+        max_length = self.slug_field.max_length
+        bases = [self._base_slug(instance) for instance in instances]
+        new_bases = set(bases) if reload else set(bases) - self._loaded_bases
+        if new_bases:
+            condition = Q()
+            for base in new_bases:
+                # "-" sorts just before ".", so this is an index range scan
+                condition |= Q(slug=base) | Q(slug__gt=f'{base}-', slug__lt=f'{base}.')
+            self._taken.update(self.model.objects.filter(condition).values_list('slug', flat=True))
+            self._loaded_bases |= new_bases
+
+        for instance, base in zip(instances, bases):
+            # Resume from the last suffix used, so popular titles don't rescan from -2
+            slug, counter = base, self._counters.get(base, 1)
+            while slug in self._taken:
+                counter += 1
+                suffix = f'-{counter}'
+                slug = base[:max_length - len(suffix)].rstrip('-') + suffix
+            self._counters[base] = counter
+            self._taken.add(slug)
+            instance.slug = slug
+
+    # Images
+
+    def _save_image(self, instance, filename, data):
+        field = self.model._meta.get_field('image')
+        name = field.generate_filename(instance, filename)
+        instance.image.name = field.storage.save(name, ContentFile(data))
+
+    def attach_images(self, executor, pending, result):
+        """Download ``[(line, instance, url)]`` concurrently and attach them"""
+        futures = [(line, instance, url, executor.submit(download_image, url)) for line, instance, url in pending]
+        for line, instance, url, future in futures:
+            try:
+                filename, data = future.result()
+            except Exception as exc:
+                # Keep the row; it just has no image
+                result.errors.append((None, f'row {line}: image {url} not attached ({exc})'))
+                continue
+            if not self.dry_run:
+                self._save_image(instance, filename, data)
+            result.images += 1
+
+    # Driver
+
+    def _import_batch(self, executor, batch, result):
+        authors = self._authors(batch)
+        instances, pending = [], []
+        for line, row in batch:
+            try:
+                instance = self._build(row, authors)
+            except ValidationError as exc:
+                messages = exc.message_dict if hasattr(exc, 'error_dict') else {'row': exc.messages}
+                detail = '; '.join(f'{field}: {" ".join(errors)}' for field, errors in messages.items())
+                result.errors.append((line, f'row {line}: {detail}'))
+                continue
+            instances.append(instance)
+            url = (row.get('image_url') or '').strip()
+            if url:
+                pending.append((line, instance, url))
+        if not instances:
+            return
+
+        self.assign_slugs(instances)
+        if pending:
+            self.attach_images(executor, pending, result)
+        if self.dry_run:
+            result.created += len(instances)
+            return
+        try:
+            created = self._insert(instances)
+        except IntegrityError:
+            # A slug was taken by someone else since it was looked up
+            self.assign_slugs(instances, reload=True)
+            created = self._insert(instances)
+        result.created += len(created)
+
+    def _insert(self, instances):
+        with transaction.atomic():
+            created = self.model.objects.bulk_create(instances)
+            search.index_instances(self.model, [obj for obj in created if obj.pk is not None])
+        return created
+
+    def run(self, rows, progress=None):
+        """Import ``(line, dict)`` pairs; returns an ImportResult"""
+        result = ImportResult()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.image_workers) as executor:
+            for batch in _batches(rows, self.batch_size):
+                self._import_batch(executor, batch, result)
+                result.seconds = time.perf_counter() - started
+                if progress:
+                    progress(result)
+        result.seconds = time.perf_counter() - started
+        if result.created and not self.dry_run:
+            homepage.invalidate_model(self.model)
+            pagecache.purge(self.model)
+        return result
+
+
+def import_file(model, fileobj, fmt, **options):
+    """Import from a binary or text file object, e.g. an upload"""
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    return Importer(model, **options).run(read_rows(fileobj, fmt))
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV, JSON (a list of objects) or NDJSON, one row per item')
+    dry_run = forms.BooleanField(required=False, help_text='Validate and report without saving anything')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        try:
+            self.format = detect_format(upload.name)
+        except ImportFormatError as exc:
+            raise forms.ValidationError(str(exc))
+        return upload
+
+
+class ImportMixin:
+    """ModelAdmin mixin adding an upload page backed by Importer"""
+    change_list_template = 'admin/import_change_list.html'
+    # Errors listed on the result message; the rest are only counted
+    import_error_limit = 20
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [path('import/', self.admin_site.admin_view(self.import_view), name='%s_%s_import' % info)]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                result = import_file(
+                    self.model, form.cleaned_data['file'].file, form.format,
+                    default_author=request.user, dry_run=form.cleaned_data['dry_run'],
+                )
+            except ImportFormatError as exc:
+                form.add_error('file', str(exc))
+            else:
+                prefix = 'Dry run: ' if form.cleaned_data['dry_run'] else ''
+                level = messages.WARNING if result.errors else messages.SUCCESS
+                self.message_user(request, prefix + result.summary(), level)
+                for _, error in result.errors[:self.import_error_limit]:
+                    self.message_user(request, error, messages.WARNING)
+                if len(result.errors) > self.import_error_limit:
+                    self.message_user(
+                        request, f'...and {len(result.errors) - self.import_error_limit} more', messages.WARNING
+                    )
+                info = self.model._meta.app_label, self.model._meta.model_name
+                return redirect('admin:%s_%s_changelist' % info)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=f'Import {self.model._meta.verbose_name_plural}',
+            form=form,
+            columns=[name for name in Importer(self.model).fields if name != 'image'] + ['image_url'],
+        )
+        return TemplateResponse(request, 'admin/import_form.html', context)
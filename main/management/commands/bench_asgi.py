@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .bench_load import SAMPLES, percentile
+
+SETUPS = {
+    # Environment of the worker process for each setup
+    'wsgi': {'ASYNC_VIEWS': '0'},
+    'asgi': {'ASYNC_VIEWS': '1', 'CONN_MAX_AGE': '0'},
+}
+ROUTES = 'home,events,stories,blog,resources,event_detail,blog_detail'
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the same mix of page views and newsletter sign-ups to a number of concurrent '
+        'clients through the WSGI handler on a fixed thread pool (as a gunicorn gthread worker) '
+        'and through the ASGI handler with the async views (as a uvicorn worker), one fresh '
+        'process per setup and client count, and compare throughput, latency, peak memory and '
+        'the requests a memory budget serves at once'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setups', default='wsgi,asgi')
+        parser.add_argument('--clients', default='8,32,128', help='Comma-separated concurrent client counts')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the WSGI worker')
+        parser.add_argument('--client-ms', type=int, default=50,
+                            help='Time a client takes to receive a response, as over a slow network')
+        parser.add_argument('--requests', type=int, default=600, help='Requests per run')
+        parser.add_argument('--routes', default=ROUTES, help='Comma-separated URL names to GET')
+        parser.add_argument('--write-every', type=int, default=10,
+                            help='Make every Nth request a newsletter sign-up (0: reads only)')
+        parser.add_argument('--memory-mb', type=int, default=1024, help='Memory budget for the workers')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the full-page cache on')
+        # Internal: run as one worker process
+        parser.add_argument('--serve', choices=tuple(SETUPS), help=argparse.SUPPRESS)
+        parser.add_argument('--in-flight', type=int, default=8, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            return self._serve(options)
+
+        setups = [setup.strip() for setup in options['setups'].split(',') if setup.strip()]
+        unknown = set(setups) - set(SETUPS)
+        if unknown:
+            raise CommandError(f'Unknown setups: {", ".join(sorted(unknown))}')
+        levels = [int(level) for level in options['clients'].split(',')]
+
+        self.stdout.write(
+            f'{options["requests"]} requests per run, every {options["write_every"] or "no"} request a sign-up, '
+            f'{options["client_ms"]}ms per response at the client, {options["threads"]} WSGI threads, '
+            f'{options["memory_mb"]} MB budget'
+        )
+        self.stdout.write(
+            f'{"setup":<6} {"clients":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"threads":>8} {"RSS MB":>8} {"workers":>8} {"at once":>8}  status'
+        )
+        source = connections['default'].settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            for setup in setups:
+                # A fresh copy per setup, so both see the same data
+                path = os.path.join(directory, f'{setup}.sqlite3')
+                with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+                    src.backup(dst)
+                for level in levels:
+                    self._report(setup, level, self._run(setup, level, path, options), options)
+
+    def _run(self, setup, level, path, options):
+        env = dict(os.environ, DATABASE_PATH=path, QUERY_BUDGET_ENABLED='0', PROFILING_SAMPLE_RATE='0',
+                   PAGE_CACHE_ENABLED='1' if options['page_cache'] else '0', **SETUPS[setup])
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_asgi', '--serve', setup,
+            '--in-flight', str(level), '--requests', str(options['requests']), '--threads', str(options['threads']),
+            '--client-ms', str(options['client_ms']), '--routes', options['routes'],
+            '--write-every', str(options['write_every']),
+        ]
+        worker = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True)
+        if worker.returncode != 0:
+            raise CommandError(f'The {setup} worker failed with exit code {worker.returncode}')
+        return json.loads(worker.stdout.strip().splitlines()[-1])
+
+    def _report(self, setup, level, result, options):
+        latencies = result['latencies']
+        rss_mb = result['max_rss_kb'] / 1024
+        # Workers that fit the budget; a WSGI worker serves one request per
+        # thread and queues the rest, an ASGI worker serves every client
+        workers = int(options['memory_mb'] // rss_mb)
+        at_once = workers * (min(level, options['threads']) if setup == 'wsgi' else level)
+        self.stdout.write(
+            f'{setup:<6} {level:>8} {len(latencies) / result["elapsed"]:>8.0f} '
+            f'{statistics.median(latencies):>8.1f} {percentile(latencies, 0.95):>8.1f} '
+            f'{percentile(latencies, 0.99):>8.1f} {result["threads"]:>8} {rss_mb:>8.0f} '
+            f'{workers:>8} {at_once:>8}  {",".join(f"{s}x{n}" for s, n in sorted(result["status"].items()))}'
+        )
+
+    # Worker process
+
+    def _jobs(self, options):
+        """``[(method, path, body)]``: the routes in turn with sign-ups mixed in"""
+        paths = []
+        for name in options['routes'].split(','):
+            sample = SAMPLES.get(name.strip())
+            path = sample(name.strip()) if sample else reverse(name.strip())
+            if path:
+                paths.append(path)
+        if not paths:
+            raise CommandError('Nothing to request')
+        signup = reverse('newsletter_subscribe')
+        jobs = []
+        for number in range(options['requests']):
+            if options['write_every'] and number % options['write_every'] == options['write_every'] - 1:
+                body = f'email=bench-{os.getpid()}-{number}%40example.com&name=Benchmark'.encode()
+                jobs.append(('POST', signup, body))
+            else:
+                jobs.append(('GET', paths[number % len(paths)], b''))
+        return jobs
+
+    def _serve(self, options):
+        jobs = self._jobs(options)
+        # A visitor with a CSRF cookie, so the sign-ups pass CSRF checks
+        csrf = get_random_string(32)
+        headers = {
+            'host': 'localhost',
+            'cookie': f'{settings.CSRF_COOKIE_NAME}={csrf}',
+            'x-csrftoken': csrf,
+            'referer': 'https://localhost/',
+        }
+        if options['serve'] == 'wsgi':
+            run = self._wsgi_runner(headers, options['threads'], options['client_ms'] / 1000)
+        else:
+            run = self._asgi_runner(headers, options['client_ms'] / 1000)
+        results, elapsed, threads = asyncio.run(self._drive(run, jobs, options['in_flight']))
+        self.stdout.write(json.dumps({
+            'latencies': [latency for _, latency in results],
+            'status': Counter(str(status) for status, _ in results),
+            'elapsed': elapsed,
+            'threads': threads,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }))
+
+    async def _drive(self, run, jobs, clients):
+        """Run ``jobs`` for ``clients`` clients, each sending its next request once answered"""
+        threads = []
+
+        async def client(queue, results):
+            for job in queue:
+                started = time.perf_counter()
+                status = await run(job)
+                results.append((status, (time.perf_counter() - started) * 1000))
+                threads.append(threading.active_count())
+
+        async def run_all(batch):
+            queue = iter(batch)
+            results = []
+            await asyncio.gather(*(client(queue, results) for _ in range(clients)))
+            return results
+
+        # Warm up: template loading and the first connections aren't load
+        await run_all([job for job in jobs if job[0] == 'GET'][:clients])
+        threads.clear()
+        started = time.perf_counter()
+        results = await run_all(jobs)
+        return results, time.perf_counter() - started, max(threads)
+
+    def _wsgi_runner(self, headers, threads, client_seconds):
+        application = get_wsgi_application()
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def run(job):
+            method, path, body = job
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '443', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'REMOTE_ADDR': '127.0.0.1', 'CONTENT_LENGTH': str(len(body)),
+                'CONTENT_TYPE': 'application/x-www-form-urlencoded' if body else '',
+                'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'https',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+                **{'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()},
+            }
+            status = []
+            response = application(environ, lambda line, response_headers, exc_info=None: status.append(line))
+            try:
+                for _ in response:
+                    pass
+                # The thread writes the response out to the client
+                time.sleep(client_seconds)
+            finally:
+                response.close()
+            return int(status[0].split()[0])
+
+        async def run_in_pool(job):
+            return await asyncio.get_running_loop().run_in_executor(pool, run, job)
+
+        return run_in_pool
+
+    def _asgi_runner(self, headers, client_seconds):
+        application = get_asgi_application()
+        encoded = [(name.encode(), value.encode()) for name, value in headers.items()]
+
+        async def run(job):
+            method, path, body = job
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                'scheme': 'https', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': encoded + ([(b'content-type', b'application/x-www-form-urlencoded')] if body else []),
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 443),
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client stays connected; Django cancels this when it's done
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    # The event loop writes the response out to the client
+                    await asyncio.sleep(client_seconds)
+
+            await application(scope, receive, send)
+            return status[0]
+
+        return run
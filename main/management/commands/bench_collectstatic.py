@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from main import storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Time collectstatic into a temporary STATIC_ROOT: a cold build, a rebuild with '
+        'nothing changed and a rebuild after editing one stylesheet'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', action='store_true', help='Keep the temporary directory')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='collectstatic-')
+        try:
+            source = os.path.join(directory, 'static')
+            for number, path in enumerate(settings.STATICFILES_DIRS):
+                shutil.copytree(path, os.path.join(source, str(number)), dirs_exist_ok=True)
+            sources = [os.path.join(source, str(number)) for number in range(len(settings.STATICFILES_DIRS))]
+            with override_settings(STATIC_ROOT=os.path.join(directory, 'root'), STATICFILES_DIRS=sources):
+                self.stdout.write(f'Codecs: {", ".join(storage.CODECS)}')
+                self._build('cold')
+                self._build('unchanged')
+                stylesheet = self._first_stylesheet(sources)
+                if stylesheet:
+                    with open(stylesheet, 'a') as stream:
+                        stream.write('\n/* edited by bench_collectstatic */\n')
+                    self._build(f'edited {os.path.basename(stylesheet)}')
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Kept {directory}')
+            else:
+                shutil.rmtree(directory)
+
+    def _build(self, label):
+        started = time.perf_counter()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        elapsed = time.perf_counter() - started
+        cache = staticfiles_storage.load_build_cache()
+        self.stdout.write(
+            f'{label:<24} {elapsed:>7.2f}s  images optimised {cache["images_optimized"]:>3}, '
+            f'reused {cache["images_reused"]:>3}; files compressed {cache["files_compressed"]:>3}, '
+            f'reused or copied {cache["files_reused"]:>3}'
+        )
+
+    @staticmethod
+    def _first_stylesheet(sources):
+        for source in sources:
+            for root, _dirs, names in sorted(os.walk(source)):
+                for name in sorted(names):
+                    if name.endswith('.css'):
+                        return os.path.join(root, name)
+        return None
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from main import pagecache
+from main.querybudget import QueryRecorder
+from main.models import BlogPost, Event, Story
+
+
+class Command(BaseCommand):
+    help = 'Compare a full 200 render with a 304 revalidation for the list and detail pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def _pages(self):
+        pages = [reverse(name) for name in ('events', 'stories', 'blog', 'resources')]
+        for model, queryset in (
+            (Event, Event.objects.filter(is_active=True)),
+            (Story, Story.objects.filter(is_active=True)),
+            (BlogPost, BlogPost.objects.filter(is_active=True, published=True)),
+        ):
+            obj = queryset.order_by('-pk').first()
+            if obj is not None:
+                pages.append(obj.get_absolute_url())
+        return pages
+
+    def _measure(self, client, path, repeat, **headers):
+        timings = []
+        with QueryRecorder() as recorder:
+            response = client.get(path, headers=headers)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            client.get(path, headers=headers)
+            timings.append(time.perf_counter() - started)
+        return response, recorder.count, statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        # Measure the views themselves, not the full-page cache
+        pagecache.ENABLED = False
+        client = Client()
+        client.get(reverse('home'))  # pick up a CSRF cookie like a returning visitor
+
+        self.stdout.write(f'{"page":<40} {"200 ms":>8} {"queries":>8} {"304 ms":>8} {"queries":>8} {"speedup":>8}')
+        for path in self._pages():
+            full, full_queries, full_ms = self._measure(client, path, options['repeat'])
+            etag = full.get('ETag')
+            if full.status_code != 200 or not etag:
+                self.stdout.write(f'{path:<40} skipped (status {full.status_code}, no ETag)')
+                continue
+            cached, cached_queries, cached_ms = self._measure(
+                client, path, options['repeat'], if_none_match=etag
+            )
+            if cached.status_code != 304:
+                self.stdout.write(f'{path:<40} revalidation returned {cached.status_code}')
+                continue
+            self.stdout.write(
+                f'{path[:40]:<40} {full_ms:>8.2f} {full_queries:>8} {cached_ms:>8.2f} '
+                f'{cached_queries:>8} {full_ms / cached_ms:>7.1f}x'
+            )
@@ -0,0 +1,70 @@
+import resource
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main import exports
+from main.models import Bank, Donation2, MobileProvider
+
+
+class Rollback(Exception):
+    pass
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Export a temporary set of donations (rolled back afterwards) in each '
+        'format and report throughput and peak memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['rows'])
+                self._run(options['rows'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _seed(self, rows):
+        provider = MobileProvider.objects.create(name='Benchmark provider')
+        bank = Bank.objects.create(name='Benchmark bank')
+        started = time.perf_counter()
+        # bulk_create materialises its input, so seed in slices to keep the
+        # baseline memory low
+        for offset in range(0, rows, 10000):
+            Donation2.objects.bulk_create([
+                Donation2(
+                    amount=Decimal(i % 500 + 1), donor_name=f'Donor {i}', donor_email=f'donor{i}@example.com',
+                    payment_method='mobile' if i % 2 else 'bank',
+                    mobile_provider=provider if i % 2 else None, bank_name=None if i % 2 else bank,
+                    message='Keep up the good work, "GYWAN"!',
+                ) for i in range(offset, min(offset + 10000, rows))
+            ], batch_size=2000)
+        self.stdout.write(
+            f'Seeded {rows} donations in {time.perf_counter() - started:.1f}s '
+            f'(max RSS {max_rss_mb():.1f} MB)'
+        )
+
+    def _run(self, rows):
+        export = exports.EXPORTS[Donation2]
+        self.stdout.write(f'{"format":>12} {"seconds":>8} {"rows/s":>10} {"MB out":>8} {"max RSS MB":>11}')
+        for fmt, compress in (('csv', False), ('csv', True), ('ndjson', False), ('ndjson', True)):
+            started = time.perf_counter()
+            written = sum(len(chunk) for chunk in exports.export_chunks(export, None, fmt, compress))
+            elapsed = time.perf_counter() - started
+            label = fmt + ('.gz' if compress else '')
+            self.stdout.write(
+                f'{label:>12} {elapsed:>8.1f} {rows / elapsed:>10.0f} '
+                f'{written / 1024 / 1024:>8.1f} {max_rss_mb():>11.1f}'
+            )
@@ -0,0 +1,237 @@
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from main import campaigns, images, pagecache, urls
+from main.models import BlogPost, Event, Newsletter, Resource, Story
+from main.querybudget import QueryRecorder
+
+# Routes that aren't plain GETs
+METHODS = {'track_download': 'POST'}
+
+
+def _latest_slug(url_name, queryset):
+    obj = queryset.order_by('-pk').first()
+    return reverse(url_name, kwargs={'slug': obj.slug}) if obj else None
+
+
+def _resource(url_name):
+    pk = Resource.objects.filter(is_active=True).exclude(file='').values_list('pk', flat=True).first()
+    return reverse(url_name, kwargs={'resource_id': pk}) if pk else None
+
+
+def _unsubscribe(url_name):
+    pk = Newsletter.objects.values_list('pk', flat=True).first()
+    return reverse(url_name, kwargs={'token': campaigns.unsubscribe_token(pk)}) if pk else None
+
+
+def _image_variant(url_name):
+    for model in (Event, Story, BlogPost):
+        for name in model.objects.exclude(image='').exclude(image=None).values_list('image', flat=True)[:20]:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            try:
+                _, source_width, _ = images.source_info(path)
+            except (OSError, ValueError):
+                continue
+            widths = images.variant_widths(source_width)
+            if widths:
+                return reverse(url_name, kwargs={'width': widths[0], 'fmt': 'webp', 'name': name})
+    return None
+
+
+# Sample URLs for routes that take arguments
+SAMPLES = {
+    'event_detail': lambda name: _latest_slug(name, Event.objects.filter(is_active=True)),
+    'story_detail': lambda name: _latest_slug(name, Story.objects.filter(is_active=True)),
+    'blog_detail': lambda name: _latest_slug(name, BlogPost.objects.filter(is_active=True, published=True)),
+    'resource_download': _resource,
+    'track_download': _resource,
+    'newsletter_unsubscribe': _unsubscribe,
+    'image_variant': _image_variant,
+}
+
+
+def route_paths():
+    """``(url name, path or None)`` for every named route in main/urls.py"""
+    routes = []
+    for pattern in urls.urlpatterns:
+        name = getattr(pattern, 'name', None)
+        if not name:
+            continue
+        sample = SAMPLES.get(name)
+        routes.append((name, sample(name) if sample else reverse(name)))
+    return routes
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# One test client per worker thread or process
+_local = threading.local()
+
+
+def _request(job):
+    """Run one request; returns ``(status, milliseconds, queries or None)``"""
+    base_url, method, path = job
+    if base_url:
+        request = urllib.request.Request(base_url.rstrip('/') + path, method=method, data=b'' if method == 'POST' else None)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            status, headers = exc.code, exc.headers
+        elapsed = (time.perf_counter() - started) * 1000
+        queries = headers.get('X-Query-Count')
+        return status, elapsed, int(queries) if queries else None
+
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = _local.client = Client(raise_request_exception=False)
+    started = time.perf_counter()
+    with QueryRecorder() as recorder:
+        response = client.generic(method, path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return response.status_code, (time.perf_counter() - started) * 1000, recorder.count
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test every named route in main/urls.py, in process through the WSGI app or '
+        'against a running server, and write p50/p95/p99 latency, throughput and query '
+        'counts per route as a JSON baseline (optionally compared with an earlier one)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            help='e.g. http://127.0.0.1:8000 for a local gunicorn (query counts need QUERY_BUDGET_ENABLED '
+                 'there); default: in process',
+        )
+        parser.add_argument('--requests', type=int, default=100, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--processes', action='store_true', help='Use a process pool instead of threads')
+        parser.add_argument('--routes', help='Comma-separated URL names (default: all)')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Keep the full-page cache on for in-process runs (it is off by default)')
+        parser.add_argument('--output', help='Write the JSON baseline here')
+        parser.add_argument('--compare', help='An earlier baseline to diff against')
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help='With --compare, fail if a p95 grows by more than this percentage')
+
+    def handle(self, *args, **options):
+        if not options['base_url'] and not options['page_cache']:
+            pagecache.ENABLED = False
+
+        routes = route_paths()
+        if options['routes']:
+            wanted = {name.strip() for name in options['routes'].split(',')}
+            unknown = wanted - {name for name, _ in routes}
+            if unknown:
+                raise CommandError(f'Unknown routes: {", ".join(sorted(unknown))}')
+            routes = [(name, path) for name, path in routes if name in wanted]
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        pool_class = ProcessPoolExecutor if options['processes'] else ThreadPoolExecutor
+        baseline = {
+            'created': timezone.now().isoformat(),
+            'target': options['base_url'] or 'wsgi',
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'pool': 'processes' if options['processes'] else 'threads',
+            'routes': {},
+        }
+        self.stdout.write(
+            f'{"route":<24} {"status":<12} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}'
+        )
+        with pool_class(max_workers=options['concurrency']) as pool:
+            for name, path in routes:
+                if path is None:
+                    self.stdout.write(f'{name:<24} skipped: nothing to request')
+                    continue
+                result = self._load(pool, name, path, options)
+                baseline['routes'][name] = result
+                self.stdout.write(
+                    f'{name:<24} {",".join(f"{s}x{n}" for s, n in result["status"].items()):<12} '
+                    f'{result["rps"]:>8.1f} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                    f'{result["p99_ms"]:>8.2f} {result["queries"] if result["queries"] is not None else "-":>8}'
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(baseline, stream, indent=2)
+            self.stdout.write(f'Baseline written to {options["output"]}')
+        if options['compare']:
+            self._compare(options['compare'], baseline, options['tolerance'])
+
+    def _load(self, pool, name, path, options):
+        method = METHODS.get(name, 'GET')
+        job = (options['base_url'], method, path)
+        # Warm up: first-request work such as building an image variant isn't load
+        list(pool.map(_request, [job] * options['concurrency']))
+        started = time.perf_counter()
+        results = list(pool.map(_request, [job] * options['requests']))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for _, latency, _ in results]
+        queries = [count for _, _, count in results if count is not None]
+        return {
+            'path': path,
+            'method': method,
+            'status': {str(status): count for status, count in sorted(Counter(s for s, _, _ in results).items())},
+            'rps': round(len(results) / elapsed, 2),
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': round(statistics.median(queries)) if queries else None,
+        }
+
+    def _compare(self, path, baseline, tolerance):
+        with open(path) as stream:
+            previous = json.load(stream)
+        self.stdout.write(f'\nCompared with {path} ({previous.get("created", "unknown date")})')
+        self.stdout.write(f'{"route":<24} {"p50":>9} {"p95":>9} {"req/s":>9} {"queries":>9}')
+
+        def change(old, new):
+            return (new - old) / old * 100 if old else 0
+
+        regressions = []
+        for name, result in baseline['routes'].items():
+            before = previous.get('routes', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:<24} new route')
+                continue
+            p95 = change(before['p95_ms'], result['p95_ms'])
+            queries = '-'
+            if before.get('queries') is not None and result['queries'] is not None:
+                queries = f'{result["queries"] - before["queries"]:+d}'
+                if result['queries'] > before['queries']:
+                    regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries')
+            if p95 > tolerance:
+                regressions.append(f'{name}: p95 {before["p95_ms"]:.1f}ms -> {result["p95_ms"]:.1f}ms')
+            self.stdout.write(
+                f'{name:<24} {change(before["p50_ms"], result["p50_ms"]):>+8.1f}% {p95:>+8.1f}% '
+                f'{change(before["rps"], result["rps"]):>+8.1f}% {queries:>9}'
+            )
+        if regressions:
+            raise CommandError('Regressions:\n' + '\n'.join(regressions))
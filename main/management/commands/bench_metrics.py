@@ -0,0 +1,119 @@
+import glob
+import multiprocessing
+import re
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from main import metrics, pagecache
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """A minimal Prometheus text-format scraper: ``[(name, labels, value)]``"""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if match is None:
+            raise ValueError(f'Unparseable line: {line!r}')
+        labels = dict(_LABEL_RE.findall(match.group(3) or ''))
+        samples.append((match.group(1), labels, float(match.group(4))))
+    return samples
+
+
+def _worker(paths, requests):
+    connections.close_all()
+    client = Client(HTTP_HOST='localhost')
+    for number in range(requests):
+        client.get(paths[number % len(paths)])
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve requests from several forked processes sharing a temporary METRICS_DIR, '
+        'scrape /metrics and check that the totals add up across processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=50, help='Requests per process')
+
+    def handle(self, *args, **options):
+        paths = [reverse(name) for name in ('home', 'about', 'events', 'blog')]
+        # Let cached pages count as page cache hits
+        pagecache.ENABLED = True
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.METRICS_DIR = directory
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            workers = [
+                context.Process(target=_worker, args=(paths, options['requests']))
+                for _ in range(options['processes'])
+            ]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+                if worker.exitcode != 0:
+                    raise CommandError(f'A worker exited with code {worker.exitcode}')
+            elapsed = time.perf_counter() - started
+
+            # What /metrics serves, without its token check
+            samples = parse(metrics.render())
+            self._check(samples, options['processes'] * options['requests'])
+
+            self.stdout.write(
+                f'{options["processes"]} processes x {options["requests"]} requests in {elapsed:.1f}s; '
+                f'{len(samples)} samples scraped from {len(glob.glob(directory + "/metrics_*.db"))} store files'
+            )
+            self._overhead()
+
+    def _check(self, samples, expected):
+        responses = sum(
+            value for name, labels, value in samples
+            if name == 'django_http_responses_total' and labels.get('url_name') != 'metrics'
+        )
+        if responses != expected:
+            raise CommandError(f'Counted {responses:.0f} responses, expected {expected}')
+
+        counts = {}
+        for name, labels, value in samples:
+            if name.endswith('_bucket'):
+                series = (name[:-len('_bucket')], tuple(sorted((k, v) for k, v in labels.items() if k != 'le')))
+                previous = counts.get(series, (0, None))[0]
+                if value < previous:
+                    raise CommandError(f'Buckets of {series} are not cumulative')
+                counts[series] = (value, labels['le'])
+        for name, labels, value in samples:
+            if name.endswith('_count'):
+                series = (name[:-len('_count')], tuple(sorted(labels.items())))
+                last, bound = counts.get(series, (None, None))
+                if bound != '+Inf' or last != value:
+                    raise CommandError(f'{series}: +Inf bucket {last} does not match count {value}')
+
+        hits = {labels.get('result'): value for name, labels, value in samples
+                if name == 'gywan_cache_requests_total' and labels.get('cache') == 'page'}
+        self.stdout.write(self.style.SUCCESS(
+            f'{responses:.0f} responses counted across processes; histograms consistent; '
+            f'page cache {hits.get("hit", 0):.0f} hits / {hits.get("miss", 0):.0f} misses'
+        ))
+
+    def _overhead(self):
+        repeat = 20000
+        started = time.perf_counter()
+        for _ in range(repeat):
+            metrics.observe('django_http_request_duration_seconds', 0.02, url_name='bench')
+            metrics.inc('django_http_responses_total', url_name='bench', method='GET', status='200')
+            metrics.observe('django_db_queries_per_request', 3, url_name='bench')
+            metrics.observe('django_db_query_seconds_per_request', 0.002, url_name='bench')
+        per_request = (time.perf_counter() - started) / repeat * 1e6
+        self.stdout.write(f'Recording one request costs {per_request:.1f}us')
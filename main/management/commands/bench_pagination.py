@@ -0,0 +1,78 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from main.models import BlogPost
+from main.pagination import KeysetPaginator, encode_cursor
+from main.views import BlogListView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare OFFSET and keyset pagination of the blog list at increasing '
+        'depths on a temporary dataset (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['rows'])
+                self._run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _seed(self, rows):
+        author = User.objects.create(username='bench-pagination')
+        started = time.perf_counter()
+        BlogPost.objects.bulk_create(
+            (BlogPost(
+                title=f'Benchmark post {i}', slug=f'bench-pagination-{i}', content='benchmark',
+                excerpt='benchmark', author=author
+            ) for i in range(rows)),
+            batch_size=1000,
+        )
+        self.stdout.write(f'Seeded {rows} posts in {time.perf_counter() - started:.1f}s')
+
+    def _time(self, request, cursor_pagination, repeat):
+        view = BlogListView.as_view(cursor_pagination=cursor_pagination)
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = view(request)
+            # Force the queryset and the template context to be evaluated
+            list(response.context_data['object_list'])
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    def _run(self, rows, repeat):
+        factory = RequestFactory()
+        per_page = BlogListView.paginate_by
+        last_page = rows // per_page
+        depths = sorted({page for page in (1, 10, 100, last_page // 2, last_page) if page >= 1})
+        ordered = BlogPost.objects.filter(published=True, is_active=True)
+        paginator = KeysetPaginator(ordered, per_page, ['-created_at'])
+
+        self.stdout.write(f'{"page":>8} {"offset ms":>10} {"cursor ms":>10}')
+        for page in depths:
+            offset_ms = self._time(factory.get('/blog/', {'page': page}), False, repeat)
+
+            # A cursor pointing at the last row of the previous page
+            params = {}
+            if page > 1:
+                anchor = ordered.order_by('-created_at', '-pk')[(page - 1) * per_page - 1]
+                params['cursor'] = encode_cursor(paginator._serialise(anchor), 'next')
+            cursor_ms = self._time(factory.get('/blog/', params), True, repeat)
+            self.stdout.write(f'{page:>8} {offset_ms:>10.2f} {cursor_ms:>10.2f}')
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+from main.models import Comment, Event
+
+PROFILES = {
+    # SQLITE_TUNING environment value for the worker processes
+    'stock': '0',
+    'tuned': '1',
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Run reader and writer processes against a copy of the database, once with '
+        'the stock SQLite settings and once tuned, and compare throughput, latency '
+        'and "database is locked" errors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile')
+        parser.add_argument('--profiles', default='stock,tuned')
+        # Internal: run as one worker process
+        parser.add_argument('--worker', choices=('read', 'write'), help=argparse.SUPPRESS)
+        parser.add_argument('--start-at', type=float, default=0, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self._work(options['worker'], options['start_at'], options['duration'])
+
+        source = connections['default'].settings_dict['NAME']
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f'Unknown profiles: {", ".join(sorted(unknown))}')
+
+        self.stdout.write(
+            f'{options["readers"]} readers, {options["writers"]} writers, {options["duration"]:.0f}s per profile'
+        )
+        self.stdout.write(
+            f'{"profile":<8} {"role":<6} {"ops/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"max ms":>8} {"locked":>7}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in profiles:
+                path = os.path.join(directory, f'{profile}.sqlite3')
+                self._copy(source, path, wal=profile == 'tuned')
+                results = self._run(profile, path, options)
+                for role in ('read', 'write'):
+                    self._report(profile, role, [result for result in results if result['role'] == role],
+                                 options['duration'])
+
+    def _copy(self, source, path, wal):
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+            # The stock profile starts from the default rollback journal
+            dst.execute(f'PRAGMA journal_mode={"WAL" if wal else "DELETE"}')
+
+    def _run(self, profile, path, options):
+        env = dict(os.environ, DATABASE_PATH=path, SQLITE_TUNING=PROFILES[profile], QUERY_BUDGET_ENABLED='0')
+        start_at = time.time() + 3
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_sqlite_concurrency',
+                   '--duration', str(options['duration']), '--start-at', str(start_at), '--worker']
+        workers = [
+            subprocess.Popen(command + [role], env=env, stdout=subprocess.PIPE, text=True)
+            for role in ['read'] * options['readers'] + ['write'] * options['writers']
+        ]
+        results = []
+        for worker in workers:
+            output, _ = worker.communicate()
+            if worker.returncode != 0:
+                raise CommandError(f'A worker failed with exit code {worker.returncode}')
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        return results
+
+    def _report(self, profile, role, results, duration):
+        if not results:
+            return
+        latencies = [latency for result in results for latency in result['latencies']]
+        locked = sum(result['locked'] for result in results)
+        self.stdout.write(
+            f'{profile:<8} {role:<6} {len(latencies) / duration:>8.0f} '
+            f'{statistics.median(latencies) if latencies else 0:>8.2f} {percentile(latencies, 0.95):>8.2f} '
+            f'{percentile(latencies, 0.99):>8.2f} {max(latencies, default=0):>8.2f} {locked:>7}'
+        )
+
+    def _read(self):
+        # What a list page asks for
+        events = Event.objects.filter(is_active=True)
+        events.count()
+        list(events[:10])
+        list(Comment.objects.order_by('-created_at')[:10])
+
+    def _write(self, number):
+        # A form post: validate against the table, then insert
+        with transaction.atomic():
+            Comment.objects.filter(email='bench@example.com').exists()
+            Comment.objects.create(name='Benchmark', email='bench@example.com', text=f'Benchmark {number}')
+
+    def _work(self, role, start_at, duration):
+        time.sleep(max(0, start_at - time.time()))
+        deadline = time.time() + duration
+        latencies, locked, number = [], 0, 0
+        while time.time() < deadline:
+            number += 1
+            started = time.perf_counter()
+            try:
+                self._read() if role == 'read' else self._write(number)
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+                locked += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(json.dumps({'role': role, 'latencies': latencies, 'locked': locked}))
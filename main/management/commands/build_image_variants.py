@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main import images
+from main.models import TeamMember, Event, Story, BlogPost, Testimonial, Supporter, ImpactStory, ImpactStat, Resource
+
+IMAGE_FIELDS = [
+    (TeamMember, 'image'),
+    (Event, 'image'),
+    (Story, 'image'),
+    (BlogPost, 'image'),
+    (Testimonial, 'photo'),
+    (Supporter, 'image'),
+    (ImpactStory, 'image'),
+    (ImpactStat, 'image'),
+    (Resource, 'image'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Pre-build responsive WebP/JPEG variants of every uploaded image'
+
+    def handle(self, *args, **options):
+        jobs = {}
+        for model, field in IMAGE_FIELDS:
+            names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for name in names.values_list(field, flat=True).iterator():
+                path = os.path.join(settings.MEDIA_ROOT, name)
+                try:
+                    digest, width, _ = images.source_info(path)
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f'Skipping {name}: {exc}')
+                    continue
+                for fmt in ('webp', images.fallback_format(name)):
+                    for bucket in images.variant_widths(width):
+                        dest = os.path.join(settings.MEDIA_ROOT, images.variant_name(digest, bucket, fmt))
+                        if not os.path.exists(dest):
+                            jobs[dest] = (path, dest, bucket, fmt)
+
+        started = time.perf_counter()
+        executor = images.get_executor()
+        futures = {executor.submit(images.build_variant, *job): dest for dest, job in jobs.items()}
+        built = 0
+        for future in as_completed(futures):
+            try:
+                future.result()
+                built += 1
+            except Exception as exc:
+                self.stderr.write(f'Failed {futures[future]}: {exc}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Built {built} of {len(jobs)} variants in {elapsed:.1f}s'))
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from main import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream donations or contact messages to CSV/NDJSON, optionally gzipped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(exports.EXPORTS_BY_NAME))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output)')
+        parser.add_argument('--since', help='Only records created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only records created on or before this date (YYYY-MM-DD)')
+
+    def _date(self, value, option):
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'--{option} must be a date in YYYY-MM-DD format')
+        return parsed
+
+    def handle(self, *args, **options):
+        export = exports.EXPORTS_BY_NAME[options['export']]
+        queryset = export.model.objects.order_by('pk')
+        if options['since']:
+            queryset = queryset.filter(created_at__date__gte=self._date(options['since'], 'since'))
+        if options['until']:
+            queryset = queryset.filter(created_at__date__lte=self._date(options['until'], 'until'))
+
+        chunks = exports.export_chunks(export, queryset, options['format'], options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                written = sum(output.write(chunk) for chunk in chunks)
+            self.stderr.write(f'Wrote {written} bytes to {options["output"]}')
+        else:
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main import imports
+
+
+class Command(BaseCommand):
+    help = 'Bulk import events, stories or blog posts from a CSV, JSON or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(imports.MODELS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+        parser.add_argument('--image-workers', type=int, default=imports.IMAGE_WORKERS,
+                            help='Threads downloading image_url columns')
+        parser.add_argument('--author', help='Username for blog posts without an author column')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without saving anything')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        model = imports.MODELS[options['kind']]
+        author = None
+        if options['author']:
+            author = User.objects.filter(username=options['author']).first()
+            if author is None:
+                raise CommandError(f'No user named "{options["author"]}"')
+        try:
+            fmt = options['format'] or imports.detect_format(options['path'])
+            importer = imports.Importer(
+                model, batch_size=options['batch_size'], image_workers=options['image_workers'],
+                default_author=author, dry_run=options['dry_run'],
+            )
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = importer.run(imports.read_rows(stream, fmt), progress=self._progress)
+        except imports.ImportFormatError as exc:
+            raise CommandError(str(exc))
+
+        for _, error in result.errors:
+            self.stderr.write(error)
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(('Dry run: ' if options['dry_run'] else '') + result.summary()))
+
+    def _progress(self, result):
+        if self.verbosity > 1:
+            self.stdout.write(f'{result.created} rows, {result.per_second:.0f} rows/s')
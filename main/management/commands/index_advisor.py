@@ -0,0 +1,203 @@
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from main.models import BlogPost, Comment, Event, Resource, Story
+from main.querybudget import QueryRecorder
+
+# Tables whose queries must be served by an index (--check)
+HOT_MODELS = (Event, Story, BlogPost, Resource, Comment)
+
+DEFAULT_PAGES = ('home', 'events', 'stories', 'blog', 'resources', 'event_detail', 'story_detail', 'blog_detail')
+DETAIL_PAGES = {
+    'event_detail': Event.objects.filter(is_active=True),
+    'story_detail': Story.objects.filter(is_active=True),
+    'blog_detail': BlogPost.objects.filter(is_active=True, published=True),
+}
+
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN) "(\w+)"')
+
+
+class Rollback(Exception):
+    pass
+
+
+def explain(sql, params):
+    """Return the EXPLAIN QUERY PLAN detail lines for a recorded query"""
+    with connection.cursor() as cursor:
+        # An EXPLAIN's plan is fixed when prepared and sqlite3 caches statements
+        # by text; the schema version in the text re-plans after a DDL change
+        cursor.execute('PRAGMA schema_version')
+        version = cursor.fetchone()[0]
+        cursor.execute(f'EXPLAIN QUERY PLAN /* schema {version} */ {sql}', params or ())
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def problems(plan):
+    """Return ``(kind, table or None)`` for full table scans and temp b-tree sorts"""
+    found = []
+    for detail in plan:
+        match = _SCAN_RE.match(detail)
+        if match and 'USING' not in detail:
+            found.append(('full scan', match.group(1)))
+        elif 'USE TEMP B-TREE' in detail:
+            found.append(('temp b-tree', None))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the queries behind each page, run EXPLAIN QUERY PLAN on them and '
+        'report full table scans and temporary b-tree sorts (SQLite only)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'pages', nargs='*',
+            help='URL names or paths (default: the home, content list and detail pages)',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Add this many rows per content model in a transaction rolled back afterwards',
+        )
+        parser.add_argument('--cursor', action='store_true', help='Use keyset pagination on the list pages')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Exit with an error if a query on a hot content table scans or sorts',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'EXPLAIN QUERY PLAN output is SQLite specific, not {connection.vendor}')
+        self.verbosity = options['verbosity']
+        self.client = Client(HTTP_HOST=self._host())
+
+        failures, errors = [], []
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self._seed(options['seed'])
+                # Explain the views' queries, not the full-page cache
+                with override_settings(CURSOR_PAGINATION=options['cursor'], PAGE_CACHE_ENABLED=False):
+                    for path in self._paths(options['pages'] or DEFAULT_PAGES):
+                        status, found = self._advise(path)
+                        if status != 200:
+                            errors.append(f'{path}: status {status}')
+                        failures.extend(found)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if errors:
+            # Nothing was checked on a page that didn't render
+            raise CommandError('\n'.join(errors))
+
+        hot = {model._meta.db_table for model in HOT_MODELS}
+        hot_failures = [failure for failure in failures if failure[2] & hot]
+        self.stdout.write(
+            f'{len(failures)} queries with scans or sorts, {len(hot_failures)} on hot tables ({", ".join(sorted(hot))})'
+        )
+        if options['check'] and hot_failures:
+            raise CommandError('\n'.join(
+                f'{path}: {shape[:160]}' for path, shape, _ in hot_failures
+            ))
+
+    def _host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    def _paths(self, pages):
+        for page in pages:
+            if page.startswith('/'):
+                yield page
+                continue
+            try:
+                yield reverse(page)
+            except NoReverseMatch:
+                queryset = DETAIL_PAGES.get(page)
+                obj = queryset.order_by('-pk').first() if queryset is not None else None
+                if obj is None:
+                    self.stderr.write(f'Skipping {page}: not a URL name without arguments or nothing to show')
+                    continue
+                yield obj.get_absolute_url()
+            if page == 'resources':
+                yield reverse(page) + '?category=guide'
+
+    def _advise(self, path):
+        with QueryRecorder() as recorder:
+            response = self.client.get(path)
+        self.stdout.write(f'{path} ({response.status_code}): {recorder.count} queries')
+
+        failures, seen = [], set()
+        for query in recorder.queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT') or query['shape'] in seen:
+                continue
+            seen.add(query['shape'])
+            plan = explain(query['sql'], query['params'])
+            found = problems(plan)
+            if found:
+                tables = {table for _, table in found if table}
+                if any(table is None for _, table in found):
+                    tables |= set(_TABLE_RE.findall(query['sql'])[:1])
+                failures.append((path, query['shape'], tables))
+            if found or self.verbosity > 1:
+                label = ', '.join(sorted({kind for kind, _ in found})) or 'ok'
+                self.stdout.write(f'  [{label}] {query["shape"][:200]}')
+                self.stdout.write(''.join(f'      {detail}\n' for detail in plan), ending='')
+        return response.status_code, failures
+
+    def _seed(self, rows):
+        started = time.perf_counter()
+        now = timezone.now()
+        author = User.objects.create(username='index-advisor')
+        categories = [value for value, _ in Resource.CATEGORY_CHOICES]
+
+        def batches(build):
+            for start in range(0, rows, 10000):
+                yield [build(i) for i in range(start, min(start + 10000, rows))]
+
+        # Every tenth row inactive, so the is_active filters have something to skip
+        for batch in batches(lambda i: Event(
+            title=f'Advisor event {i}', slug=f'advisor-event-{i}', description='advisor',
+            date=now + timedelta(hours=i - rows // 2), location='advisor', is_active=i % 10 != 0,
+        )):
+            Event.objects.bulk_create(batch)
+        for batch in batches(lambda i: Story(
+            title=f'Advisor story {i}', slug=f'advisor-story-{i}', content='advisor', author='advisor',
+            is_active=i % 10 != 0,
+        )):
+            Story.objects.bulk_create(batch)
+        for batch in batches(lambda i: BlogPost(
+            title=f'Advisor post {i}', slug=f'advisor-post-{i}', content='advisor', excerpt='advisor',
+            author=author, published=i % 7 != 0, is_active=i % 10 != 0,
+        )):
+            BlogPost.objects.bulk_create(batch)
+        for batch in batches(lambda i: Resource(
+            title=f'Advisor resource {i}', description='advisor', file='resources/advisor.pdf',
+            category=categories[i % len(categories)], is_active=i % 10 != 0,
+        )):
+            Resource.objects.bulk_create(batch)
+
+        event_type = ContentType.objects.get_for_model(Event)
+        # Spread the comments over a fifth of the events
+        targets = list(
+            Event.objects.filter(slug__startswith='advisor-event-').values_list('pk', flat=True)[:max(rows // 5, 1)]
+        )
+        for batch in batches(lambda i: Comment(
+            text='advisor', email='advisor@example.com', content_type=event_type,
+            object_id=targets[i % len(targets)],
+        )):
+            Comment.objects.bulk_create(batch)
+        self.stdout.write(f'Seeded {rows} rows per content model in {time.perf_counter() - started:.1f}s')
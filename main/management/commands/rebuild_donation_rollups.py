@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the donation rollup tables from all donations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rollups.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows in {elapsed:.2f}s'))
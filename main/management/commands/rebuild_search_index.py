@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for events, stories and blog posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model, index in search.INDEXES.items():
+            started = time.perf_counter()
+            try:
+                count = search.rebuild(model, batch_size=options['batch_size'])
+            except NotSupportedError as exc:
+                raise CommandError(exc)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Indexed {count} {model._meta.verbose_name_plural} into {index.table} in {elapsed:.2f}s'
+            ))
@@ -0,0 +1,176 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from main import homepage, pagecache, rollups, search
+from main.models import Bank, BlogPost, Comment, Donation2, Event, MobileProvider, Story
+
+# Seeded rows are recognisable by these, so --clear removes only them
+SLUG_PREFIX = 'load-'
+EMAIL_DOMAIN = 'load.example'
+AUTHOR = 'loadtest'
+
+WORDS = (
+    'youth community water health school climate women leadership farming training '
+    'clinic village digital skills market river forest library sports music art '
+    'savings cooperative mentoring volunteers workshop rally harvest solar bridge'
+).split()
+PLACES = ('Accra', 'Kumasi', 'Tamale', 'Cape Coast', 'Ho', 'Takoradi', 'Bolgatanga', 'Sunyani')
+NAMES = ('Ama', 'Kofi', 'Esi', 'Kwame', 'Akosua', 'Yaw', 'Abena', 'Kojo', 'Efua', 'Kwesi')
+
+
+def _title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))).capitalize()
+
+
+def _text(rng, sentences):
+    return ' '.join(_title(rng) + '.' for _ in range(sentences))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset (events, stories, blog posts, comments and '
+        'donations) with bulk_create, for load tests; --clear removes it again'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--stories', type=int, default=5000)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--donations', type=int, default=50000)
+        parser.add_argument('--days', type=int, default=730, help='Spread created_at over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable datasets')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded rows and exit')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days'])
+
+        started = time.perf_counter()
+        if options['clear']:
+            self._clear()
+        else:
+            with transaction.atomic():
+                self._seed(options)
+        rollups.rebuild()
+        homepage.invalidate_all()
+        pagecache.purge(Event, Story, BlogPost, Comment)
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def _created_at(self):
+        return self.now - self.span * self.rng.random() ** 1.5
+
+    def _insert(self, model, count, build):
+        """bulk_create ``count`` rows and backdate them; returns the new primary keys"""
+        started = time.perf_counter()
+        pks = []
+        dated = ['created_at'] + (['updated_at'] if hasattr(model, 'updated_at') else [])
+        for start in range(0, count, self.batch_size):
+            objs = model.objects.bulk_create([build(i) for i in range(start, min(start + self.batch_size, count))])
+            # auto_now_add overwrites created_at on insert; bulk_update doesn't
+            for obj in objs:
+                obj.created_at = obj.updated_at = self._created_at()
+            model.objects.bulk_update(objs, dated, batch_size=1000)
+            search.index_instances(model, objs)
+            pks.extend(obj.pk for obj in objs)
+        if count and self.verbosity:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {count} in {elapsed:.1f}s ({count / elapsed:.0f} rows/s)'
+            )
+        return pks
+
+    def _seed(self, options):
+        rng = self.rng
+        stamp = f'{int(self.now.timestamp())}-'
+        author, _ = User.objects.get_or_create(username=AUTHOR, defaults={'is_active': False})
+
+        def slug(kind, i):
+            return f'{SLUG_PREFIX}{kind}-{stamp}{i}'
+
+        events = self._insert(Event, options['events'], lambda i: Event(
+            title=_title(rng), slug=slug('event', i), description=_text(rng, 6),
+            date=self.now + timedelta(days=rng.randint(-365, 180), hours=rng.randint(8, 20)),
+            location=rng.choice(PLACES), featured=rng.random() < 0.02, is_active=rng.random() < 0.95,
+        ))
+        stories = self._insert(Story, options['stories'], lambda i: Story(
+            title=_title(rng), slug=slug('story', i), content=_text(rng, 20), author=rng.choice(NAMES),
+            location=rng.choice(PLACES), featured=rng.random() < 0.02, is_active=rng.random() < 0.95,
+        ))
+        posts = self._insert(BlogPost, options['posts'], lambda i: BlogPost(
+            title=_title(rng), slug=slug('post', i), content=_text(rng, 30), excerpt=_text(rng, 2)[:300],
+            author=author, tags=', '.join(rng.sample(WORDS, 3)), featured=rng.random() < 0.02,
+            published=rng.random() < 0.9, is_active=rng.random() < 0.95,
+        ))
+
+        # Comments cluster on a few popular pages, like real traffic
+        targets = [
+            (ContentType.objects.get_for_model(model).pk, pk)
+            for model, pks in ((Event, events), (Story, stories), (BlogPost, posts)) for pk in pks
+        ]
+        rng.shuffle(targets)
+        weights = [1 / (rank + 1) for rank in range(len(targets))]
+        chosen = rng.choices(targets, weights, k=options['comments']) if targets else []
+
+        def comment(i):
+            content_type, object_id = chosen[i] if chosen else (None, None)
+            return Comment(
+                name=rng.choice(NAMES), email=f'visitor{i}@{EMAIL_DOMAIN}', text=_text(rng, rng.randint(1, 4)),
+                content_type_id=content_type, object_id=object_id,
+            )
+
+        self._insert(Comment, options['comments'], comment)
+
+        providers = list(MobileProvider.objects.values_list('pk', flat=True)) or [
+            MobileProvider.objects.create(name=f'Load Mobile {n}').pk for n in range(1, 4)
+        ]
+        banks = list(Bank.objects.values_list('pk', flat=True)) or [
+            Bank.objects.create(name=f'Load Bank {n}').pk for n in range(1, 4)
+        ]
+
+        def donation(i):
+            mobile = rng.random() < 0.7
+            return Donation2(
+                amount=Decimal(rng.choice((5, 10, 20, 50, 100, 250, 1000))) + Decimal(rng.randint(0, 99)) / 100,
+                donor_name=f'{rng.choice(NAMES)} {rng.choice(NAMES)}son', donor_email=f'donor{i}@{EMAIL_DOMAIN}',
+                payment_method='mobile' if mobile else 'bank',
+                mobile_provider_id=rng.choice(providers) if mobile else None,
+                mobile_number=f'0{rng.randint(200000000, 599999999)}' if mobile else None,
+                bank_name_id=None if mobile else rng.choice(banks),
+                frequency=rng.choices(('one_time', 'monthly', 'yearly'), (80, 15, 5))[0],
+                is_anonymous=rng.random() < 0.2,
+            )
+
+        self._insert(Donation2, options['donations'], donation)
+
+    def _clear(self):
+        # A plain DELETE: deleting 100k+ rows one signal at a time takes minutes.
+        # The search index and rollups those signals maintain are rebuilt instead.
+        for model, lookup in (
+            (Comment, {'email__endswith': f'@{EMAIL_DOMAIN}'}),
+            (Donation2, {'donor_email__endswith': f'@{EMAIL_DOMAIN}'}),
+            (BlogPost, {'slug__startswith': SLUG_PREFIX}),
+            (Story, {'slug__startswith': SLUG_PREFIX}),
+            (Event, {'slug__startswith': SLUG_PREFIX}),
+        ):
+            using = router.db_for_write(model)
+            select, params = model.objects.using(using).filter(**lookup).values('pk').query.sql_with_params()
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE {model._meta.pk.column} IN ({select})', params)
+                if self.verbosity:
+                    self.stdout.write(f'{model._meta.verbose_name_plural}: deleted {cursor.rowcount}')
+        for model in search.INDEXES:
+            search.rebuild(model)
+        User.objects.filter(username=AUTHOR, blogpost__isnull=True).delete()
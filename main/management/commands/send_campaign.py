@@ -0,0 +1,56 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.campaigns import CampaignSender, resend_unconfirmed
+from main.models import NewsletterCampaign
+
+
+class Command(BaseCommand):
+    help = 'Send a newsletter campaign to all subscribers, resuming after the last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Sender threads, each with its own SMTP connection')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Maximum messages per second across all workers')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--base-url', default=settings.SITE_URL,
+                            help='Site root for unsubscribe links, e.g. https://gywan.org (default: SITE_URL)')
+        parser.add_argument('--resend-unconfirmed', action='store_true',
+                            help='Resend to recipients a crashed run claimed but never confirmed')
+
+    def handle(self, *args, **options):
+        base_url = urlsplit(options['base_url'])
+        # Mail clients can't follow relative unsubscribe links
+        if base_url.scheme not in ('http', 'https') or not base_url.netloc:
+            raise CommandError('Set SITE_URL or pass --base-url with a scheme and host, e.g. https://gywan.org')
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=options['campaign_id'])
+        except NewsletterCampaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign_id']} does not exist")
+
+        if options['resend_unconfirmed']:
+            released = resend_unconfirmed(campaign)
+            self.stdout.write(f'Released {released} unconfirmed recipient(s)')
+            campaign.refresh_from_db()
+
+        if campaign.status == NewsletterCampaign.STATUS_DONE:
+            self.stdout.write(f'Campaign "{campaign.subject}" has already been sent')
+            return
+
+        sender = CampaignSender(
+            campaign,
+            workers=options['workers'],
+            rate=options['rate'],
+            chunk_size=options['chunk_size'],
+            base_url=options['base_url'],
+            stdout=self.stdout,
+        )
+        metrics = sender.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {metrics['sent']}, failed {metrics['failed']}, skipped {metrics['skipped']} "
+            f"in {metrics['seconds']:.1f}s ({metrics['per_second']:.1f} msg/s)"
+        ))
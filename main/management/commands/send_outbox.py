@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.outbox import Sender
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound email in batches over a reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the due messages and exit instead of polling')
+        parser.add_argument('--idle-close', type=float, default=60.0,
+                            help='Close the SMTP connection after this many idle seconds')
+
+    def handle(self, *args, **options):
+        sender = Sender()
+        idle_since = None
+        try:
+            while True:
+                sent, failed = sender.send_batch(options['batch_size'])
+                if sent or failed:
+                    idle_since = None
+                    self.stdout.write(f'Sent {sent}, failed {failed}')
+                    continue
+                if options['once']:
+                    break
+                idle_since = idle_since or time.monotonic()
+                if sender.connection is not None and time.monotonic() - idle_since > options['idle_close']:
+                    sender.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
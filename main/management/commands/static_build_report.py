@@ -0,0 +1,67 @@
+import json
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Show the per-file build time and compression savings of the last '
+        'collectstatic, from the build cache next to staticfiles.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Files to list, slowest first (0: all)')
+        parser.add_argument('--all', action='store_true', help='Include files reused from the previous build')
+
+    def handle(self, *args, **options):
+        name = getattr(staticfiles_storage, 'build_cache_name', None)
+        if name is None or not staticfiles_storage.manifest_storage.exists(name):
+            raise CommandError('No build cache; run collectstatic with main.storage.OptimizedStaticFilesStorage')
+        with staticfiles_storage.manifest_storage.open(name) as stream:
+            cache = json.loads(stream.read().decode())
+
+        codecs = cache['codecs']
+        files = cache['files']
+        self.stdout.write(
+            f'Built {cache["built"]}, post-processed in {cache["seconds"]:.2f}s, with {", ".join(codecs)} '
+            f'(kept at <= {cache["max_ratio"]:.0%} of the original size)'
+        )
+        self.stdout.write(
+            f'Images: {cache["images_optimized"]} optimised, {cache["images_reused"]} reused; '
+            f'compressed files: {cache["files_compressed"]} compressed, {cache["files_reused"]} reused or copied'
+        )
+
+        total = sum(entry['size'] for entry in files.values())
+        for codec in codecs:
+            # Files a codec didn't pay off for are served as they are
+            served = sum(entry['encoded'][codec] or entry['size'] for entry in files.values())
+            saved = (1 - served / total) if total else 0
+            self.stdout.write(f'  {codec:<5} {total // 1024}K -> {served // 1024}K ({saved:.1%} saved)')
+        image_saved = sum(e['result']['original'] - e['result']['optimized'] for e in cache['images'].values())
+        self.stdout.write(f'  images {image_saved // 1024}K saved by recompression')
+
+        rows = [
+            (path, entry['seconds'], entry['size'], entry['encoded'], entry['status'])
+            for path, entry in files.items()
+        ] + [
+            (path, entry['result'].get('seconds', 0), entry['result']['original'],
+             {'optimized': entry['result']['optimized'], 'webp': entry['result']['webp']},
+             'reused' if entry['reused'] else 'optimized')
+            for path, entry in cache['images'].items()
+        ]
+        if not options['all']:
+            rows = [row for row in rows if row[4] in ('compressed', 'optimized')]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        if options['limit']:
+            rows = rows[:options['limit']]
+
+        self.stdout.write(f'\n{"file":<60} {"ms":>8} {"bytes":>9}  outputs')
+        for path, seconds, size, outputs, status in rows:
+            described = ', '.join(
+                f'{label} {value} ({1 - value / size:.0%})' if value is not None and size else f'{label} skipped'
+                for label, value in outputs.items()
+            )
+            if status not in ('compressed', 'optimized'):
+                described += f' [{status}]'
+            self.stdout.write(f'{path[-60:]:<60} {seconds * 1000:>8.1f} {size:>9}  {described}')
@@ -0,0 +1,299 @@
+"""
+Prometheus metrics shared across worker processes.
+
+Every process adds to its own file of counters in ``METRICS_DIR``, memory
+mapped so an increment is a couple of struct writes, and ``/metrics`` sums
+the files of all processes, including ones that have exited (their counters
+still count). Clear the directory before the server starts (see
+``clear_directory``). Without ``METRICS_DIR`` the counters live in memory,
+which is only right for a single process such as runserver.
+
+Only counters and histograms are kept, so every value aggregates by
+summing; ratios such as the cache hit ratio are left to PromQL.
+"""
+import functools
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .querybudget import ConnectionWrappers, QueryTimer
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+ALLOWED_IPS = set(getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')))
+TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+QUERY_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'django_http_request_duration_seconds': (
+        'histogram', 'Request latency by URL name', LATENCY_BUCKETS),
+    'django_http_responses_total': (
+        'counter', 'Responses by URL name, method and status code', None),
+    'django_db_queries_per_request': (
+        'histogram', 'SQL queries run per request, by URL name', QUERY_COUNT_BUCKETS),
+    'django_db_query_seconds_per_request': (
+        'histogram', 'Time spent in SQL per request, by URL name', QUERY_TIME_BUCKETS),
+    'gywan_cache_requests_total': (
+        'counter', 'Page and homepage section cache lookups by result', None),
+    'gywan_form_submissions_total': (
+        'counter', 'Form submissions by form and outcome', None),
+    'gywan_homepage_section_seconds': (
+        'histogram', 'Homepage section load time by section and outcome', LATENCY_BUCKETS),
+}
+
+
+class MmapStore:
+    """Named float counters in a memory-mapped file, written by one process
+
+    Layout: an 8-byte header holding the bytes used, then entries of a
+    4-byte key length, the UTF-8 key padded to 8-byte alignment and an
+    8-byte double.
+    """
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.INITIAL_SIZE:
+            self._file.truncate(self.INITIAL_SIZE)
+            size = self.INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('q', self._map, 0)[0] or 8
+        self._positions = {key: offset for key, _, offset in self._entries(self._map, self._used)}
+
+    @staticmethod
+    def _entries(data, used):
+        offset = 8
+        while offset < used:
+            length = struct.unpack_from('i', data, offset)[0]
+            padded = length + (-(4 + length) % 8)
+            key = bytes(data[offset + 4:offset + 4 + length]).decode()
+            value_offset = offset + 4 + padded
+            yield key, struct.unpack_from('d', data, value_offset)[0], value_offset
+            offset = value_offset + 8
+
+    @classmethod
+    def read(cls, path):
+        """``{key: value}`` from a store file, e.g. another process's"""
+        with open(path, 'rb') as stream:
+            data = stream.read()
+        if len(data) < 8:
+            return {}
+        used = min(struct.unpack_from('q', data, 0)[0], len(data))
+        return {key: value for key, value, _ in cls._entries(data, used)}
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        padded = encoded + b' ' * (-(4 + len(encoded)) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+        while self._used + len(entry) > len(self._map):
+            size = len(self._map) * 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[self._used:self._used + len(entry)] = entry
+        position = self._used + 4 + len(padded)
+        self._used += len(entry)
+        # Readers only look up to the header, so write it after the entry
+        struct.pack_into('q', self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def inc(self, key, amount=1):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._add_key(key)
+        value = struct.unpack_from('d', self._map, position)[0]
+        struct.pack_into('d', self._map, position, value + amount)
+
+
+class MemoryStore:
+    def __init__(self):
+        self.values = {}
+
+    def inc(self, key, amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+_store = None
+_store_pid = None
+_lock = threading.Lock()
+
+
+def _get_store():
+    global _store, _store_pid
+    # Reopened after a fork, so each worker writes to its own file
+    if _store is None or _store_pid != os.getpid():
+        if METRICS_DIR:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _store = MmapStore(os.path.join(METRICS_DIR, f'metrics_{os.getpid()}.db'))
+        else:
+            _store = MemoryStore()
+        _store_pid = os.getpid()
+    return _store
+
+
+@functools.lru_cache(maxsize=4096)
+def _key(name, labels):
+    return json.dumps([name, sorted(labels)], separators=(',', ':'))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, tuple(labels.items()))
+    with _lock:
+        _get_store().inc(key, amount)
+
+
+def observe(name, value, **labels):
+    """Add ``value`` to a histogram; buckets are stored non-cumulatively"""
+    buckets = METRICS[name][2]
+    bucket = next((str(bound) for bound in buckets if value <= bound), '+Inf')
+    pairs = tuple(labels.items())
+    keys = (_key(name + '_bucket', pairs + (('le', bucket),)), _key(name + '_sum', pairs), _key(name + '_count', pairs))
+    with _lock:
+        store = _get_store()
+        store.inc(keys[0])
+        store.inc(keys[1], value)
+        store.inc(keys[2])
+
+
+def cache_lookup(cache, hit):
+    inc('gywan_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def form_submission(form, valid):
+    inc('gywan_form_submissions_total', form=form, outcome='accepted' if valid else 'rejected')
+
+
+def collect():
+    """``{key: value}`` summed over every process's store"""
+    if not METRICS_DIR:
+        with _lock:
+            return dict(_get_store().values)
+    totals = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.db')):
+        for key, value in MmapStore.read(path).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def clear_directory():
+    """Delete the stores of previous runs; call before starting the workers"""
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.db')):
+            os.remove(path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(values=None):
+    """The Prometheus text exposition format for ``values`` (default: collect())"""
+    series = {}
+    for key, value in (collect() if values is None else values).items():
+        name, pairs = json.loads(key)
+        series.setdefault(name, []).append(([tuple(pair) for pair in pairs], value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for pairs, value in sorted(series.get(name, ())):
+                lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+            continue
+        # Histogram buckets are cumulative in the exposition format
+        counts = {}
+        for pairs, value in series.get(name + '_bucket', ()):
+            labels = tuple(pair for pair in pairs if pair[0] != 'le')
+            bucket = dict(pairs)['le']
+            counts.setdefault(labels, {})[bucket] = value
+        sums = dict((tuple(pairs), value) for pairs, value in series.get(name + '_sum', ()))
+        totals = dict((tuple(pairs), value) for pairs, value in series.get(name + '_count', ()))
+        for labels in sorted(counts):
+            running = 0
+            for bound in [str(bound) for bound in buckets] + ['+Inf']:
+                running += counts[labels].get(bound, 0)
+                lines.append(f'{name}_bucket{_labels(list(labels) + [("le", bound)])} {_number(running)}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(sums.get(labels, 0))}')
+            lines.append(f'{name}_count{_labels(labels)} {_number(totals.get(labels, 0))}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Record latency, status codes, query counts and page cache results"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ConnectionWrappers(timer):
+            response = self.get_response(request)
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        async with ConnectionWrappers(timer):
+            response = await self.get_response(request)
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    def _record(self, request, response, timer, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label so scanners can't blow up the series count
+        url_name = (match.url_name or match.view_name) if match else 'unmatched'
+        observe('django_http_request_duration_seconds', elapsed, url_name=url_name)
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        inc('django_http_responses_total', url_name=url_name, method=method, status=str(response.status_code))
+        observe('django_db_queries_per_request', timer.count, url_name=url_name)
+        observe('django_db_query_seconds_per_request', timer.time, url_name=url_name)
+        page_cache = response.get('X-Page-Cache')
+        if page_cache:
+            cache_lookup('page', page_cache == 'HIT')
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for a bearer token or local scrapers in DEBUG
+
+    Behind a reverse proxy every request comes from the proxy's address, so
+    the address only counts in development.
+    """
+    authorised = bool(TOKEN) and request.headers.get('Authorization') == f'Bearer {TOKEN}'
+    if settings.DEBUG:
+        authorised = authorised or request.META.get('REMOTE_ADDR') in ALLOWED_IPS
+    if not authorised:
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+from main.search import _indexable
+
+
+# (table, indexed columns); see main/search.py
+INDEXES = [
+    ('main_event', ['title', 'description', 'location']),
+    ('main_story', ['title', 'content', 'author']),
+    ('main_blogpost', ['title', 'content', 'tags']),
+]
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, columns in INDEXES:
+        column_list = ', '.join(columns)
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts '
+            f"USING fts5({column_list}, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Stripped of the highlight markers like rows indexed on save
+        placeholders = ', '.join(['%s'] * (len(columns) + 1))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, {column_list} FROM {table}')
+            rows = [[row[0]] + [_indexable(value) for value in row[1:]] for row in cursor.fetchall()]
+            cursor.executemany(f'INSERT INTO {table}_fts (rowid, {column_list}) VALUES ({placeholders})', rows)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, columns in INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_alter_donation2_payment_method'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
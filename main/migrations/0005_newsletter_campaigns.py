@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body_text', models.TextField(help_text='Django template. Per-recipient variables: {{ name }}, {{ email }}, {{ unsubscribe_url }}')),
+                ('body_html', models.TextField(blank=True, help_text='Optional HTML version, same variables')),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('sending', 'Sending'), ('done', 'Done')], default='draft', max_length=10)),
+                ('last_subscriber_id', models.PositiveBigIntegerField(default=0)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Newsletter Campaign',
+                'verbose_name_plural': 'Newsletter Campaigns',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CampaignDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('claimed', 'Claimed'), ('sent', 'Sent'), ('failed', 'Failed')], default='claimed', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='main.newsletter')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='main.newslettercampaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign Delivery',
+                'verbose_name_plural': 'Campaign Deliveries',
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'subscriber'), name='unique_campaign_delivery')],
+            },
+        ),
+    ]
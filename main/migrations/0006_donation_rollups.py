@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_newsletter_campaigns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('payment_method', models.CharField(choices=[('mobile', 'Mobile Money'), ('bank', 'Bank Transfer')], max_length=20)),
+                ('frequency', models.CharField(choices=[('one_time', 'One Time'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], max_length=20)),
+                ('mobile_provider_ref', models.PositiveIntegerField(default=0)),
+                ('bank_ref', models.PositiveIntegerField(default=0)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Donation Rollup',
+                'verbose_name_plural': 'Donation Rollups',
+                'ordering': ['period', 'period_start'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'payment_method', 'frequency', 'mobile_provider_ref', 'bank_ref'), name='unique_donation_rollup')],
+            },
+        ),
+    ]
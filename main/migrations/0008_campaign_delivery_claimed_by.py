@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_content_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigndelivery',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='The sending run that claimed this recipient', max_length=32),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def copy_created_at(apps, schema_editor):
+    Comment = apps.get_model('main', 'Comment')
+    Comment.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_campaign_delivery_claimed_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['updated_at'], name='main_comment_updated_idx'),
+        ),
+    ]
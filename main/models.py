@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
@@ -160,6 +161,10 @@ class Event(BaseModel):
         ordering = ['-date']
         verbose_name = 'Event'
         verbose_name_plural = 'Events'
+        indexes = [
+            # Partial: SQLite can't seek on a bare boolean filter, but matches the condition
+            models.Index(fields=['date'], condition=models.Q(is_active=True), name='main_event_active_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -190,6 +195,9 @@ class Story(BaseModel):
         ordering = ['-created_at']
         verbose_name = 'Story'
         verbose_name_plural = 'Stories'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='main_story_active_recent_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -222,6 +230,11 @@ class BlogPost(BaseModel):
         ordering = ['-created_at']
         verbose_name = 'Blog Post'
         verbose_name_plural = 'Blog Posts'
+        indexes = [
+            models.Index(
+                fields=['created_at'], condition=models.Q(published=True, is_active=True), name='main_blog_live_recent_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -259,6 +272,13 @@ class Resource(BaseModel):
         ordering = ['-created_at']
         verbose_name = 'Resource'
         verbose_name_plural = 'Resources'
+        indexes = [
+            models.Index(
+                fields=['category', 'created_at'], condition=models.Q(is_active=True), name='main_resource_category_idx'
+            ),
+            # The unfiltered list can't use the category index for its ordering
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='main_resource_active_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -313,9 +333,157 @@ class Comment(models.Model):
     email = models.EmailField()
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Part of the conditional GET validators, so edits in the admin show up
+    updated_at = models.DateTimeField(auto_now=True)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
     object_id = models.PositiveIntegerField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'created_at'], name='main_comment_target_idx'),
+            # "Recent comments" on the list pages
+            models.Index(fields=['created_at'], name='main_comment_recent_idx'),
+            # max(updated_at) in the list pages' validators
+            models.Index(fields=['updated_at'], name='main_comment_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.text[:50]}"
+
+
+# Outbound email queue
+class OutboundEmail(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Failed permanently'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField(help_text="Comma-separated recipient addresses")
+    reply_to = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='main_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    def recipients(self):
+        return [address.strip() for address in self.to.split(',') if address.strip()]
+
+
+# Newsletter campaigns
+class NewsletterCampaign(models.Model):
+    STATUS_DRAFT = 'draft'
+    STATUS_SENDING = 'sending'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_DRAFT, 'Draft'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body_text = models.TextField(help_text="Django template. Per-recipient variables: {{ name }}, {{ email }}, {{ unsubscribe_url }}")
+    body_html = models.TextField(blank=True, help_text="Optional HTML version, same variables")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DRAFT)
+    # Highest subscriber id whose chunk has been fully processed
+    last_subscriber_id = models.PositiveBigIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Newsletter Campaign'
+        verbose_name_plural = 'Newsletter Campaigns'
+
+    def __str__(self):
+        return self.subject
+
+
+class CampaignDelivery(models.Model):
+    STATUS_CLAIMED = 'claimed'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_CLAIMED, 'Claimed'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(NewsletterCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='deliveries')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_CLAIMED)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="The sending run that claimed this recipient")
+    error = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Campaign Delivery'
+        verbose_name_plural = 'Campaign Deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'subscriber'], name='unique_campaign_delivery'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} -> {self.subscriber_id} ({self.status})"
+
+
+class DonationRollup(models.Model):
+    """Donation totals per day or month and breakdown, kept in step with Donation2"""
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_MONTH, 'Month'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    payment_method = models.CharField(max_length=20, choices=Donation2.PAYMENT_METHODS)
+    frequency = models.CharField(max_length=20, choices=Donation2.FREQUENCY_CHOICES)
+    # Plain ids rather than foreign keys: 0 means none, which keeps the
+    # unique constraint usable (NULLs never conflict) and lets a provider or
+    # bank be deleted without touching history
+    mobile_provider_ref = models.PositiveIntegerField(default=0)
+    bank_ref = models.PositiveIntegerField(default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['period', 'period_start']
+        verbose_name = 'Donation Rollup'
+        verbose_name_plural = 'Donation Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'payment_method', 'frequency', 'mobile_provider_ref', 'bank_ref'],
+                name='unique_donation_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.period_start}: {self.total_amount} ({self.donation_count})"
@@ -0,0 +1,155 @@
+"""
+Persistent outbox for outgoing email.
+
+Request handlers call ``enqueue`` which only inserts an OutboundEmail row.
+``manage.py send_outbox`` claims due rows in batches and sends them over a
+single reused SMTP connection. Failed messages are retried with exponential
+backoff and marked dead after ``OUTBOX_MAX_ATTEMPTS``. A row left in
+"sending" past ``OUTBOX_LOCK_TIMEOUT`` is requeued and counts as an attempt.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = getattr(settings, 'OUTBOX_BACKOFF_BASE', 60)
+BACKOFF_MAX = getattr(settings, 'OUTBOX_BACKOFF_MAX', 60 * 60 * 6)
+# Rows left in "sending" this long belong to a worker that died
+LOCK_TIMEOUT = getattr(settings, 'OUTBOX_LOCK_TIMEOUT', 60 * 10)
+
+# Errors after which the SMTP connection can't be reused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def enqueue(subject, body, to, from_email=None, reply_to=''):
+    """Queue an email; returns the OutboundEmail row"""
+    if isinstance(to, str):
+        to = [to]
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=', '.join(to),
+        reply_to=reply_to or '',
+    )
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def _release_stale(now):
+    """Requeue rows whose worker died mid-send, counting that as an attempt"""
+    stale = OutboundEmail.objects.filter(
+        status=OutboundEmail.STATUS_SENDING,
+        locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT),
+    )
+    # A message that keeps killing its worker must run out of attempts too
+    fields = dict(attempts=F('attempts') + 1, locked_at=None, last_error='Worker stopped while sending')
+    dead = stale.filter(attempts__gte=MAX_ATTEMPTS - 1).update(status=OutboundEmail.STATUS_DEAD, **fields)
+    if dead:
+        logger.error('Giving up on %d email(s) whose worker stopped while sending', dead)
+    stale.update(status=OutboundEmail.STATUS_QUEUED, next_attempt_at=now, **fields)
+
+
+def claim(batch_size):
+    """Mark up to ``batch_size`` due messages as sending and return them"""
+    now = timezone.now()
+    claimable = Q(status=OutboundEmail.STATUS_QUEUED, next_attempt_at__lte=now)
+    with transaction.atomic():
+        _release_stale(now)
+        ids = list(
+            OutboundEmail.objects.filter(claimable)
+            .order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # Re-checking the condition in the UPDATE keeps concurrent workers
+        # from claiming the same rows
+        OutboundEmail.objects.filter(claimable, pk__in=ids).update(
+            status=OutboundEmail.STATUS_SENDING, locked_at=now
+        )
+        return list(OutboundEmail.objects.filter(pk__in=ids, locked_at=now))
+
+
+def _message(email, connection):
+    return EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients(),
+        reply_to=[email.reply_to] if email.reply_to else None,
+        connection=connection,
+    )
+
+
+def _failed(email, error):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    email.locked_at = None
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboundEmail.STATUS_DEAD
+        logger.error('Giving up on email %s after %d attempts: %s', email.pk, email.attempts, error)
+    else:
+        email.status = OutboundEmail.STATUS_QUEUED
+        email.next_attempt_at = timezone.now() + backoff(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'next_attempt_at'])
+
+
+class Sender:
+    """Send queued email over one SMTP connection kept open across batches"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.connection = None
+
+    def _connection(self):
+        if self.connection is None:
+            self.connection = get_connection(self.backend, fail_silently=False)
+            self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send_batch(self, batch_size=50):
+        """Send one batch; returns (sent, failed)"""
+        emails = claim(batch_size)
+        sent = failed = 0
+        for email in emails:
+            if not email.recipients():
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status=OutboundEmail.STATUS_DEAD, locked_at=None, last_error='No recipients'
+                )
+                failed += 1
+                continue
+            try:
+                connection = self._connection()
+                connection.send_messages([_message(email, connection)])
+            except Exception as exc:
+                if isinstance(exc, CONNECTION_ERRORS):
+                    self.close()
+                _failed(email, exc)
+                failed += 1
+                continue
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                status=OutboundEmail.STATUS_SENT, sent_at=timezone.now(),
+                locked_at=None, attempts=email.attempts + 1, last_error='',
+            )
+            sent += 1
+        return sent, failed
@@ -0,0 +1,224 @@
+"""
+Full-page cache for anonymous visitors, purged by surrogate keys.
+
+Views tag the page they render with what it shows: a model class for "any
+row of this model" (list pages) or an instance for that row (detail pages),
+see ``tag``. Saving or deleting a row purges the keys for its instance and
+for its model once the transaction commits (main/signals.py), so saving a
+blog post only drops that post's page and the pages listing blog posts.
+
+Purging is generational: every surrogate key has a version in the cache,
+a cached page remembers the versions it was stored with, and a purge just
+bumps the version, so no backend support for deleting by tag is needed.
+Versions live in ``PAGE_CACHE_ALIAS`` like the pages, which must therefore
+be shared by every worker process (Redis, memcached, the database or
+files): a purge in one process doesn't reach another's local-memory cache.
+``manage.py check --deploy`` warns about that. The CSRF token in the
+page's forms is stored as a placeholder and filled in per request (the
+"hole"), so pages with forms can still be shared. Responses carry a
+``Surrogate-Key`` header for an upstream proxy.
+"""
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db.models import Model
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from . import conditional
+
+ENABLED = getattr(settings, 'PAGE_CACHE_ENABLED', True)
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+# URL names whose anonymous GETs are cached
+VIEWS = set(getattr(settings, 'PAGE_CACHE_VIEWS', ()))
+# Query parameters that may vary a cached page; anything else bypasses it
+QUERY_PARAMS = set(getattr(settings, 'PAGE_CACHE_QUERY_PARAMS', ('page', 'cursor', 'category')))
+# Cookies whose value varies a cached page
+VARY_COOKIES = tuple(getattr(settings, 'PAGE_CACHE_VARY_COOKIES', ()))
+
+# Rendered in place of the CSRF token in cached pages, see csrf_context
+CSRF_HOLE = 'csrf-hole-8d1f7c2e'
+KEY_PREFIX = 'pagecache'
+CACHED_HEADERS = ('Content-Type', 'Content-Language', 'Surrogate-Key', 'Cache-Control', 'X-Robots-Tag')
+
+
+def _setting_changed(setting, value, **kwargs):
+    # So override_settings(PAGE_CACHE_ENABLED=...) works in tests and commands
+    global ENABLED
+    if setting == 'PAGE_CACHE_ENABLED':
+        ENABLED = True if value is None else value
+
+
+setting_changed.connect(_setting_changed)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(**kwargs):
+    if not ENABLED or not isinstance(get_cache(), LocMemCache):
+        return []
+    return [checks.Warning(
+        'The page cache is in a local-memory cache, so purges only reach the process that made them.',
+        hint='Point PAGE_CACHE_ALIAS at a cache shared by all workers, or set PAGE_CACHE_ENABLED=False.',
+        id='main.W001',
+    )]
+
+
+def surrogate_key(obj):
+    """``main.blogpost`` for a model, ``main.blogpost:42`` for an instance"""
+    if isinstance(obj, str):
+        return obj
+    label = obj._meta.label_lower
+    if isinstance(obj, Model):
+        return f'{label}:{obj.pk}'
+    return label
+
+
+def tag(request, *objects):
+    """Record that the page being rendered shows ``objects``"""
+    keys = getattr(request, 'surrogate_keys', None)
+    if keys is None:
+        keys = request.surrogate_keys = set()
+    keys.update(surrogate_key(obj) for obj in objects)
+
+
+def _version_key(key):
+    return f'{KEY_PREFIX}:key:{key}'
+
+
+def purge(*objects):
+    """Invalidate every cached page tagged with any of ``objects``"""
+    version = time.time_ns()
+    get_cache().set_many({_version_key(surrogate_key(obj)): version for obj in objects}, None)
+
+
+def purge_instance(instance):
+    """Purge pages showing ``instance`` and pages listing its model"""
+    purge(type(instance), instance)
+
+
+def _page_key(request):
+    raw = f'{request.get_host()}{request.path}?{request.GET.urlencode()}'
+    if VARY_COOKIES:
+        raw += ';' + ';'.join(request.COOKIES.get(name, '') for name in VARY_COOKIES)
+    return f'{KEY_PREFIX}:page:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+
+def _is_anonymous(request):
+    if settings.SESSION_COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+        return False
+    # Flash messages are rendered into the page
+    return not len(get_messages(request))
+
+
+def is_cacheable(request, url_name):
+    return (
+        ENABLED
+        and url_name in VIEWS
+        and request.method in ('GET', 'HEAD')
+        and set(request.GET) <= QUERY_PARAMS
+        and _is_anonymous(request)
+    )
+
+
+def csrf_context(request):
+    """Render the placeholder as the CSRF token while a page is being cached"""
+    if getattr(request, 'page_cache_store', False):
+        return {'csrf_token': CSRF_HOLE}
+    return {}
+
+
+def _fill_holes(request, content):
+    if CSRF_HOLE.encode() in content:
+        content = content.replace(CSRF_HOLE.encode(), get_token(request).encode())
+    return content
+
+
+class PageCacheMiddleware:
+    """Serve and store whole pages for anonymous visitors
+
+    Must come after the session, CSRF, auth and messages middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if not getattr(request, 'page_cache_store', False) or response.streaming:
+            return response
+        return self._store(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if not getattr(request, 'page_cache_store', False) or response.streaming:
+            return response
+        # The cache backend may do network I/O
+        return await sync_to_async(self._store)(request, response)
+
+    def _store(self, request, response):
+
+        keys = sorted(getattr(request, 'surrogate_keys', ()))
+        if keys:
+            response['Surrogate-Key'] = ' '.join(keys)
+        if response.status_code == 200 and keys and not response.cookies:
+            cache = get_cache()
+            versions = cache.get_many([_version_key(key) for key in keys])
+            # Keys never purged get a version now, so a later purge changes it
+            missing = {_version_key(key): 0 for key in keys if _version_key(key) not in versions}
+            if missing:
+                cache.set_many(missing, None)
+                versions.update(missing)
+            # A purge while the page was rendering means it may already be stale
+            if max(versions.values()) < request.page_cache_started:
+                cache.set(_page_key(request), {
+                    'content': response.content,
+                    'headers': {name: response[name] for name in CACHED_HEADERS if name in response},
+                    'versions': versions,
+                    'validators': getattr(request, 'conditional_validators', None),
+                }, TIMEOUT)
+        response.content = _fill_holes(request, response.content)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if not is_cacheable(request, match.url_name if match else None):
+            return None
+
+        cache = get_cache()
+        # Revalidations go to the view, which can answer 304 (main/conditional.py)
+        revalidating = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+        entry = None if revalidating else cache.get(_page_key(request))
+        if entry is not None:
+            current = cache.get_many(list(entry['versions']))
+            if current == entry['versions']:
+                response = HttpResponse(_fill_holes(request, entry['content']))
+                for name, value in entry['headers'].items():
+                    response[name] = value
+                if entry.get('validators'):
+                    # The ETag covers the visitor's CSRF secret, so it's made per response
+                    conditional.set_validators(request, response, *entry['validators'])
+                response['X-Page-Cache'] = 'HIT'
+                return response
+
+        if request.method == 'GET':
+            request.page_cache_store = True
+            request.page_cache_started = time.time_ns()
+        return None
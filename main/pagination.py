@@ -0,0 +1,195 @@
+"""
+Keyset (cursor) pagination for the content list views.
+
+Instead of ``OFFSET n`` and a ``COUNT(*)``, each page is fetched with a
+``WHERE (ordering field, id) < (last seen values)`` condition, so page 500
+costs the same as page 1. Cursors are opaque URL-safe tokens. The mode is
+opt-in with ``settings.CURSOR_PAGINATION`` or ``cursor_pagination = True`` on
+a view; offset paging is still used for ranked search results.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(token)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(token)
+    return values, direction
+
+
+class CursorPage:
+    """One page of a keyset-paginated queryset"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on ``ordering`` with the primary key as tiebreaker
+
+    ``ordering`` is a list like ``['-created_at']``; every field must sort in
+    the same direction.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in ordering]
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('Keyset ordering fields must share one direction')
+        self.descending = descending.pop()
+        self.queryset = queryset
+        self.model = queryset.model
+
+    def _order(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [prefix + field for field in self.fields + ['pk']]
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields] + [obj.pk]
+
+    def _serialise(self, obj):
+        values = []
+        for value in self._key(obj):
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _parse(self, values):
+        if len(values) != len(self.fields) + 1:
+            raise InvalidCursor(values)
+        parsed = []
+        for name, value in zip(self.fields + ['pk'], values):
+            field = self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+            try:
+                value = field.to_python(value)
+            except Exception:
+                raise InvalidCursor(values)
+            # Keyset fields are never NULL, and filtering on None raises
+            if value is None:
+                raise InvalidCursor(values)
+            parsed.append(value)
+        return parsed
+
+    def _after(self, values, forward):
+        """Q for rows strictly after ``values`` in (forward) ordering"""
+        lookup = 'lt' if self.descending == forward else 'gt'
+        names = self.fields + ['pk']
+        condition = Q()
+        for i, name in enumerate(names):
+            term = Q(**{f'{name}__{lookup}': values[i]})
+            for prior, value in zip(names[:i], values[:i]):
+                term &= Q(**{prior: value})
+            condition |= term
+        return condition
+
+    def page(self, cursor=None):
+        direction = 'next'
+        values = None
+        if cursor:
+            raw, direction = decode_cursor(cursor)
+            values = self._parse(raw)
+
+        forward = direction == 'next'
+        queryset = self.queryset.order_by(*self._order(reverse=not forward))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, forward))
+
+        # One extra row tells us whether there is another page
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = True, has_more
+
+        next_cursor = encode_cursor(self._serialise(rows[-1]), 'next') if rows and has_next else None
+        previous_cursor = encode_cursor(self._serialise(rows[0]), 'prev') if rows and has_previous else None
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """Use keyset pagination in a ListView when enabled
+
+    Templates get ``cursor_page`` with ``next_query``/``previous_query``
+    strings that keep the other GET parameters; ``is_paginated`` is False so
+    the numbered pager is hidden.
+    """
+    cursor_pagination = None
+    cursor_param = 'cursor'
+
+    def use_cursor_pagination(self):
+        enabled = self.cursor_pagination
+        if enabled is None:
+            enabled = getattr(settings, 'CURSOR_PAGINATION', False)
+        # Ranked search results have no stable keyset order
+        return enabled and not self.request.GET.get('q')
+
+    def get_keyset_ordering(self):
+        return list(self.model._meta.ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_keyset_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_param))
+        except InvalidCursor:
+            page = paginator.page()
+        page.next_query = self._cursor_query(page.next_cursor)
+        page.previous_query = self._cursor_query(page.previous_cursor)
+        self.cursor_page = page
+        return (paginator, page, page.object_list, False)
+
+    def _cursor_query(self, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params[self.cursor_param] = cursor
+        return params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_page'] = getattr(self, 'cursor_page', None)
+        return context
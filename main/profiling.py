@@ -0,0 +1,218 @@
+"""
+Opt-in per-request profiling with Server-Timing and a ring buffer.
+
+``ProfilingMiddleware`` times a sample of requests (``PROFILING_SAMPLE_RATE``)
+split into SQL, template rendering and the rest of the view, sends the split
+in a ``Server-Timing`` header and keeps the most recent samples in a bounded
+in-memory buffer (one per process). With ``PROFILING_CPROFILE`` on, sampled
+requests also run under cProfile and samples slower than
+``PROFILING_SLOW_MS`` keep the report. Staff can browse the buffer at
+/admin/profiling/.
+
+With a sample rate of 0 the middleware removes itself at startup, so
+leaving it in MIDDLEWARE costs nothing.
+"""
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from .querybudget import ConnectionWrappers, QueryTimer
+
+SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+BUFFER_SIZE = getattr(settings, 'PROFILING_BUFFER_SIZE', 500)
+SLOW_MS = getattr(settings, 'PROFILING_SLOW_MS', 500)
+CPROFILE = getattr(settings, 'PROFILING_CPROFILE', False)
+# Lines of cProfile output kept per slow request
+PROFILE_LINES = 40
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+_ids = itertools.count(1)
+# Only one cProfile can run at a time; concurrent samples are only timed
+_profiler_lock = threading.Lock()
+
+
+def record(entry):
+    with _lock:
+        entry['id'] = next(_ids)
+        _buffer.append(entry)
+
+
+def samples():
+    """The buffered samples, newest first"""
+    with _lock:
+        return list(reversed(_buffer))
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def slowest_by_url_name(entries):
+    """Per URL name: sample count, mean and slowest total time, slowest first"""
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry['url_name'] or entry['path'], []).append(entry)
+    summary = [
+        {
+            'url_name': name,
+            'count': len(group),
+            'mean_ms': sum(entry['total_ms'] for entry in group) / len(group),
+            'max_ms': max(entry['total_ms'] for entry in group),
+            'mean_queries': sum(entry['queries'] for entry in group) / len(group),
+            'slowest': max(group, key=lambda entry: entry['total_ms']),
+        }
+        for name, group in groups.items()
+    ]
+    return sorted(summary, key=lambda row: row['max_ms'], reverse=True)
+
+
+class _Sample:
+    def __init__(self):
+        self.sql = QueryTimer()
+        self.template_time = 0.0
+        self.template_sql_time = 0.0
+
+    def start_render(self, response):
+        started = time.perf_counter()
+        sql_before = self.sql.time
+
+        def finish(rendered):
+            self.template_time += time.perf_counter() - started
+            # Lazy querysets run while rendering; count them as SQL only
+            self.template_sql_time += self.sql.time - sql_before
+
+        response.add_post_render_callback(finish)
+
+
+def _profile_report(profiler):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """Time a sample of requests; put it first in MIDDLEWARE to cover the whole stack"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= SAMPLE_RATE:
+            return self.get_response(request)
+
+        sample = request._profiling_sample = _Sample()
+        profiler = None
+        if CPROFILE and _profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with ConnectionWrappers(sample.sql):
+                if profiler is not None:
+                    profiler.enable()
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+        return self._finish(request, response, sample, time.perf_counter() - started, profiler)
+
+    async def __acall__(self, request):
+        if random.random() >= SAMPLE_RATE:
+            return await self.get_response(request)
+
+        # No cProfile: it follows one thread, and an async request moves
+        # between the event loop and its sync thread
+        sample = request._profiling_sample = _Sample()
+        started = time.perf_counter()
+        async with ConnectionWrappers(sample.sql):
+            response = await self.get_response(request)
+        return self._finish(request, response, sample, time.perf_counter() - started, None)
+
+    def _finish(self, request, response, sample, total, profiler):
+        db_ms = sample.sql.time * 1000
+        template_ms = (sample.template_time - sample.template_sql_time) * 1000
+        total_ms = total * 1000
+        view_ms = max(total_ms - db_ms - template_ms, 0)
+        # After any entries the view added (the homepage's sections)
+        response['Server-Timing'] = ', '.join(filter(None, [
+            response.get('Server-Timing'),
+            f'db;dur={db_ms:.1f};desc="{sample.sql.count} queries"',
+            f'tpl;dur={template_ms:.1f};desc="Templates"',
+            f'view;dur={view_ms:.1f};desc="View and middleware"',
+            f'total;dur={total_ms:.1f}',
+        ]))
+
+        match = getattr(request, 'resolver_match', None)
+        record({
+            'time': timezone.now(),
+            'method': request.method,
+            'path': request.get_full_path()[:300],
+            'url_name': match.url_name if match else None,
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'db_ms': db_ms,
+            'queries': sample.sql.count,
+            'template_ms': template_ms,
+            'view_ms': view_ms,
+            'profile': _profile_report(profiler) if profiler is not None and total_ms >= SLOW_MS else None,
+        })
+        return response
+
+    def process_template_response(self, request, response):
+        sample = getattr(request, '_profiling_sample', None)
+        if sample is not None:
+            # Rendering starts once every middleware has seen the response
+            sample.start_render(response)
+        return response
+
+
+def admin_view(request):
+    """Staff page: slowest sampled requests by URL name, with cProfile reports"""
+    if request.method == 'POST':
+        clear()
+        return redirect(request.path)
+
+    entries = samples()
+    selected = None
+    if request.GET.get('id'):
+        selected = next((entry for entry in entries if str(entry['id']) == request.GET['id']), None)
+        if selected is None:
+            raise Http404('Sample no longer in the buffer')
+    context = dict(
+        admin.site.each_context(request),
+        title='Request profiling',
+        sample_rate=SAMPLE_RATE,
+        buffer_size=BUFFER_SIZE,
+        slow_ms=SLOW_MS,
+        cprofile=CPROFILE,
+        summary=slowest_by_url_name(entries),
+        slowest=sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)[:50],
+        sample_count=len(entries),
+        selected=selected,
+    )
+    return TemplateResponse(request, 'admin/profiling.html', context)
@@ -0,0 +1,262 @@
+"""
+Per-request SQL query recording, N+1 detection and query budgets.
+
+``QueryBudgetMiddleware`` records every query run while handling a request,
+groups them by shape (the SQL with literals stripped) and logs repeated shapes
+together with the template line that triggered them. Budgets are declared per
+URL name in ``settings.QUERY_BUDGETS``; ``assert_query_budget`` fails a test
+when a page goes over its budget.
+"""
+import logging
+import re
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve, reverse
+
+logger = logging.getLogger('main.querybudget')
+
+# Same-shape queries repeated this many times in one request count as N+1
+NPLUSONE_THRESHOLD = getattr(settings, 'QUERY_BUDGET_NPLUSONE_THRESHOLD', 3)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+
+
+def query_shape(sql):
+    """Normalise ``sql`` so queries differing only in parameters compare equal"""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return ' '.join(shape.split())
+
+
+def _origin():
+    """Return the template line or project source line running the query"""
+    # Skip record() and QueryTimer.__call__
+    frame = sys._getframe(3)
+    source = None
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if source is None and filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename:
+            if not filename.endswith('querybudget.py'):
+                source = f'{filename}:{frame.f_lineno}'
+        frame = frame.f_back
+    return source
+
+
+class ConnectionWrappers:
+    """Install the execute wrapper ``wrapper`` on every database connection
+
+    Use ``with`` in sync code and ``async with`` in async code. Connections
+    belong to threads, and the ORM calls of an async request run in the
+    request's sync thread (see asgiref's thread_sensitive), so the async
+    form installs the wrapper there.
+    """
+
+    def __init__(self, wrapper, aliases=None):
+        self.wrapper = wrapper
+        self.aliases = list(aliases or connections)
+        self._contexts = []
+
+    def __enter__(self):
+        for alias in self.aliases:
+            context = connections[alias].execute_wrapper(self.wrapper)
+            context.__enter__()
+            self._contexts.append(context)
+        return self.wrapper
+
+    def __exit__(self, *exc_info):
+        while self._contexts:
+            self._contexts.pop().__exit__(*exc_info)
+
+    async def __aenter__(self):
+        return await sync_to_async(self.__enter__)()
+
+    async def __aexit__(self, *exc_info):
+        await sync_to_async(self.__exit__)(*exc_info)
+
+
+class QueryTimer:
+    """execute_wrapper counting queries and adding up their time
+
+    Install it with ``ConnectionWrappers``; subclasses override ``record``
+    to keep more than the totals.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.time += elapsed
+            self.record(sql, params, elapsed)
+
+    def record(self, sql, params, elapsed):
+        pass
+
+
+class QueryRecorder(QueryTimer):
+    """Collect the queries run on every database connection"""
+
+    def __init__(self, using=None):
+        super().__init__()
+        self.queries = []
+        self._wrappers = ConnectionWrappers(self, [using] if using else None)
+
+    def record(self, sql, params, elapsed):
+        self.queries.append({
+            'sql': sql,
+            'params': params,
+            'shape': query_shape(sql),
+            'time': elapsed,
+            'origin': _origin(),
+        })
+
+    def __enter__(self):
+        self._wrappers.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrappers.__exit__(*exc_info)
+
+    async def __aenter__(self):
+        await self._wrappers.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._wrappers.__aexit__(*exc_info)
+
+    @property
+    def total_time(self):
+        return self.time
+
+    def repeated(self, threshold=None):
+        """Return ``{shape: [queries]}`` for shapes run at least ``threshold`` times"""
+        threshold = threshold or NPLUSONE_THRESHOLD
+        groups = OrderedDict()
+        for query in self.queries:
+            groups.setdefault(query['shape'], []).append(query)
+        return OrderedDict(
+            (shape, queries) for shape, queries in groups.items() if len(queries) >= threshold
+        )
+
+    def report(self, threshold=None):
+        lines = [f'{self.count} queries in {self.total_time * 1000:.1f}ms']
+        for shape, queries in self.repeated(threshold).items():
+            origins = sorted({query['origin'] or 'unknown' for query in queries})
+            lines.append(f'  N+1: {len(queries)}x {shape[:200]}')
+            lines.extend(f'    from {origin}' for origin in origins)
+        return '\n'.join(lines)
+
+
+def is_recording():
+    """Whether a QueryRecorder is collecting this thread's queries"""
+    return any(
+        isinstance(wrapper, QueryRecorder)
+        for alias in connections
+        for wrapper in connections[alias].execute_wrappers
+    )
+
+
+def get_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """Log query counts, N+1 patterns and budget overruns for each request
+
+    Enabled by ``settings.QUERY_BUDGET_ENABLED`` (defaults to ``DEBUG``).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self._check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        async with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self._check(request, response, recorder)
+
+    def _check(self, request, response, recorder):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        # Budgets describe page views; form posts are only checked for N+1
+        budget = get_budget(url_name) if request.method in ('GET', 'HEAD') else None
+        response['X-Query-Count'] = str(recorder.count)
+
+        if recorder.repeated():
+            logger.warning('Repeated queries on %s (%s)\n%s', request.path, url_name, recorder.report())
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                'Query budget exceeded on %s (%s): %d > %d\n%s',
+                request.path, url_name, recorder.count, budget, recorder.report()
+            )
+        return response
+
+
+@contextmanager
+def query_budget(budget, label='block', threshold=None, allow_repeated=False):
+    """Fail with AssertionError if the block runs more than ``budget`` queries
+
+    Repeated same-shape queries also fail unless ``allow_repeated`` is set.
+    """
+    with QueryRecorder() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise AssertionError(
+            f'{label} ran {recorder.count} queries, budget is {budget}\n{recorder.report(threshold)}'
+        )
+    if not allow_repeated and recorder.repeated(threshold):
+        raise AssertionError(f'{label} has repeated queries\n{recorder.report(threshold)}')
+
+
+def assert_query_budget(client, url_name, *args, method='get', data=None, **kwargs):
+    """Request ``url_name`` with a test client and check it against its budget
+
+    Usage in a TestCase::
+
+        assert_query_budget(self.client, 'blog_detail', slug=post.slug)
+    """
+    path = reverse(url_name, args=args or None, kwargs=kwargs or None)
+    budget = get_budget(resolve(path).url_name)
+    if budget is None:
+        raise AssertionError(f'No query budget declared for {url_name!r} in QUERY_BUDGETS')
+    with query_budget(budget, label=path):
+        response = getattr(client, method)(path, data)
+    return response
@@ -0,0 +1,198 @@
+"""
+Incrementally maintained donation rollups.
+
+Every Donation2 save or delete adjusts the matching day and month rows of
+DonationRollup (one per payment method, frequency and provider/bank), so the
+admin dashboard only reads rollup rows: its cost depends on the date range
+shown, not on how many donations there are. Queryset ``update()``,
+``bulk_create()`` and raw SQL bypass the signals; run
+``manage.py rebuild_donation_rollups`` after those.
+"""
+import logging
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Bank, Donation2, DonationRollup, MobileProvider
+
+logger = logging.getLogger(__name__)
+
+DAY = DonationRollup.PERIOD_DAY
+MONTH = DonationRollup.PERIOD_MONTH
+
+
+def snapshot(donation):
+    """What ``donation`` contributes to the rollups, as a hashable tuple"""
+    if donation.created_at is None:
+        return None
+    return (
+        timezone.localdate(donation.created_at),
+        donation.payment_method,
+        donation.frequency,
+        donation.mobile_provider_id or 0,
+        donation.bank_name_id or 0,
+        Decimal(donation.amount),
+    )
+
+
+def _keys(snap):
+    day, payment_method, frequency, provider, bank, _ = snap
+    dimensions = {
+        'payment_method': payment_method,
+        'frequency': frequency,
+        'mobile_provider_ref': provider,
+        'bank_ref': bank,
+    }
+    return [
+        dict(dimensions, period=DAY, period_start=day),
+        dict(dimensions, period=MONTH, period_start=day.replace(day=1)),
+    ]
+
+
+def adjust(snap, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) one donation from the rollups"""
+    if snap is None:
+        return
+    amount = snap[-1] * sign
+    with transaction.atomic():
+        for key in _keys(snap):
+            rows = DonationRollup.objects.filter(**key)
+            updated = rows.update(
+                donation_count=F('donation_count') + sign,
+                total_amount=F('total_amount') + amount,
+            )
+            if updated:
+                if sign < 0:
+                    rows.filter(donation_count__lte=0).delete()
+                continue
+            if sign < 0:
+                logger.warning('Donation rollup %s missing; run rebuild_donation_rollups', key)
+                continue
+            try:
+                with transaction.atomic():
+                    DonationRollup.objects.create(**key, donation_count=1, total_amount=amount)
+            except IntegrityError:
+                # Another request created the row first
+                rows.update(donation_count=F('donation_count') + 1, total_amount=F('total_amount') + amount)
+
+
+def rebuild(batch_size=1000):
+    """Recompute all rollups from Donation2; returns the number of rows written"""
+    written = 0
+    with transaction.atomic():
+        DonationRollup.objects.all().delete()
+        for period, trunc in ((DAY, TruncDate), (MONTH, TruncMonth)):
+            kwargs = {} if trunc is TruncDate else {'output_field': DateField()}
+            groups = (
+                Donation2.objects
+                .annotate(period_start=trunc('created_at', **kwargs))
+                .values('period_start', 'payment_method', 'frequency', 'mobile_provider', 'bank_name')
+                .annotate(donation_count=Count('pk'), total_amount=Sum('amount'))
+                .order_by()
+            )
+            batch = []
+            for group in groups.iterator(chunk_size=batch_size):
+                batch.append(DonationRollup(
+                    period=period,
+                    period_start=group['period_start'],
+                    payment_method=group['payment_method'],
+                    frequency=group['frequency'],
+                    mobile_provider_ref=group['mobile_provider'] or 0,
+                    bank_ref=group['bank_name'] or 0,
+                    donation_count=group['donation_count'],
+                    total_amount=group['total_amount'] or 0,
+                ))
+                if len(batch) >= batch_size:
+                    DonationRollup.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            DonationRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def period_range(period, span, today=None):
+    """First period start of the last ``span`` days or months, ending today"""
+    today = today or timezone.localdate()
+    if period == DAY:
+        return date.fromordinal(today.toordinal() - span + 1), today
+    month_index = today.year * 12 + today.month - 1 - (span - 1)
+    return date(month_index // 12, month_index % 12 + 1, 1), today.replace(day=1)
+
+
+def _totals():
+    return {'count': 0, 'amount': Decimal('0')}
+
+
+def _add(bucket, row):
+    bucket['count'] += row.donation_count
+    bucket['amount'] += row.total_amount
+
+
+def dashboard(period=MONTH, span=12):
+    """Totals for the dashboard, read from the rollups only
+
+    Returns a dict with a per-period series and breakdowns by payment
+    method, frequency and provider/bank over the same range.
+    """
+    start, end = period_range(period, span)
+    rows = list(DonationRollup.objects.filter(period=period, period_start__gte=start, period_start__lte=end))
+
+    series = OrderedDict()
+    cursor = start
+    while cursor <= end:
+        series[cursor] = _totals()
+        if period == DAY:
+            cursor = date.fromordinal(cursor.toordinal() + 1)
+        else:
+            cursor = date(cursor.year + cursor.month // 12, cursor.month % 12 + 1, 1)
+
+    methods = dict(Donation2.PAYMENT_METHODS)
+    frequencies = dict(Donation2.FREQUENCY_CHOICES)
+    by_method, by_frequency, by_channel = {}, {}, {}
+    total = _totals()
+    for row in rows:
+        _add(series.setdefault(row.period_start, _totals()), row)
+        _add(by_method.setdefault(methods.get(row.payment_method, row.payment_method), _totals()), row)
+        _add(by_frequency.setdefault(frequencies.get(row.frequency, row.frequency), _totals()), row)
+        _add(by_channel.setdefault((row.mobile_provider_ref, row.bank_ref), _totals()), row)
+        _add(total, row)
+
+    providers = dict(MobileProvider.objects.filter(
+        pk__in={provider for provider, _ in by_channel if provider}).values_list('pk', 'name'))
+    banks = dict(Bank.objects.filter(pk__in={bank for _, bank in by_channel if bank}).values_list('pk', 'name'))
+    channels = {}
+    for (provider, bank), bucket in by_channel.items():
+        if provider:
+            label = providers.get(provider, f'Provider #{provider}')
+        elif bank:
+            label = banks.get(bank, f'Bank #{bank}')
+        else:
+            label = 'Not specified'
+        channels.setdefault(label, _totals())
+        channels[label]['count'] += bucket['count']
+        channels[label]['amount'] += bucket['amount']
+
+    peak = max((bucket['amount'] for bucket in series.values()), default=0) or 1
+    for bucket in series.values():
+        bucket['percent'] = round(bucket['amount'] / peak * 100)
+
+    def ordered(buckets):
+        return sorted(buckets.items(), key=lambda item: item[1]['amount'], reverse=True)
+
+    return {
+        'period': period,
+        'span': span,
+        'start': start,
+        'end': end,
+        'total': total,
+        'series': list(series.items()),
+        'by_method': ordered(by_method),
+        'by_frequency': ordered(by_frequency),
+        'by_channel': ordered(channels),
+    }
@@ -0,0 +1,215 @@
+"""
+Full-text search backed by SQLite FTS5.
+
+Each searchable model gets a ``<table>_fts`` virtual table whose rowid is the
+model's primary key. Rows are written on save and removed on delete (see
+main/signals.py); ``manage.py rebuild_search_index`` rebuilds them from
+scratch. On databases without FTS5 the views fall back to ``icontains``.
+"""
+import re
+
+from django.db import NotSupportedError, connections, router
+from django.db.models import Q
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from .models import Event, Story, BlogPost
+
+
+# Markers wrapped around matched terms by snippet(); ``highlight_html`` escapes
+# the text around them and turns them into <mark> tags. They are stripped from
+# indexed text so only snippet() can produce them.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+_MARKERS = re.compile(f'[{HIGHLIGHT_START}{HIGHLIGHT_END}]')
+_HIGHLIGHTED = re.compile(f'{HIGHLIGHT_START}(.*?){HIGHLIGHT_END}', re.S)
+
+SNIPPET_TOKENS = 24
+
+
+class SearchIndex:
+    """FTS5 index over a few text fields of a model"""
+
+    def __init__(self, model, fields, snippet_field):
+        self.model = model
+        self.fields = tuple(fields)
+        # Column used for the highlighted snippet
+        self.snippet_column = self.fields.index(snippet_field)
+
+    @property
+    def table(self):
+        return f'{self.model._meta.db_table}_fts'
+
+    def create_sql(self):
+        columns = ', '.join(self.fields)
+        return (
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+            f"USING fts5({columns}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop_sql(self):
+        return f'DROP TABLE IF EXISTS {self.table}'
+
+    def values(self, instance):
+        return [_indexable(getattr(instance, field)) for field in self.fields]
+
+    def icontains_q(self, query):
+        condition = Q()
+        for field in self.fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return condition
+
+
+INDEXES = {
+    Event: SearchIndex(Event, ['title', 'description', 'location'], 'description'),
+    Story: SearchIndex(Story, ['title', 'content', 'author'], 'content'),
+    BlogPost: SearchIndex(BlogPost, ['title', 'content', 'tags'], 'content'),
+}
+
+
+def _indexable(value):
+    return _MARKERS.sub('', value or '')
+
+
+def _connection(model, write=False):
+    alias = router.db_for_write(model) if write else router.db_for_read(model)
+    return connections[alias]
+
+
+# (database alias, table) pairs known to exist, so the introspection query
+# only runs until the table has been seen once
+_known_tables = set()
+
+
+def is_available(model):
+    """True when ``model`` has an FTS5 table on its database"""
+    if model not in INDEXES:
+        return False
+    connection = _connection(model)
+    if connection.vendor != 'sqlite':
+        return False
+    key = (connection.alias, INDEXES[model].table)
+    if key not in _known_tables:
+        if key[1] not in connection.introspection.table_names():
+            return False
+        _known_tables.add(key)
+    return True
+
+
+def index_instance(instance):
+    index = INDEXES[type(instance)]
+    connection = _connection(index.model, write=True)
+    if connection.vendor != 'sqlite':
+        return
+    placeholders = ', '.join(['%s'] * (len(index.fields) + 1))
+    columns = ', '.join(index.fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {index.table} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {index.table} (rowid, {columns}) VALUES ({placeholders})',
+            [instance.pk] + index.values(instance)
+        )
+
+
+def index_instances(model, instances):
+    """Index many new rows at once, e.g. after bulk_create (which sends no signals)"""
+    index = INDEXES.get(model)
+    if index is None or not instances:
+        return
+    connection = _connection(model, write=True)
+    if connection.vendor != 'sqlite':
+        return
+    placeholders = ', '.join(['%s'] * (len(index.fields) + 1))
+    columns = ', '.join(index.fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {index.table} (rowid, {columns}) VALUES ({placeholders})',
+            [[instance.pk] + index.values(instance) for instance in instances]
+        )
+
+
+def remove_instance(instance):
+    index = INDEXES[type(instance)]
+    connection = _connection(index.model, write=True)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {index.table} WHERE rowid = %s', [instance.pk])
+
+
+def rebuild(model, batch_size=1000):
+    """Repopulate the index of ``model``; returns the number of rows indexed"""
+    index = INDEXES[model]
+    connection = _connection(model, write=True)
+    if connection.vendor != 'sqlite':
+        raise NotSupportedError(
+            f'The search index needs SQLite FTS5, but {model._meta.label} is stored '
+            f'in {connection.alias!r} ({connection.vendor})'
+        )
+    columns = ', '.join(index.fields)
+    placeholders = ', '.join(['%s'] * (len(index.fields) + 1))
+    insert = f'INSERT INTO {index.table} (rowid, {columns}) VALUES ({placeholders})'
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(index.drop_sql())
+        cursor.execute(index.create_sql())
+        rows = model.objects.values_list('pk', *index.fields).iterator(chunk_size=batch_size)
+        batch = []
+        for row in rows:
+            batch.append([row[0]] + [_indexable(value) for value in row[1:]])
+            if len(batch) >= batch_size:
+                cursor.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert, batch)
+            count += len(batch)
+        cursor.execute(f"INSERT INTO {index.table} ({index.table}) VALUES ('optimize')")
+    return count
+
+
+def highlight_html(snippet):
+    """Escape a snippet(), then wrap the terms it marked in <mark>"""
+    # split() alternates between plain text and matched terms
+    parts = [_MARKERS.sub('', part) for part in _HIGHLIGHTED.split(snippet)]
+    return mark_safe(''.join(
+        format_html('<mark>{}</mark>', part) if i % 2 else escape(part)
+        for i, part in enumerate(parts)
+    ))
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query of prefix-matched terms
+
+    Quoting every term keeps FTS5 operators and punctuation typed by visitors
+    from being parsed as query syntax.
+    """
+    terms = re.findall(r'\w+', query)
+    return ' '.join('"%s"*' % term for term in terms)
+
+
+def search(queryset, query):
+    """Filter ``queryset`` by ``query``, ranked by BM25
+
+    Matching objects get ``search_rank`` (lower is better) and
+    ``search_snippet`` attributes. Falls back to ``icontains`` filtering when
+    FTS5 is unavailable.
+    """
+    model = queryset.model
+    index = INDEXES[model]
+    expression = match_expression(query)
+    if not expression or not is_available(model):
+        return queryset.filter(index.icontains_q(query))
+
+    table = index.table
+    base = model._meta.db_table
+    snippet = (
+        f"snippet({table}, {index.snippet_column}, '{HIGHLIGHT_START}', "
+        f"'{HIGHLIGHT_END}', '…', {SNIPPET_TOKENS})"
+    )
+    return queryset.extra(
+        tables=[table],
+        where=[f'{table}.rowid = {base}.id', f'{table} MATCH %s'],
+        params=[expression],
+        select={'search_rank': f'bm25({table})', 'search_snippet': snippet},
+    ).order_by('search_rank')
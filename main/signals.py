@@ -0,0 +1,91 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+
+from . import homepage, pagecache, rollups, search
+from .models import (
+    Announcement, BlogPost, Comment, Donation2, Event, ImpactStat, Resource, Story, Supporter, TeamMember,
+    Testimonial,
+)
+
+
+def invalidate_homepage_section(sender, using, **kwargs):
+    """Drop only the homepage sections that show ``sender``"""
+    # Once committed, or a request in between would cache the old rows again
+    transaction.on_commit(partial(homepage.invalidate_model, sender), using=using)
+
+
+for _model in homepage.section_models():
+    post_save.connect(invalidate_homepage_section, sender=_model, dispatch_uid=f'homepage_save_{_model.__name__}')
+    post_delete.connect(invalidate_homepage_section, sender=_model, dispatch_uid=f'homepage_delete_{_model.__name__}')
+
+
+def update_search_index(sender, instance, **kwargs):
+    search.index_instance(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_instance(instance)
+
+
+for _model in search.INDEXES:
+    post_save.connect(update_search_index, sender=_model, dispatch_uid=f'search_save_{_model.__name__}')
+    post_delete.connect(remove_from_search_index, sender=_model, dispatch_uid=f'search_delete_{_model.__name__}')
+
+
+def remember_donation_rollup(sender, instance, raw=False, **kwargs):
+    """Keep what an edited donation counted as, to move it between rollups"""
+    if raw or instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    instance._rollup_snapshot = rollups.snapshot(previous) if previous else None
+
+
+def update_donation_rollups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = rollups.snapshot(instance)
+    previous = None if created else getattr(instance, '_rollup_snapshot', None)
+    if previous != current:
+        rollups.adjust(previous, -1)
+        rollups.adjust(current, 1)
+    instance._rollup_snapshot = current
+
+
+def remove_donation_from_rollups(sender, instance, **kwargs):
+    rollups.adjust(rollups.snapshot(instance), -1)
+
+
+pre_save.connect(remember_donation_rollup, sender=Donation2, dispatch_uid='rollup_pre_save_donation')
+post_save.connect(update_donation_rollups, sender=Donation2, dispatch_uid='rollup_save_donation')
+post_delete.connect(remove_donation_from_rollups, sender=Donation2, dispatch_uid='rollup_delete_donation')
+
+
+# Models shown on cached pages (main/pagecache.py)
+PAGE_CACHE_MODELS = (
+    Announcement, BlogPost, Event, ImpactStat, Resource, Story, Supporter, TeamMember, Testimonial,
+)
+
+
+def purge_cached_pages(sender, instance, using, **kwargs):
+    # Purge once committed: a page rendered before that would read the old
+    # row and be stored under the new versions, staying stale until it expires
+    transaction.on_commit(partial(pagecache.purge_instance, instance), using=using)
+
+
+def purge_commented_page(sender, instance, using, **kwargs):
+    """A comment changes its list pages and the page of what it's on"""
+    targets = [Comment]
+    if instance.content_type_id and instance.object_id:
+        model = instance.content_type.model_class()
+        if model is not None:
+            targets.append(f'{model._meta.label_lower}:{instance.object_id}')
+    transaction.on_commit(partial(pagecache.purge, *targets), using=using)
+
+
+for _model in PAGE_CACHE_MODELS:
+    post_save.connect(purge_cached_pages, sender=_model, dispatch_uid=f'pagecache_save_{_model.__name__}')
+    post_delete.connect(purge_cached_pages, sender=_model, dispatch_uid=f'pagecache_delete_{_model.__name__}')
+post_save.connect(purge_commented_page, sender=Comment, dispatch_uid='pagecache_save_Comment')
+post_delete.connect(purge_commented_page, sender=Comment, dispatch_uid='pagecache_delete_Comment')
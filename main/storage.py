@@ -0,0 +1,462 @@
+"""
+Static files storage with bundling, image optimisation and incremental,
+parallel precompression.
+
+First the CSS/JS bundles and critical CSS of ``main.assets`` are built into
+``bundles/``, to be hashed and compressed with everything else.
+
+During ``collectstatic`` every PNG/JPEG is recompressed before it's hashed:
+PNGs losslessly, JPEGs re-encoded with their own quantisation tables
+(``quality='keep'``), both without EXIF or text metadata. A ``.webp``
+sibling is written next to each image when it comes out smaller, and the
+``{% static_image %}`` tag offers it in a ``<picture>``. The work
+runs in a process pool, and the per-file savings are stored under
+``optimized_images`` in staticfiles.json.
+
+Compressible files then get ``.br``, ``.zst`` and ``.gz`` siblings, each
+codec that is installed running in a process pool and kept only when it
+shrinks the file to ``STATIC_COMPRESS_MAX_RATIO`` of its size or less.
+Brotli and zstandard are in requirements.txt; collectstatic warns about
+either one that is missing.
+
+Both stages are incremental: a build cache next to the manifest
+(``STATIC_BUILD_CACHE``) records the SHA-256 of every source image and
+compressed file, and files whose content and outputs are unchanged since
+the previous build are reused rather than reprocessed. The cache also holds
+the per-file build time and savings of the latest build; see the
+``static_build_report`` command.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from wsgiref.headers import Headers
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import MissingFileError, StaticFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from main import assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard
+    except ImportError:
+        zstd = None
+    else:
+        class zstd:
+            @staticmethod
+            def compress(data, level):
+                return zstandard.ZstdCompressor(level=level).compress(data)
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZABLE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+WEBP_QUALITY = 80
+BUILD_CACHE_VERSION = 1
+
+
+def _gzip(data):
+    # mtime=0 so the output only depends on the content
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# Content-Encoding: (file suffix, compress function), for the installed codecs
+CODECS = {
+    name: (suffix, function)
+    for name, suffix, function in (
+        ('br', '.br', brotli and (lambda data: brotli.compress(data, quality=11))),
+        ('zstd', '.zst', zstd and (lambda data: zstd.compress(data, level=19))),
+        ('gzip', '.gz', _gzip),
+    )
+    if function
+}
+# Codecs whose package isn't installed: (Content-Encoding, package in requirements.txt)
+SKIPPED_CODECS = [(name, package) for name, package in (('br', 'Brotli'), ('zstd', 'zstandard')) if name not in CODECS]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compress_file(path, codecs, max_ratio):
+    """Write a compressed sibling of ``path`` for each codec that pays off
+
+    Siblings left from earlier builds are removed for codecs that don't.
+    Returns the size, ``{codec: compressed size or None}`` and the time
+    taken. Runs in a worker process.
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        stat_result = os.fstat(stream.fileno())
+        data = stream.read()
+    size = len(data)
+    encoded = {}
+    for codec in codecs:
+        suffix, function = CODECS[codec]
+        compressed = function(data)
+        target = path + suffix
+        if size and len(compressed) <= size * max_ratio:
+            with open(target, 'wb') as stream:
+                stream.write(compressed)
+            os.utime(target, (stat_result.st_atime, stat_result.st_mtime))
+            encoded[codec] = len(compressed)
+        else:
+            encoded[codec] = None
+            if os.path.exists(target):
+                os.remove(target)
+    return {'size': size, 'encoded': encoded, 'seconds': time.perf_counter() - started}
+
+
+def optimize_image(path):
+    """Recompress the image at ``path`` in place and write a WebP sibling
+
+    Returns a dict of byte sizes. Runs in a worker process.
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    original_size = os.path.getsize(path)
+    result = {'original': original_size, 'optimized': original_size, 'webp': None, 'seconds': 0.0}
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    with Image.open(path) as image:
+        image.load()
+        fmt = image.format
+        icc_profile = image.info.get('icc_profile')
+        options = {'optimize': True}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        if fmt == 'JPEG':
+            options.update(quality='keep', progressive=True)
+            if image.mode in ('RGB', 'L', 'CMYK'):
+                options['subsampling'] = 'keep'
+        elif fmt != 'PNG':
+            return result
+
+        # exif/pnginfo aren't passed on, so that metadata is dropped
+        image.save(tmp_path, format=fmt, **options)
+        optimized_size = os.path.getsize(tmp_path)
+        if optimized_size < original_size:
+            os.replace(tmp_path, path)
+            result['optimized'] = optimized_size
+        else:
+            os.remove(tmp_path)
+
+        webp_path = f'{path}.webp'
+        webp_options = {'quality': WEBP_QUALITY, 'method': 6}
+        if fmt == 'PNG':
+            # Keep logos and illustrations crisp
+            webp_options = {'lossless': True, 'method': 6}
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        image.save(tmp_path, format='WEBP', **webp_options)
+        webp_size = os.path.getsize(tmp_path)
+        if webp_size < result['optimized']:
+            os.replace(tmp_path, webp_path)
+            result['webp'] = webp_size
+        else:
+            os.remove(tmp_path)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """CompressedManifestStaticFilesStorage that optimises images first and
+    only reprocesses files that changed since the previous build"""
+
+    image_workers = getattr(settings, 'STATIC_IMAGE_WORKERS', None)
+    compress_workers = getattr(settings, 'STATIC_COMPRESS_WORKERS', None)
+    compress_max_ratio = getattr(settings, 'STATIC_COMPRESS_MAX_RATIO', 0.95)
+    build_cache_name = getattr(settings, 'STATIC_BUILD_CACHE', 'staticfiles.build.json')
+
+    def post_process(self, paths, dry_run=False, **options):
+        self.image_report = {}
+        self.build_cache = self.load_build_cache()
+        self.build_images = {}
+        self.build_started = time.perf_counter()
+        if not dry_run:
+            paths = self.build_bundles(paths)
+            paths = self.optimize_images(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def load_build_cache(self):
+        """The previous build's cache, or an empty one if it's missing or stale"""
+        empty = {'images': {}, 'files': {}}
+        if not self.manifest_storage.exists(self.build_cache_name):
+            return empty
+        try:
+            with self.manifest_storage.open(self.build_cache_name) as stream:
+                cache = json.loads(stream.read().decode())
+        except ValueError:
+            return empty
+        if cache.get('version') != BUILD_CACHE_VERSION:
+            return empty
+        if cache.get('codecs') != list(CODECS) or cache.get('max_ratio') != self.compress_max_ratio:
+            # Compressed outputs depend on these; images don't
+            cache['files'] = {}
+        return cache
+
+    def save_build_cache(self, files):
+        images = self.build_images
+        payload = {
+            'version': BUILD_CACHE_VERSION,
+            'built': timezone.now().isoformat(),
+            'seconds': round(time.perf_counter() - getattr(self, 'build_started', time.perf_counter()), 3),
+            'codecs': list(CODECS),
+            'max_ratio': self.compress_max_ratio,
+            'images': images,
+            'files': files,
+            'images_optimized': sum(1 for entry in images.values() if not entry['reused']),
+            'images_reused': sum(1 for entry in images.values() if entry['reused']),
+            'files_compressed': sum(1 for entry in files.values() if entry['status'] == 'compressed'),
+            'files_reused': sum(1 for entry in files.values() if entry['status'] != 'compressed'),
+        }
+        if self.manifest_storage.exists(self.build_cache_name):
+            self.manifest_storage.delete(self.build_cache_name)
+        self.manifest_storage._save(self.build_cache_name, ContentFile(json.dumps(payload, indent=1).encode()))
+
+    def build_bundles(self, paths):
+        """Save the ASSET_BUNDLES and CRITICAL_CSS files and add them to ``paths``"""
+        paths = dict(paths)
+        built = {}
+        for name, sources in assets.BUNDLES.items():
+            texts = []
+            for source in sources:
+                if source not in paths:
+                    raise ImproperlyConfigured(f'Bundle {name!r}: {source!r} is not a static file')
+                storage, path = paths[source]
+                with storage.open(path) as stream:
+                    texts.append((source, stream.read().decode()))
+            built[name] = assets.build(name, texts)
+            self._save_generated(assets.bundle_name(name), built[name], paths)
+        for page, config in assets.CRITICAL_CSS.items():
+            markup = assets.above_the_fold(config['templates'])
+            css = assets.critical_css(built[config['bundle']], markup, source=assets.bundle_name(config['bundle']))
+            self._save_generated(assets.critical_name(page), css, paths)
+        return paths
+
+    def _save_generated(self, name, text, paths):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(text.encode()))
+        paths[name] = (self, name)
+
+    def optimize_images(self, paths):
+        """Optimise collected images and point ``paths`` at the results
+
+        Returns a new ``paths`` dict: optimised images (and their WebP
+        siblings) are read back from this storage when they're hashed.
+        Images whose source and collected copy match the build cache are
+        not optimised again.
+        """
+        names = [name for name in paths if name.lower().endswith(OPTIMIZABLE_EXTENSIONS)]
+        if not names:
+            return paths
+
+        paths = dict(paths)
+        cached = self.build_cache['images']
+        pending = {}
+        for name in names:
+            source_storage, source_path = paths[name]
+            source = file_sha256(source_storage.path(source_path))
+            entry = cached.get(name)
+            if (
+                entry and entry['source'] == source and self.exists(name)
+                and file_sha256(self.path(name)) == entry['output']
+                and (entry['result']['webp'] is None or self.exists(f'{name}.webp'))
+            ):
+                self._add_image(paths, name, dict(entry, reused=True))
+            else:
+                pending[name] = source
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=self.image_workers or os.cpu_count()) as executor:
+                results = executor.map(optimize_image, [self.path(name) for name in pending], chunksize=4)
+                for (name, source), result in zip(pending.items(), results):
+                    entry = {'source': source, 'output': file_sha256(self.path(name)), 'result': result, 'reused': False}
+                    self._add_image(paths, name, entry)
+        return paths
+
+    def _add_image(self, paths, name, entry):
+        paths[name] = (self, name)
+        if entry['result']['webp'] is not None:
+            paths[f'{name}.webp'] = (self, f'{name}.webp')
+        self.image_report[name] = entry['result']
+        self.build_images[name] = entry
+
+    def compress_files(self, paths):
+        """Precompress ``paths`` in a process pool, reusing unchanged outputs
+
+        A file is reused when its SHA-256 and the sizes of its siblings
+        match the build cache; files with the same content (such as a file
+        and its hashed copy) are compressed once and the siblings copied.
+        """
+        for codec, package in SKIPPED_CODECS:
+            logger.warning('Not precompressing static files with %s: the %s package is not installed', codec, package)
+        extensions = getattr(settings, 'WHITENOISE_SKIP_COMPRESS_EXTENSIONS', None)
+        self.compressor = self.create_compressor(extensions=extensions, quiet=True)
+        cached = getattr(self, 'build_cache', {'files': {}})['files']
+
+        files = {}
+        pending = {}
+        for name in sorted(paths):
+            if not self.compressor.should_compress(name):
+                continue
+            digest = file_sha256(self.path(name))
+            entry = cached.get(name)
+            if entry and entry['sha256'] == digest and self._siblings_match(name, entry['encoded']):
+                files[name] = dict(entry, status='reused', seconds=0.0)
+            else:
+                pending.setdefault(digest, []).append(name)
+
+        sources = {entry['sha256']: name for name, entry in files.items()}
+        jobs = {digest: names[0] for digest, names in pending.items() if digest not in sources}
+        if jobs:
+            codecs = list(CODECS)
+            with ProcessPoolExecutor(max_workers=self.compress_workers or os.cpu_count()) as executor:
+                futures = {
+                    digest: executor.submit(compress_file, self.path(name), codecs, self.compress_max_ratio)
+                    for digest, name in jobs.items()
+                }
+                for digest, future in futures.items():
+                    files[jobs[digest]] = dict(future.result(), sha256=digest, status='compressed')
+                    sources[digest] = jobs[digest]
+
+        for digest, names in pending.items():
+            source = sources[digest]
+            for name in names:
+                if name != source:
+                    self._copy_siblings(source, name, files[source]['encoded'])
+                    files[name] = dict(files[source], status='copied', seconds=0.0)
+
+        for name, entry in files.items():
+            for codec, size in entry['encoded'].items():
+                if size is not None:
+                    yield name, name + CODECS[codec][0]
+        self.save_build_cache(files)
+
+    def _siblings_match(self, name, encoded):
+        for codec, size in encoded.items():
+            path = self.path(name) + CODECS[codec][0]
+            if size is None:
+                if os.path.exists(path):
+                    return False
+            elif not os.path.exists(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def _copy_siblings(self, source, name, encoded):
+        for codec, size in encoded.items():
+            suffix = CODECS[codec][0]
+            target = self.path(name) + suffix
+            if size is not None:
+                shutil.copy2(self.path(source) + suffix, target)
+            elif os.path.exists(target):
+                os.remove(target)
+
+    def save_manifest(self):
+        super().save_manifest()
+        if not getattr(self, 'image_report', None):
+            return
+        with self.manifest_storage.open(self.manifest_name) as manifest:
+            payload = json.loads(manifest.read().decode())
+        original = sum(item['original'] for item in self.image_report.values())
+        optimized = sum(item['optimized'] for item in self.image_report.values())
+        payload['optimized_images'] = {
+            'files': self.image_report,
+            'original_bytes': original,
+            'optimized_bytes': optimized,
+            'saved_bytes': original - optimized,
+        }
+        self.manifest_storage.delete(self.manifest_name)
+        self.manifest_storage._save(self.manifest_name, ContentFile(json.dumps(payload).encode()))
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware that also serves the ``.zst`` siblings
+
+    Also async-capable (WhiteNoiseMiddleware is sync-only), so under ASGI it
+    doesn't push the rest of the stack onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # As WhiteNoiseMiddleware.__call__
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            response = self.serve(static_file, request)
+            if response.streaming and not response.is_async:
+                response.streaming_content = _read_in_thread(response.streaming_content)
+            return response
+        return await self.get_response(request)
+
+    @staticmethod
+    def is_compressed_variant(path, stat_cache=None):
+        if path.endswith('.zst'):
+            uncompressed_path = path[:-4]
+            if stat_cache is None:
+                return os.path.isfile(uncompressed_path)
+            return uncompressed_path in stat_cache
+        return WhiteNoiseMiddleware.is_compressed_variant(path, stat_cache)
+
+    def get_static_file(self, path, url, stat_cache=None):
+        # As WhiteNoise.get_static_file, plus the zstd encoding
+        if stat_cache is None and not os.path.exists(path):
+            raise MissingFileError(path)
+        headers = Headers([])
+        self.add_mime_headers(headers, path, url)
+        self.add_cache_headers(headers, path, url)
+        if self.allow_all_origins:
+            headers['Access-Control-Allow-Origin'] = '*'
+        if self.add_headers_function is not None:
+            self.add_headers_function(headers, path, url)
+        return StaticFile(
+            path,
+            headers.items(),
+            stat_cache=stat_cache,
+            encodings={'gzip': path + '.gz', 'br': path + '.br', 'zstd': path + '.zst'},
+        )
+
+
+async def _read_in_thread(chunks):
+    """Iterate the file chunks ``chunks`` off the event loop"""
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
@@ -0,0 +1,277 @@
+"""
+File serving with HTTP Range and conditional GET support.
+
+``serve_file`` answers a request for a file on disk with:
+
+* ``304 Not Modified`` when ``If-None-Match``/``If-Modified-Since`` match,
+* ``206 Partial Content`` for single ranges (sent with ``os.sendfile`` by
+  servers that provide ``wsgi.file_wrapper``, such as gunicorn),
+* ``multipart/byteranges`` for multiple ranges,
+* ``416`` for unsatisfiable ranges,
+
+or hands the file to the front-end server with ``X-Accel-Redirect`` (nginx)
+or ``X-Sendfile`` (Apache/lighttpd) when ``settings.FILE_OFFLOAD`` is set.
+``RangeRequestMiddleware`` adds the same Range handling to other file
+responses, e.g. media and static files served by Django in development.
+"""
+import mimetypes
+import os
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag, parse_etags
+
+# Refuse range sets that would fan out into many tiny parts
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """Return a list of inclusive (start, end) ranges, or None to ignore
+
+    Raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, last = spec.split('-', 1)
+        try:
+            if first == '':
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if start > end:
+            return None
+        ranges.append((start, min(end, size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def is_not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # Weak comparison, as for GET/HEAD in RFC 9110
+        etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+        return '*' in etags or etag in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def if_range_matches(request, etag, mtime):
+    """A Range request with a stale If-Range gets the whole file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of an open file from its position
+
+    Keeps ``fileno()`` so gunicorn can still use sendfile (it honours the
+    file position and Content-Length). Deliberately has no seek/tell so
+    FileResponse doesn't recompute Content-Length from the whole file.
+    """
+
+    def __init__(self, handle, start, length):
+        self.handle = handle
+        self.name = handle.name
+        self.remaining = length
+        handle.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.handle.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.handle.fileno()
+
+    def close(self):
+        self.handle.close()
+
+
+def _part_header(boundary, content_type, start, end, size):
+    return (
+        f'\r\n--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+def _multipart(path, ranges, size, content_type, boundary):
+    with open(path, 'rb') as handle:
+        for start, end in ranges:
+            yield _part_header(boundary, content_type, start, end, size)
+            handle.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = handle.read(min(BLOCK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+def _multipart_length(ranges, size, content_type, boundary):
+    length = len(f'\r\n--{boundary}--\r\n')
+    for start, end in ranges:
+        length += len(_part_header(boundary, content_type, start, end, size))
+        length += end - start + 1
+    return length
+
+
+def _offload_response(path, content_type, filename, as_attachment):
+    mode = getattr(settings, 'FILE_OFFLOAD', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        # FILE_OFFLOAD_PREFIX is an nginx "internal" location aliased to MEDIA_ROOT
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.FILE_OFFLOAD_PREFIX.rstrip('/') + '/' + relative
+    else:
+        response['X-Sendfile'] = path
+    # Same quoting as FileResponse, so odd filenames can't break the header
+    disposition = content_disposition_header(as_attachment, filename)
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
+
+
+def range_response(request, response, path, stat, content_type):
+    """Turn a full 200 file response into a 206/416 for a Range request"""
+    etag = response.get('ETag') or file_etag(stat)
+    if not if_range_matches(request, etag, stat.st_mtime):
+        return response
+    try:
+        ranges = parse_range_header(request.META.get('HTTP_RANGE', ''), stat.st_size)
+    except RangeNotSatisfiable:
+        unsatisfiable = HttpResponse(status=416)
+        unsatisfiable['Content-Range'] = f'bytes */{stat.st_size}'
+        unsatisfiable['Accept-Ranges'] = 'bytes'
+        response.close()
+        return unsatisfiable
+    if not ranges:
+        return response
+
+    response.close()
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        partial = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), content_type=content_type)
+        partial['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        partial['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        partial = StreamingHttpResponse(
+            _multipart(path, ranges, stat.st_size, content_type, boundary),
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        partial['Content-Length'] = str(_multipart_length(ranges, stat.st_size, content_type, boundary))
+    partial.status_code = 206
+    for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Content-Disposition'):
+        if header in response:
+            partial[header] = response[header]
+    partial['Accept-Ranges'] = 'bytes'
+    return partial
+
+
+def serve_file(request, path, content_type=None, filename=None, as_attachment=False, cache_control='public, max-age=3600'):
+    """Serve ``path`` with validators, Range support and optional offload"""
+    stat = os.stat(path)
+    filename = filename or os.path.basename(path)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = file_etag(stat)
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif getattr(settings, 'FILE_OFFLOAD', None):
+        # The front-end server does its own Range and validator handling
+        return _offload_response(path, content_type, filename, as_attachment)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type,
+                                as_attachment=as_attachment, filename=filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    if response.status_code == 200 and request.method in ('GET', 'HEAD') and 'HTTP_RANGE' in request.META:
+        response = range_response(request, response, path, stat, content_type)
+    return response
+
+
+class RangeRequestMiddleware:
+    """Add Range support to plain FileResponses for files on disk
+
+    Covers responses that don't go through serve_file, such as
+    django.views.static.serve for MEDIA_URL and the staticfiles view
+    in development.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._ranged(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._ranged(request, await self.get_response(request))
+
+    def _ranged(self, request, response):
+        if (request.method not in ('GET', 'HEAD')
+                or response.status_code != 200
+                or not isinstance(response, FileResponse)):
+            return response
+
+        handle = getattr(response, 'file_to_stream', None)
+        path = getattr(handle, 'name', None)
+        if not isinstance(path, str) or not os.path.isfile(path):
+            return response
+
+        response['Accept-Ranges'] = 'bytes'
+        if 'HTTP_RANGE' not in request.META:
+            return response
+        content_type = response.get('Content-Type', 'application/octet-stream')
+        return range_response(request, response, path, os.stat(path), content_type)
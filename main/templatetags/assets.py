@@ -0,0 +1,60 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from main import assets
+
+register = template.Library()
+
+# Critical CSS per page, read once per process
+_critical = {}
+
+
+def _bundle_url(name):
+    if not assets.ENABLED:
+        return None
+    try:
+        return static(assets.bundle_name(name))
+    except ValueError:
+        # Not in the manifest: collectstatic ran before the bundle was added
+        return None
+
+
+def _critical_css(page):
+    if page not in _critical:
+        name = assets.critical_name(page)
+        try:
+            if hasattr(staticfiles_storage, 'stored_name'):
+                name = staticfiles_storage.stored_name(name)
+            with staticfiles_storage.open(name) as stream:
+                _critical[page] = stream.read().decode()
+        except (OSError, ValueError):
+            _critical[page] = None
+    return _critical[page]
+
+
+@register.simple_tag
+def bundle(name, critical=None):
+    """Link the CSS or JS bundle ``name`` from ASSET_BUNDLES
+
+    Usage: {% bundle 'site.css' %} or {% bundle 'site.css' critical='index' %}
+    to inline that page's critical CSS and load the bundle without blocking
+    rendering. Links the source files instead while bundling is off.
+    """
+    url = _bundle_url(name)
+    urls = [url] if url else [static(source) for source in assets.BUNDLES[name]]
+    if not name.endswith('.css'):
+        return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in urls))
+
+    inline = _critical_css(critical) if critical and url else None
+    if inline is None:
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html(
+        '<style>{}</style>\n'
+        '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        # Built from our own stylesheets by collectstatic
+        mark_safe(inline), url, url,
+    )
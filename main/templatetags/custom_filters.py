@@ -2,6 +2,8 @@ from django import template
 from django.utils.html import strip_tags
 from django.template.defaultfilters import truncatewords
 
+from main.search import highlight_html
+
 register = template.Library()
 
 @register.filter(name='split')
@@ -22,3 +24,10 @@ def trim(value):
 def truncatewords_html(value, arg):
     """Truncate HTML content while preserving tags"""
     return truncatewords(strip_tags(value), arg)
+
+@register.filter(name='highlight')
+def highlight(value):
+    """Escape a search snippet and wrap the matched terms in <mark>"""
+    if not value:
+        return ''
+    return highlight_html(value)
@@ -0,0 +1,81 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from main.images import fallback_format, variants_for
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 600px) 100vw, (max-width: 1024px) 50vw, 33vw'
+MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+def _srcset(entries):
+    return ', '.join(f'{url} {width}w' for url, width in entries)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes=DEFAULT_SIZES, loading='lazy', style=''):
+    """Render an <picture> with WebP and JPEG/PNG srcsets for an ImageField
+
+    Usage: {% responsive_image post.image alt=post.title css_class="news-img" %}
+    Falls back to a plain <img> of the original when variants can't be made.
+    """
+    if not image:
+        return ''
+    attrs = [('alt', alt), ('loading', loading)]
+    if css_class:
+        attrs.append(('class', css_class))
+    if style:
+        attrs.append(('style', style))
+
+    info = variants_for(image)
+    if info is None:
+        return format_html(
+            '<img src="{}"{}>', image.url,
+            format_html_join('', ' {}="{}"', attrs),
+        )
+
+    fallback = info['sources'][fallback_format(image.name)]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], _srcset(entries), sizes) for fmt, entries in info['sources'].items()),
+    )
+    attrs += [('width', info['width']), ('height', info['height']), ('decoding', 'async')]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        sources, fallback[0][0], _srcset(fallback), sizes,
+        format_html_join('', ' {}="{}"', attrs),
+    )
+
+
+def _webp_sibling(path):
+    """URL of the WebP copy collectstatic wrote next to ``path``, if any"""
+    # Only kept when smaller, so look it up in the manifest rather than assume it
+    name = f'{path}.webp'
+    if name not in getattr(staticfiles_storage, 'hashed_files', {}):
+        return None
+    return static(name)
+
+
+@register.simple_tag
+def static_image(path, alt='', css_class='', loading='', style=''):
+    """Render a static PNG/JPEG, preferring its WebP sibling where there is one
+
+    Usage: {% static_image 'images/partner1.png' alt="Partner 1" css_class="partner-logo" %}
+    Renders a plain <img> when collectstatic kept no smaller WebP copy.
+    """
+    attrs = [('alt', alt)]
+    if css_class:
+        attrs.append(('class', css_class))
+    if loading:
+        attrs.append(('loading', loading))
+    if style:
+        attrs.append(('style', style))
+    img = format_html('<img src="{}"{}>', static(path), format_html_join('', ' {}="{}"', attrs))
+
+    webp = _webp_sibling(path)
+    if webp is None:
+        return img
+    return format_html('<picture><source type="image/webp" srcset="{}">{}</picture>', webp, img)
@@ -1,11 +1,15 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import metrics, views, views_async
 from .views import our_team_view
 
+# Under ASGI the content views are coroutines (main/views_async.py)
+content = views_async if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Main pages
-    path('', views.HomeView.as_view(), name='home'),
+    path('', content.HomeView.as_view(), name='home'),
+    path('home/sections/<slug:name>/', content.home_section, name='home_section'),
     path('about/', views.AboutView.as_view(), name='about'),
     path('team/', views.our_team_view, name='our_team'),
     path('contact/', views.ContactView.as_view(), name='contact'),
@@ -14,22 +18,32 @@ urlpatterns = [
 
     
     # Events
-    path('events/', views.EventListView.as_view(), name='events'),
-    path('events/<slug:slug>/', views.EventDetailView.as_view(), name='event_detail'),
+    path('events/', content.EventListView.as_view(), name='events'),
+    path('events/<slug:slug>/', content.EventDetailView.as_view(), name='event_detail'),
     
     # Stories
-    path('stories/', views.StoryListView.as_view(), name='stories'),
-    path('stories/<slug:slug>/', views.StoryDetailView.as_view(), name='story_detail'),
+    path('stories/', content.StoryListView.as_view(), name='stories'),
+    path('stories/<slug:slug>/', content.StoryDetailView.as_view(), name='story_detail'),
     
     # Blog
-    path('blog/', views.BlogListView.as_view(), name='blog'),
-    path('blog/<slug:slug>/', views.BlogDetailView.as_view(), name='blog_detail'),
+    path('blog/', content.BlogListView.as_view(), name='blog'),
+    path('blog/<slug:slug>/', content.BlogDetailView.as_view(), name='blog_detail'),
     
     # Resources
-    path('resources/', views.ResourceListView.as_view(), name='resources'),
+    path('resources/', content.ResourceListView.as_view(), name='resources'),
+    path('resources/<int:resource_id>/download/', views.resource_download, name='resource_download'),
     
+    # Newsletter
+    path('newsletter/unsubscribe/<str:token>/', views.newsletter_unsubscribe, name='newsletter_unsubscribe'),
+
+    # Resized image variants, built on first request
+    path('img/<int:width>.<str:fmt>/<path:name>', views.image_variant, name='image_variant'),
+
     # AJAX endpoints
   #  path('process-donation/', views.ProcessDonationView.as_view(), name='process_donation'),
-   # path('newsletter-subscribe/', views.newsletter_subscribe, name='newsletter_subscribe'),
-   # path('api/track-download/<int:resource_id>/', views.track_download, name='track_download'),
+    path('newsletter-subscribe/', content.newsletter_subscribe, name='newsletter_subscribe'),
+    path('api/track-download/<int:resource_id>/', content.track_download, name='track_download'),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
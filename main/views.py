@@ -1,22 +1,32 @@
 
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.views.generic import ListView, DetailView, CreateView, TemplateView
 from django.contrib import messages
-from django.http import JsonResponse
-from django.core.mail import send_mail
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse
+from django.core import signing
 from django.conf import settings
-from django.db.models import Q
 from django.core.paginator import Paginator
-from django.utils import timezone
 import json
-from .models import Event, Story, BlogPost, Resource, Contact, Newsletter, ImpactStory, ImpactStat, Comment, TeamMember, Supporter, Announcement
+import logging
+import os
+from .models import Event, Story, BlogPost, Resource, Contact, Newsletter, ImpactStory, Comment, TeamMember, Supporter, Testimonial
 from .forms import ContactForm, Donation2Form, NewsletterForm
 from django.contrib.contenttypes.models import ContentType
+from . import campaigns, homepage, images, metrics, outbox, pagecache, search
+from .conditional import ConditionalDetailMixin, ConditionalListMixin
+from .counters import download_counter
+from .pagination import CursorPaginationMixin
+from .streaming import serve_file
+
+logger = logging.getLogger(__name__)
 
 
 def our_team_view(request):
     team_members = TeamMember.objects.filter(is_active=True).order_by('created_at')
     supporters = Supporter.objects.filter(is_active=True).order_by('created_at')
+    pagecache.tag(request, TeamMember, Supporter)
     return render(request, 'about/team.html', {
         'team_members': team_members,
         'supporters': supporters
@@ -26,72 +36,65 @@ def our_team_view(request):
 class HomeView(TemplateView):
     """Homepage with featured content"""
     template_name = 'index.html'
-    announcements = Announcement.objects.all()
-    
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.section_timings = {}
+        # Sections in fragments the browser fetches itself aren't loaded
+        self.lazy = homepage.is_lazy(request)
+        self.section_names = homepage.page_sections(self.lazy)
+
+    def load_sections(self):
+        # Each section is cached separately and invalidated on save/delete;
+        # the uncached ones load concurrently
+        return homepage.get_sections(self.section_timings, self.section_names)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get upcoming events (events with date >= today)
-        context['upcoming_events'] = list(Event.objects.filter(
-            date__gte=timezone.now(),
-            is_active=True
-        ).order_by('date')[:6])
-
-        # Demo data for events
-        if not context['upcoming_events']:
-            context['upcoming_events'] = [
-                {'title': 'STEM Bootcamp for Girls', 'date': '2025-09-10', 'description': 'A week-long immersive bootcamp introducing girls to coding, robotics, and digital skills.', 'location': 'Freetown, Sierra Leone', 'get_absolute_url': '#'},
-                {'title': 'Young Women Leadership Summit', 'date': '2025-10-05', 'description': 'Empowering young women with leadership, advocacy, and public speaking skills.', 'location': 'Accra, Ghana', 'get_absolute_url': '#'},
-                {'title': 'Health & Hygiene Workshop', 'date': '2025-08-20', 'description': 'Interactive sessions on health, hygiene, and self-care for adolescent girls.', 'location': 'Monrovia, Liberia', 'get_absolute_url': '#'}
-            ]
-
-        context['recent_stories'] = list(Story.objects.filter(
-            is_active=True
-        ).order_by('-created_at')[:6])
-        if not context['recent_stories']:
-            context['recent_stories'] = [
-                {'author': 'Fatmata Kamara', 'title': 'From Shy to STEM Star', 'content': 'Fatmata joined our bootcamp with little confidence. Today, she leads her school’s robotics club and mentors other girls.', 'location': 'Freetown', 'get_absolute_url': '#'},
-                {'author': 'Aisha Conteh', 'title': 'Speaking Up for Change', 'content': 'Aisha’s journey from a quiet student to a passionate advocate for girls’ education inspires her whole community.', 'location': 'Bo', 'get_absolute_url': '#'},
-                {'author': 'Mariama Sesay', 'title': 'Building Healthy Habits', 'content': 'Mariama learned about health and hygiene at our workshop and now leads peer sessions at her school.', 'location': 'Kenema', 'get_absolute_url': '#'}
-            ]
-
-        context['recent_resources'] = list(Resource.objects.filter(
-            is_active=True
-        ).order_by('-created_at')[:6])
-        if not context['recent_resources']:
-            context['recent_resources'] = [
-                {'get_category_display': 'Toolkit', 'title': 'Girls in STEM Activity Book', 'description': 'Fun activities and challenges to spark curiosity in science and tech.', 'download_count': 120, 'file': {'url': '#'}},
-                {'get_category_display': 'Guide', 'title': 'Leadership Skills for Young Women', 'description': 'A practical guide to building confidence and leadership.', 'download_count': 95, 'file': {'url': '#'}},
-                {'get_category_display': 'Report', 'title': '2025 Impact Report', 'description': 'See the results and stories from our programs this year.', 'download_count': 60, 'file': {'url': '#'}}
-            ]
-
-        context['blog_posts'] = list(BlogPost.objects.filter(
-            published=True,
-            is_active=True
-        ).order_by('-created_at')[:5])
-        if not context['blog_posts']:
-            context['blog_posts'] = [
-                {'category': 'Empowerment', 'title': 'Why Girls in STEM Matter', 'summary': 'Exploring the impact of STEM education for girls in Africa.', 'content': '', 'date': '2025-07-15', 'get_absolute_url': '#'},
-                {'category': 'Leadership', 'title': 'Raising the Next Generation of Leaders', 'summary': 'How our programs nurture leadership in young women.', 'content': '', 'date': '2025-06-30', 'get_absolute_url': '#'},
-                {'category': 'Health', 'title': 'Breaking Taboos: Girls’ Health Education', 'summary': 'Addressing myths and empowering girls with knowledge.', 'content': '', 'date': '2025-06-10', 'get_absolute_url': '#'},
-                {'category': 'Events', 'title': 'Highlights from the 2025 Summit', 'summary': 'A recap of our biggest event of the year.', 'content': '', 'date': '2025-05-25', 'get_absolute_url': '#'},
-                {'category': 'Community', 'title': 'Volunteers Making a Difference', 'summary': 'Stories from our dedicated volunteers.', 'content': '', 'date': '2025-05-01', 'get_absolute_url': '#'}
-            ]
-
+        context.update(self.load_sections())
+        pagecache.tag(self.request, *homepage.section_models(self.section_names))
         context['newsletter_form'] = NewsletterForm()
-
-        context['impact_stats'] = list(ImpactStat.objects.filter(is_active=True))
-        if not context['impact_stats']:
-            context['impact_stats'] = [
-                {'value': '10K+', 'label': 'Girls Empowered', 'description': 'Directly impacted through our programs.'},
-                {'value': '120+', 'label': 'Programs Delivered', 'description': 'Across 3 West African countries.'},
-                {'value': '50+', 'label': 'Communities Reached', 'description': 'Urban, rural, and remote areas.'}
-            ]
-        context['announcements'] = Announcement.objects.filter(is_active=True).order_by('-created_at')[:5]
-        # Add testimonials to context for homepage carousel
-        from .models import Testimonial
-        context['testimonials'] = Testimonial.objects.all()
+        context['fragments'] = homepage.FRAGMENTS
+        context['lazy_sections'] = self.lazy
+        context['lazy_cookie'] = homepage.LAZY_COOKIE if homepage.LAZY_SECTIONS else None
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        return _with_section_timings(self.request, response, self.section_timings)
+
+
+def _with_section_timings(request, response, timings):
+    if timings:
+        response['Server-Timing'] = homepage.server_timing(timings)
+        # Keep a page showing fallback content out of the page cache
+        if any(outcome != 'loaded' for outcome, _ in timings.values()):
+            request.page_cache_store = False
+    return response
+
+
+def home_section_response(request, fragment, context, timings):
+    """Render a homepage fragment on its own"""
+    pagecache.tag(request, *homepage.section_models(fragment.sections))
+    response = _with_section_timings(request, TemplateResponse(request, fragment.template, context), timings)
+    if getattr(request, 'page_cache_store', None) is False:
+        add_never_cache_headers(response)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.HOMEPAGE_FRAGMENT_MAX_AGE)
+    # Crawlers get the sections in the homepage itself
+    response['X-Robots-Tag'] = 'noindex'
+    return response
+
+
+def home_section(request, name):
+    """A below-the-fold homepage section, fetched as it scrolls into view"""
+    fragment = homepage.FRAGMENTS_BY_NAME.get(name)
+    if fragment is None:
+        raise Http404('No such homepage section')
+    timings = {}
+    context = homepage.get_sections(timings, fragment.sections)
+    return home_section_response(request, fragment, context, timings)
+
 
 
 from .models import TeamMember
@@ -103,6 +106,7 @@ class AboutView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['team_members'] = TeamMember.objects.filter(is_active=True)
+        pagecache.tag(self.request, TeamMember)
         return context
 
 
@@ -114,26 +118,29 @@ class ContactView(CreateView):
     success_url = '/contact/'
     
     def form_valid(self, form):
-        # Send email notification
-        try:
-            send_mail(
-                f'New Contact Form Submission: {form.cleaned_data["subject"]}',
-                f'Name: {form.cleaned_data["name"]}\nEmail: {form.cleaned_data["email"]}\n\nMessage:\n{form.cleaned_data["message"]}',
-                settings.DEFAULT_FROM_EMAIL,
-                [settings.EMAIL_HOST_USER],
-                fail_silently=False,
-            )
-        except Exception as e:
-            print(f"Email sending failed: {e}")
+        # Queue the notification; manage.py send_outbox delivers it
+        outbox.enqueue(
+            f'New Contact Form Submission: {form.cleaned_data["subject"]}',
+            f'Name: {form.cleaned_data["name"]}\nEmail: {form.cleaned_data["email"]}\n\nMessage:\n{form.cleaned_data["message"]}',
+            [settings.EMAIL_HOST_USER],
+            reply_to=form.cleaned_data['email'],
+        )
         
         messages.success(self.request, 'Thank you for your message! We will get back to you soon.')
+        metrics.form_submission('contact', True)
         return super().form_valid(form)
 
+    def form_invalid(self, form):
+        metrics.form_submission('contact', False)
+        return super().form_invalid(form)
+
 
 def donate2_view(request):
     if request.method == 'POST':
         form = Donation2Form(request.POST)
-        if form.is_valid():
+        valid = form.is_valid()
+        metrics.form_submission('donate2', valid)
+        if valid:
             form.save()
             return redirect('donate2_thank_you')
     else:
@@ -144,37 +151,55 @@ def donate2_thank_you(request):
     return render(request, 'donate2_thank_you.html')
 
 
-class EventListView(ListView):
+def comment_from_post(request, obj=None):
+    """
+    The unsaved Comment posted to a list page, or to ``obj``'s detail page,
+    or None if the form is incomplete. Shared with main/views_async.py.
+    """
+    text = request.POST.get('comment')
+    fields = {}
+    if obj is None:
+        valid = bool(text)
+    else:
+        fields = {'name': request.POST.get('name'), 'email': request.POST.get('email')}
+        valid = bool(text and fields['name'] and fields['email'])
+    metrics.form_submission('comment', valid)
+    if not valid:
+        return None
+    if obj is not None:
+        fields.update(content_type=ContentType.objects.get_for_model(obj), object_id=obj.id)
+    return Comment(text=text, **fields)
+
+
+class EventListView(ConditionalListMixin, CursorPaginationMixin, ListView):
     """List view for events"""
     model = Event
     template_name = 'events/list.html'
     context_object_name = 'events'
     paginate_by = 10
+    conditional_dependencies = ((Comment, 'updated_at'),)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['recent_comments'] = Comment.objects.order_by('-created_at')[:10]
+        pagecache.tag(self.request, self.model, Comment)
         return context
 
     def get_queryset(self):
         queryset = Event.objects.filter(is_active=True)
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(location__icontains=query)
-            )
+            queryset = search.search(queryset, query)
         return queryset
 
     def post(self, request, *args, **kwargs):
-        comment_text = request.POST.get('comment')
-        if comment_text:
-            Comment.objects.create(text=comment_text)
+        comment = comment_from_post(request)
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class EventDetailView(DetailView):
+class EventDetailView(ConditionalDetailMixin, DetailView):
     """Detail view for individual events"""
     model = Event
     template_name = 'events/detail.html'
@@ -185,28 +210,27 @@ class EventDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        obj = self.get_object()
+        obj = self.object
         content_type = ContentType.objects.get_for_model(obj)
         context['recent_comments'] = Comment.objects.filter(content_type=content_type, object_id=obj.id).order_by('-created_at')[:10]
+        # Comments on obj purge obj's key, see main/signals.py
+        pagecache.tag(self.request, obj)
         return context
 
     def post(self, request, *args, **kwargs):
-        obj = self.get_object()
-        comment_text = request.POST.get('comment')
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        if comment_text and name and email:
-            content_type = ContentType.objects.get_for_model(obj)
-            Comment.objects.create(text=comment_text, name=name, email=email, content_type=content_type, object_id=obj.id)
+        comment = comment_from_post(request, self.get_object())
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class StoryListView(ListView):
+class StoryListView(ConditionalListMixin, CursorPaginationMixin, ListView):
     """List view for success stories"""
     model = Story
     template_name = 'stories/list.html'
     context_object_name = 'stories'
     paginate_by = 10
+    conditional_dependencies = ((Comment, 'updated_at'), (Testimonial, 'created_at'))
     
 
     def get_context_data(self, **kwargs):
@@ -214,27 +238,24 @@ class StoryListView(ListView):
         context['recent_comments'] = Comment.objects.order_by('-created_at')[:10]
         from .models import Testimonial
         context['testimonials'] = Testimonial.objects.all()
+        pagecache.tag(self.request, self.model, Comment, Testimonial)
         return context
 
     def get_queryset(self):
         queryset = Story.objects.filter(is_active=True)
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(author__icontains=query)
-            )
+            queryset = search.search(queryset, query)
         return queryset
 
     def post(self, request, *args, **kwargs):
-        comment_text = request.POST.get('comment')
-        if comment_text:
-            Comment.objects.create(text=comment_text)
+        comment = comment_from_post(request)
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class StoryDetailView(DetailView):
+class StoryDetailView(ConditionalDetailMixin, DetailView):
     """Detail view for individual stories"""
     model = Story
     template_name = 'stories/detail.html'
@@ -245,89 +266,85 @@ class StoryDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        obj = self.get_object()
+        obj = self.object
         content_type = ContentType.objects.get_for_model(obj)
         context['recent_comments'] = Comment.objects.filter(content_type=content_type, object_id=obj.id).order_by('-created_at')[:10]
+        # Comments on obj purge obj's key, see main/signals.py
+        pagecache.tag(self.request, obj)
         return context
 
     def post(self, request, *args, **kwargs):
-        obj = self.get_object()
-        comment_text = request.POST.get('comment')
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        if comment_text and name and email:
-            content_type = ContentType.objects.get_for_model(obj)
-            Comment.objects.create(text=comment_text, name=name, email=email, content_type=content_type, object_id=obj.id)
+        comment = comment_from_post(request, self.get_object())
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class BlogListView(ListView):
+class BlogListView(ConditionalListMixin, CursorPaginationMixin, ListView):
     """List view for blog posts"""
     model = BlogPost
     template_name = 'blog/list.html'
     context_object_name = 'posts'
     paginate_by = 10
+    conditional_dependencies = ((Comment, 'updated_at'),)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['recent_comments'] = Comment.objects.order_by('-created_at')[:10]
+        pagecache.tag(self.request, self.model, Comment)
         return context
 
     def get_queryset(self):
-        queryset = BlogPost.objects.filter(published=True, is_active=True)
+        queryset = BlogPost.objects.filter(published=True, is_active=True).select_related('author')
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__icontains=query)
-            )
+            queryset = search.search(queryset, query)
         return queryset
 
     def post(self, request, *args, **kwargs):
-        comment_text = request.POST.get('comment')
-        if comment_text:
-            Comment.objects.create(text=comment_text)
+        comment = comment_from_post(request)
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class BlogDetailView(DetailView):
+class BlogDetailView(ConditionalDetailMixin, DetailView):
     """Detail view for individual blog posts"""
     model = BlogPost
     template_name = 'blog/detail.html'
     context_object_name = 'post'
     
     def get_queryset(self):
-        return BlogPost.objects.filter(published=True, is_active=True)
+        return BlogPost.objects.filter(published=True, is_active=True).select_related('author')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        obj = self.get_object()
+        obj = self.object
         content_type = ContentType.objects.get_for_model(obj)
         context['recent_comments'] = Comment.objects.filter(content_type=content_type, object_id=obj.id).order_by('-created_at')[:10]
+        # Comments on obj purge obj's key, see main/signals.py
+        pagecache.tag(self.request, obj)
         return context
 
     def post(self, request, *args, **kwargs):
-        obj = self.get_object()
-        comment_text = request.POST.get('comment')
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        if comment_text and name and email:
-            content_type = ContentType.objects.get_for_model(obj)
-            Comment.objects.create(text=comment_text, name=name, email=email, content_type=content_type, object_id=obj.id)
+        comment = comment_from_post(request, self.get_object())
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
-class ResourceListView(ListView):
+class ResourceListView(ConditionalListMixin, CursorPaginationMixin, ListView):
     """List view for resources"""
     model = Resource
     template_name = 'resources/list.html'
     context_object_name = 'resources'
     paginate_by = 10
+    conditional_dependencies = ((Comment, 'updated_at'),)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['recent_comments'] = Comment.objects.order_by('-created_at')[:10]
+        pagecache.tag(self.request, self.model, Comment)
         return context
 
     def get_queryset(self):
@@ -338,9 +355,9 @@ class ResourceListView(ListView):
         return queryset
 
     def post(self, request, *args, **kwargs):
-        comment_text = request.POST.get('comment')
-        if comment_text:
-            Comment.objects.create(text=comment_text)
+        comment = comment_from_post(request)
+        if comment is not None:
+            comment.save()
         return redirect(request.path)
 
 
@@ -349,7 +366,9 @@ def newsletter_subscribe(request):
     """Handle newsletter subscription via AJAX"""
     if request.method == 'POST':
         form = NewsletterForm(request.POST)
-        if form.is_valid():
+        valid = form.is_valid()
+        metrics.form_submission('newsletter', valid)
+        if valid:
             form.save()
             return JsonResponse({'success': True, 'message': 'Thank you for subscribing!'})
         else:
@@ -364,11 +383,83 @@ from .models import Resource
 @csrf_exempt
 def track_download(request, resource_id):
     if request.method == 'POST':
-        try:
-            resource = Resource.objects.get(pk=resource_id)
-            resource.download_count = resource.download_count + 1
-            resource.save(update_fields=['download_count'])
-            return JsonResponse({'success': True, 'download_count': resource.download_count})
-        except Resource.DoesNotExist:
+        # Increments are buffered in memory and flushed in batches (main/counters.py)
+        stored = Resource.objects.filter(pk=resource_id).values_list('download_count', flat=True).first()
+        if stored is None:
             return JsonResponse({'success': False, 'error': 'Resource not found'}, status=404)
+        download_counter.increment(resource_id)
+        return JsonResponse({'success': True, 'download_count': stored + download_counter.pending(resource_id)})
     return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=400)
+
+
+@csrf_exempt
+def newsletter_unsubscribe(request, token):
+    """One-click unsubscribe from the link in campaign emails"""
+    try:
+        subscriber_id = campaigns.read_unsubscribe_token(token)
+    except signing.BadSignature:
+        raise Http404('Invalid unsubscribe link')
+    if request.method == 'POST' or request.GET.get('confirm'):
+        Newsletter.objects.filter(pk=subscriber_id).update(subscribed=False)
+        return HttpResponse('You have been unsubscribed from the GYWAN newsletter.', content_type='text/plain')
+    return HttpResponse(
+        '<form method="post"><p>Unsubscribe from the GYWAN newsletter?</p>'
+        '<button type="submit">Unsubscribe</button></form>'
+    )
+
+
+def resource_download(request, resource_id):
+    """Serve a resource file with Range/conditional GET support and count it"""
+    resource = get_object_or_404(Resource, pk=resource_id, is_active=True)
+    if not resource.file:
+        raise Http404('Resource has no file')
+    try:
+        path = resource.file.path
+    except NotImplementedError:
+        # Remote storage: let the storage serve it
+        download_counter.increment(resource.pk)
+        return redirect(resource.file.url)
+    if not os.path.isfile(path):
+        raise Http404('Resource file is missing')
+
+    response = serve_file(request, path, filename=os.path.basename(resource.file.name), as_attachment=True)
+    # Resumed downloads (ranges past byte 0), HEAD and 304s aren't new downloads
+    range_header = request.META.get('HTTP_RANGE', '')
+    resumed = response.status_code == 206 and not range_header.startswith('bytes=0-')
+    if request.method == 'GET' and response.status_code in (200, 206) and not resumed:
+        download_counter.increment(resource.pk)
+    return response
+
+
+def image_variant(request, width, fmt, name):
+    """Build (on first request) and serve a resized variant of a media image"""
+    formats = {ext: key for key, ext in images.EXTENSIONS.items()}
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    variants_root = os.path.join(media_root, images.VARIANT_DIR)
+    source_path = os.path.realpath(os.path.join(media_root, name))
+    if (fmt not in formats
+            or not source_path.startswith(media_root + os.sep)
+            or source_path.startswith(variants_root + os.sep)
+            or not os.path.isfile(source_path)):
+        raise Http404('Image not found')
+    try:
+        digest, source_width, _ = images.source_info(source_path)
+    except (OSError, ValueError):
+        raise Http404('Image not found')
+    if width not in images.variant_widths(source_width):
+        raise Http404('Unsupported width')
+
+    try:
+        variant = images.ensure_variant(source_path, digest, width, formats[fmt])
+    except Exception:
+        # A source Pillow can read the header of but not decode
+        logger.exception('Building the %dpx %s variant of %s failed', width, fmt, name)
+        variant = None
+    if variant is None:
+        # Not built (in time): the original will do until it is
+        response = FileResponse(open(source_path, 'rb'))
+        response['Cache-Control'] = 'no-cache'
+        return response
+    response = FileResponse(open(images.variant_path(variant), 'rb'), content_type=f'image/{formats[fmt]}')
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
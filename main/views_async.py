@@ -0,0 +1,152 @@
+"""
+Async versions of the content views, served under ASGI.
+
+gywan_project/asgi.py turns on ``ASYNC_VIEWS`` and main/urls.py then routes
+the homepage, the content lists and detail pages, ``track_download`` and
+``newsletter_subscribe`` here, under the same names. The classes subclass
+the sync views, so the templates, context, conditional GET
+(main/conditional.py) and page cache tags are the same; only the request
+handling is a coroutine. Lookups and writes use the async ORM; context
+building shared with the sync views, which runs the pagination queries,
+goes through ``sync_to_async``. Either way the queries run in the
+request's sync thread, as Django's async ORM still does. The homepage
+loads its uncached sections side by side with ``homepage.aget_sections``.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+
+from . import homepage, metrics, views
+from .counters import download_counter
+from .forms import NewsletterForm
+from .models import Resource
+
+
+class HomeView(views.HomeView):
+    """Homepage with featured content"""
+
+    async def get(self, request, *args, **kwargs):
+        self.sections = await homepage.aget_sections(self.section_timings, self.section_names)
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    def load_sections(self):
+        return self.sections
+
+
+class AsyncConditionalMixin:
+    """``get`` as a coroutine, with the ConditionalGetMixin 304 check"""
+
+    async def get(self, request, *args, **kwargs):
+        state = await sync_to_async(self._state)(request)
+        if state is not None:
+            not_modified = self._not_modified(request, state)
+            if not_modified is not None:
+                return not_modified
+        response = await self.render_page()
+        if state is not None:
+            response = self._add_validators(request, response)
+        return response
+
+
+class AsyncListMixin(AsyncConditionalMixin):
+    """List page with the one-line comment form of the sync list views"""
+
+    async def render_page(self):
+        self.object_list = self.get_queryset()
+        context = await sync_to_async(self.get_context_data)()
+        return self.render_to_response(context)
+
+    async def post(self, request, *args, **kwargs):
+        comment = views.comment_from_post(request)
+        if comment is not None:
+            await comment.asave()
+        return redirect(request.path)
+
+
+class AsyncDetailMixin(AsyncConditionalMixin):
+    """Detail page with the named comment form of the sync detail views"""
+
+    async def aget_object(self):
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        try:
+            return await self.get_queryset().aget(**{self.get_slug_field(): slug})
+        except self.model.DoesNotExist:
+            raise Http404(f'No {self.model._meta.verbose_name} found matching the query')
+
+    async def render_page(self):
+        self.object = await self.aget_object()
+        context = await sync_to_async(self.get_context_data)(object=self.object)
+        return self.render_to_response(context)
+
+    async def post(self, request, *args, **kwargs):
+        obj = await self.aget_object()
+        # May look up the ContentType
+        comment = await sync_to_async(views.comment_from_post)(request, obj)
+        if comment is not None:
+            await comment.asave()
+        return redirect(request.path)
+
+
+class EventListView(AsyncListMixin, views.EventListView):
+    pass
+
+
+class EventDetailView(AsyncDetailMixin, views.EventDetailView):
+    pass
+
+
+class StoryListView(AsyncListMixin, views.StoryListView):
+    pass
+
+
+class StoryDetailView(AsyncDetailMixin, views.StoryDetailView):
+    pass
+
+
+class BlogListView(AsyncListMixin, views.BlogListView):
+    pass
+
+
+class BlogDetailView(AsyncDetailMixin, views.BlogDetailView):
+    pass
+
+
+class ResourceListView(AsyncListMixin, views.ResourceListView):
+    pass
+
+
+async def newsletter_subscribe(request):
+    """Handle newsletter subscription via AJAX"""
+    if request.method == 'POST':
+        form = NewsletterForm(request.POST)
+        # Validation checks the email is unique
+        valid = await sync_to_async(form.is_valid)()
+        metrics.form_submission('newsletter', valid)
+        if valid:
+            await sync_to_async(form.save)()
+            return JsonResponse({'success': True, 'message': 'Thank you for subscribing!'})
+        return JsonResponse({'success': False, 'errors': form.errors})
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+
+async def home_section(request, name):
+    """A below-the-fold homepage section, fetched as it scrolls into view"""
+    fragment = homepage.FRAGMENTS_BY_NAME.get(name)
+    if fragment is None:
+        raise Http404('No such homepage section')
+    timings = {}
+    context = await homepage.aget_sections(timings, fragment.sections)
+    return views.home_section_response(request, fragment, context, timings)
+
+
+@csrf_exempt
+async def track_download(request, resource_id):
+    if request.method == 'POST':
+        stored = await Resource.objects.filter(pk=resource_id).values_list('download_count', flat=True).afirst()
+        if stored is None:
+            return JsonResponse({'success': False, 'error': 'Resource not found'}, status=404)
+        # May flush the buffered counts to the database
+        await sync_to_async(download_counter.increment)(resource_id)
+        return JsonResponse({'success': True, 'download_count': stored + download_counter.pending(resource_id)})
+    return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=400)
@@ -0,0 +1,8 @@
+from django.conf import settings
+from django.test import override_settings
+
+# Pages use {% static %}, whose manifest only exists after collectstatic
+plain_static_files = override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
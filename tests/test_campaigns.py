@@ -0,0 +1,72 @@
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from main.campaigns import CampaignSender
+from main.models import CampaignDelivery, Newsletter, NewsletterCampaign
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendCampaignTests(TestCase):
+    def setUp(self):
+        Newsletter.objects.create(email='reader@example.com', name='Reader')
+        self.campaign = NewsletterCampaign.objects.create(
+            subject='News', body_text='Hi {{ name }}, leave at {{ unsubscribe_url }}',
+        )
+
+    def send(self, *args):
+        call_command('send_campaign', self.campaign.pk, '--workers', '1', *args, stdout=StringIO())
+
+    def test_rejects_base_url_without_scheme(self):
+        for base_url in ('', 'gywan.org', '/newsletter', 'ftp://gywan.org'):
+            with self.subTest(base_url), self.assertRaisesMessage(CommandError, 'scheme and host'):
+                self.send('--base-url', base_url)
+        self.assertEqual(mail.outbox, [])
+
+    def test_unsubscribe_links_are_absolute(self):
+        self.send('--base-url', 'https://gywan.org/')
+        [message] = mail.outbox
+        link = message.extra_headers['List-Unsubscribe'][1:-1]
+        self.assertTrue(link.startswith('https://gywan.org/'), link)
+        self.assertIn(link, message.body)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class CampaignSenderTests(TestCase):
+    def setUp(self):
+        for n in range(5):
+            Newsletter.objects.create(email=f'reader{n}@example.com', name=f'Reader {n}')
+        self.campaign = NewsletterCampaign.objects.create(subject='News', body_text='Hi {{ name }}')
+
+    def sender(self):
+        campaign = NewsletterCampaign.objects.get(pk=self.campaign.pk)
+        return CampaignSender(campaign, workers=1, base_url='https://gywan.org')
+
+    def test_sends_once_per_subscriber(self):
+        self.assertEqual(self.sender().run()['sent'], 5)
+        self.assertEqual(self.sender().run()['sent'], 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_concurrent_runs_do_not_both_send(self):
+        first, second = self.sender(), self.sender()
+        bulk_create = CampaignDelivery.objects.bulk_create
+        raced = []
+
+        def racing_bulk_create(*args, **kwargs):
+            # The second run claims the chunk just before the first one does
+            if not raced:
+                raced.append(True)
+                second.run()
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(CampaignDelivery.objects, 'bulk_create', racing_bulk_create):
+            totals = first.run()
+        self.assertEqual(totals['sent'], 0)
+        self.assertEqual(totals['skipped'], 5)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'reader{n}@example.com' for n in range(5)])
+        self.assertEqual(
+            set(CampaignDelivery.objects.values_list('claimed_by', flat=True)), {second.claim_token}
+        )
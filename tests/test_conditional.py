@@ -0,0 +1,71 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from main.models import Comment, Story
+
+from . import plain_static_files
+
+
+@plain_static_files
+@override_settings(PAGE_CACHE_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+        self.story = Story.objects.create(title='First', slug='first', content='c', author='Ama')
+        Story.objects.create(title='Second', slug='second', content='c', author='Ama')
+
+    def etag(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def comment(self, **fields):
+        return Comment.objects.create(
+            text='Lovely', name='Kofi', email='kofi@example.com',
+            content_type=ContentType.objects.get_for_model(Story), object_id=self.story.pk, **fields
+        )
+
+    def test_matching_etag_returns_304_without_rendering(self):
+        for path, template in (('/stories/first/', 'stories/detail.html'), ('/stories/', 'stories/list.html')):
+            with self.subTest(path):
+                etag = self.etag(path)
+                with self.assertTemplateNotUsed(template):
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_stale_etag_renders_page(self):
+        self.etag('/stories/first/')
+        response = self.client.get('/stories/first/', HTTP_IF_NONE_MATCH='W/"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_when_row_edited(self):
+        detail, listing = self.etag('/stories/first/'), self.etag('/stories/')
+        self.story.content = 'Edited'
+        self.story.save()
+        self.assertNotEqual(self.etag('/stories/first/'), detail)
+        self.assertNotEqual(self.etag('/stories/'), listing)
+
+    def test_etag_changes_when_row_deleted(self):
+        listing = self.etag('/stories/')
+        Story.objects.get(slug='second').delete()
+        self.assertNotEqual(self.etag('/stories/'), listing)
+        self.assertEqual(self.client.get('/stories/second/').status_code, 404)
+
+    def test_etag_changes_when_comment_added(self):
+        detail, listing = self.etag('/stories/first/'), self.etag('/stories/')
+        self.comment()
+        self.assertNotEqual(self.etag('/stories/first/'), detail)
+        self.assertNotEqual(self.etag('/stories/'), listing)
+
+    def test_etag_changes_when_comment_edited(self):
+        comment = self.comment()
+        detail, listing = self.etag('/stories/first/'), self.etag('/stories/')
+        comment.text = 'Edited in the admin'
+        comment.save()
+        self.assertNotEqual(self.etag('/stories/first/'), detail)
+        self.assertNotEqual(self.etag('/stories/'), listing)
+
+    def test_etag_differs_per_visitor(self):
+        other = self.client_class(HTTP_HOST='localhost')
+        self.assertNotEqual(self.etag('/stories/first/'), other.get('/stories/first/')['ETag'])
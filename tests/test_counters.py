@@ -0,0 +1,75 @@
+import threading
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+
+from main.counters import download_counter
+from main.models import Resource
+
+from . import plain_static_files
+
+
+def create_resource():
+    return Resource.objects.create(
+        title='Counted resource', description='d', category='other', file='resources/counted.txt'
+    )
+
+
+class DownloadCounterConcurrencyTests(TransactionTestCase):
+    # track_download reads through the read-only alias (gywan_project/database.py)
+    databases = {'default', 'readonly'}
+    threads = 8
+    requests = 25
+
+    def setUp(self):
+        download_counter.flush()
+        self.resource = create_resource()
+
+    def test_concurrent_downloads_are_all_counted(self):
+        path = f'/api/track-download/{self.resource.pk}/'
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            client = Client(HTTP_HOST='localhost')
+            barrier.wait()
+            try:
+                for _ in range(self.requests):
+                    response = client.post(path)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        pool = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        download_counter.flush()
+
+        self.assertEqual(errors, [])
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.download_count, self.threads * self.requests)
+
+
+@plain_static_files
+@override_settings(PAGE_CACHE_ENABLED=True)
+class DownloadCounterPurgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        download_counter.flush()
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+        self.resource = create_resource()
+
+    def test_flush_purges_cached_pages(self):
+        self.assertContains(self.client.get('/resources/'), '0 downloads')
+        download_counter.increment(self.resource.pk, 3)
+        # Still the cached copy until the increments are written
+        self.assertContains(self.client.get('/resources/'), '0 downloads')
+        download_counter.flush()
+        self.assertContains(self.client.get('/resources/'), '3 downloads')
@@ -0,0 +1,61 @@
+from django.db import OperationalError, connections, router, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+
+from gywan_project import database
+from main.models import Story
+
+
+def pragma(alias, name):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+class ReadOnlyRouterTests(TransactionTestCase):
+    databases = {'default', 'readonly'}
+
+    def test_reads_use_read_only_alias_outside_transactions(self):
+        self.assertEqual(router.db_for_read(Story), database.READ_ONLY_ALIAS)
+        self.assertEqual(Story.objects.all().db, database.READ_ONLY_ALIAS)
+        self.assertEqual(router.db_for_write(Story), database.DEFAULT_ALIAS)
+
+    def test_reads_use_default_inside_atomic(self):
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Story), database.DEFAULT_ALIAS)
+            Story.objects.create(title='Draft', slug='draft', content='c', author='Ama')
+            # The uncommitted row is visible to reads in the same transaction
+            self.assertTrue(Story.objects.filter(slug='draft').exists())
+        self.assertEqual(router.db_for_read(Story), database.READ_ONLY_ALIAS)
+
+
+class PragmaTests(TransactionTestCase):
+    databases = {'default', 'readonly'}
+
+    def test_pragmas_applied_on_connect(self):
+        for alias in ('default', 'readonly'):
+            connections[alias].close()
+            with self.subTest(alias):
+                self.assertEqual(pragma(alias, 'journal_mode'), 'wal')
+                self.assertEqual(pragma(alias, 'busy_timeout'), 5000)
+                self.assertEqual(pragma(alias, 'cache_size'), -64000)
+                self.assertEqual(pragma(alias, 'temp_store'), 2)
+        self.assertEqual(pragma('default', 'synchronous'), 1)
+        self.assertEqual(pragma('default', 'query_only'), 0)
+        self.assertEqual(pragma('readonly', 'query_only'), 1)
+
+    def test_read_only_alias_refuses_writes(self):
+        with self.assertRaises(OperationalError), connections['readonly'].cursor() as cursor:
+            cursor.execute('DELETE FROM main_story')
+
+
+class SqliteDatabaseTests(SimpleTestCase):
+    def test_settings(self):
+        default = database.sqlite_database('/srv/db.sqlite3')
+        self.assertEqual(default['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA busy_timeout=5000', default['OPTIONS']['init_command'])
+        read_only = database.sqlite_database('/srv/db.sqlite3', read_only=True)
+        self.assertEqual(read_only['NAME'], 'file:/srv/db.sqlite3?mode=ro')
+        self.assertIn('PRAGMA query_only=ON', read_only['OPTIONS']['init_command'])
+        self.assertNotIn('journal_mode', read_only['OPTIONS']['init_command'])
+        self.assertEqual(read_only['TEST'], {'MIRROR': database.DEFAULT_ALIAS})
+        self.assertEqual(database.sqlite_database('/srv/db.sqlite3', tuned=False)['OPTIONS'], {})
@@ -0,0 +1,89 @@
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from main import exports
+from main.models import Contact, Donation2
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        Contact.objects.create(name='Ama Mensah', email='ama@example.com', subject='Hello', message='Hi', is_read=True)
+        Contact.objects.create(name='Ama Owusu', email='owusu@example.com', subject='Visit', message='Hi', is_read=False)
+        Contact.objects.create(name='Kofi', email='kofi@example.com', subject='Hello', message='Hi', is_read=True)
+        Contact.objects.create(
+            name='=HYPERLINK("http://evil")', email='formula@example.com', subject='+1', message='-2 @SUM(A1)',
+        )
+
+    def setUp(self):
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+        self.client.force_login(self.admin)
+
+    def fetch(self, query):
+        response = self.client.get(f'/admin/main/contact/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def csv_rows(self, body):
+        return list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+
+    def test_export_honours_changelist_filters_and_search(self):
+        response, body = self.fetch('is_read__exact=1&q=ama')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="contacts-', response['Content-Disposition'])
+        self.assertEqual([row['name'] for row in self.csv_rows(body)], ['Ama Mensah'])
+
+    def test_export_without_filters_has_every_row(self):
+        response, body = self.fetch('')
+        self.assertEqual(len(self.csv_rows(body)), Contact.objects.count())
+
+    def test_csv_formula_cells_are_escaped(self):
+        response, body = self.fetch('q=formula')
+        [row] = self.csv_rows(body)
+        self.assertEqual(row['name'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(row['subject'], "'+1")
+        self.assertEqual(row['message'], "'-2 @SUM(A1)")
+        self.assertEqual(row['email'], 'formula@example.com')
+
+    def test_ndjson(self):
+        response, body = self.fetch('format=ndjson&q=kofi')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        [record] = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(record['name'], 'Kofi')
+        self.assertIs(record['is_read'], True)
+
+    def test_gzip(self):
+        response, body = self.fetch('gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        self.assertEqual(len(self.csv_rows(gzip.decompress(body))), Contact.objects.count())
+
+    def test_streams_in_several_chunks(self):
+        for n in range(50):
+            Donation2.objects.create(
+                amount=Decimal('12.50'), donor_name=f'Donor {n}', donor_email='d@example.com', payment_method='bank',
+            )
+        export = exports.EXPORTS[Donation2]
+        with mock.patch.object(exports, 'BUFFER_SIZE', 256):
+            plain = list(exports.export_chunks(export, fmt='ndjson'))
+            compressed = list(exports.export_chunks(export, fmt='ndjson', compress=True))
+        self.assertGreater(len(plain), 1)
+        self.assertGreater(len(compressed), 1)
+        self.assertEqual(gzip.decompress(b''.join(compressed)), b''.join(plain))
+        records = [json.loads(line) for line in b''.join(plain).decode().splitlines()]
+        self.assertEqual(len(records), 50)
+        self.assertEqual(records[0]['amount'], '12.50')
+
+    def test_requires_view_permission(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/admin/main/contact/export/').status_code, 403)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from main import homepage
+from main.models import Event
+from main.querybudget import QueryRecorder, assert_query_budget
+
+from . import plain_static_files
+
+
+@plain_static_files
+class HomepageSectionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def test_meets_query_budget_with_cold_cache(self):
+        response = assert_query_budget(self.client, 'home')
+        self.assertEqual(response.status_code, 200)
+
+    def test_recorder_sees_section_queries(self):
+        with QueryRecorder() as recorder:
+            homepage.get_sections()
+        self.assertEqual(recorder.count, len(homepage.SECTIONS))
+
+    def test_sections_see_uncommitted_rows(self):
+        Event.objects.create(
+            title='Test transaction event', slug='test-transaction-event', description='d',
+            date=timezone.now() + timedelta(days=1), location='here',
+        )
+        response = self.client.get('/')
+        self.assertContains(response, 'Test transaction event')
+
+    def test_saving_invalidates_section_once_committed(self):
+        homepage.get_sections()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Event.objects.create(
+                title='Late event', slug='late-event', description='d',
+                date=timezone.now() + timedelta(days=1), location='here',
+            )
+            # Reloading now would cache the section without the new row
+            self.assertNotContains(self.client.get('/'), 'Late event')
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get('/'), 'Late event')
+
+
+@plain_static_files
+class HomeSectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def lazy_client(self):
+        client = Client(HTTP_HOST='localhost')
+        client.cookies[homepage.LAZY_COOKIE] = '1'
+        return client
+
+    def test_each_fragment_renders(self):
+        for fragment in homepage.FRAGMENTS:
+            with self.subTest(fragment.name):
+                response = self.client.get(f'/home/sections/{fragment.name}/')
+                self.assertEqual(response.status_code, 200)
+                self.assertTemplateUsed(response, fragment.template)
+                self.assertTemplateNotUsed(response, 'index.html')
+                self.assertEqual(response['X-Robots-Tag'], 'noindex')
+
+    def test_unknown_fragment_is_404(self):
+        self.assertEqual(self.client.get('/home/sections/no-such-section/').status_code, 404)
+
+    def test_page_without_cookie_renders_fragments_inline(self):
+        response = self.client.get('/')
+        self.assertNotContains(response, 'home-section-placeholder')
+        for fragment in homepage.FRAGMENTS:
+            self.assertTemplateUsed(response, fragment.template)
+
+    def test_page_with_cookie_has_placeholders(self):
+        response = self.lazy_client().get('/')
+        for fragment in homepage.FRAGMENTS:
+            self.assertContains(response, f'data-home-section="/home/sections/{fragment.name}/"')
+            self.assertTemplateNotUsed(response, fragment.template)
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_page_cache_keeps_variants_apart(self):
+        lazy = self.lazy_client()
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'MISS')
+        self.assertEqual(lazy.get('/')['X-Page-Cache'], 'MISS')
+        inline, placeholders = self.client.get('/'), lazy.get('/')
+        self.assertEqual((inline['X-Page-Cache'], placeholders['X-Page-Cache']), ('HIT', 'HIT'))
+        self.assertNotContains(inline, 'home-section-placeholder')
+        self.assertContains(placeholders, 'home-section-placeholder', count=len(homepage.FRAGMENTS))
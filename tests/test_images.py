@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from main import images
+
+from . import plain_static_files
+
+
+@plain_static_files
+class ImageVariantViewTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        os.makedirs(os.path.join(self.media_root, 'uploads'))
+        Image.new('RGB', (800, 400), 'red').save(os.path.join(self.media_root, 'uploads', 'photo.jpg'))
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def test_builds_variant(self):
+        response = self.client.get('/img/320.webp/uploads/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        response.close()
+
+    def test_serves_original_when_build_is_slow(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        slow_build = lambda *args: release.wait(5)
+        with mock.patch.object(images, 'build_variant', slow_build), mock.patch.object(images, 'REQUEST_TIMEOUT', 0.05):
+            response = self.client.get('/img/320.webp/uploads/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response.close()
+
+    def test_serves_original_when_build_fails(self):
+        failing = mock.patch.object(images, 'ensure_variant', side_effect=OSError('image file is truncated'))
+        with failing, self.assertLogs('main.views', 'ERROR'):
+            response = self.client.get('/img/320.webp/uploads/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response.close()
+
+    def test_rejects_variants_as_sources(self):
+        self.client.get('/img/320.jpg/uploads/photo.jpg').close()
+        digest = images.source_info(os.path.join(self.media_root, 'uploads', 'photo.jpg'))[0]
+        name = images.variant_name(digest, 320, 'jpeg')
+        for path in (name, f'./{name}', f'uploads/../{name}'):
+            with self.subTest(path):
+                self.assertEqual(self.client.get(f'/img/320.jpg/{path}').status_code, 404)
+
+    def test_variant_path_stays_in_variants_directory(self):
+        with self.assertRaises(ValueError):
+            images.variant_path('variants/../uploads/photo.jpg')
@@ -0,0 +1,104 @@
+import io
+import socket
+from unittest import mock
+
+from django.test import TestCase
+from PIL import Image
+
+from main import imports, search
+from main.models import Story
+
+
+def story(title, **fields):
+    return dict({'title': title, 'content': f'{title} story content', 'author': 'Ama'}, **fields)
+
+
+def rows(*items):
+    return list(enumerate(items, 1))
+
+
+def resolves_to(*addresses):
+    infos = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 80)) for address in addresses]
+    return mock.patch('socket.getaddrinfo', return_value=infos)
+
+
+class ImporterTests(TestCase):
+    def run_import(self, *items, batch_size=imports.BATCH_SIZE):
+        return imports.Importer(Story, batch_size=batch_size, image_workers=1).run(rows(*items))
+
+    def test_slug_collisions_within_batch(self):
+        result = self.run_import(story('Coding Club'), story('Coding club'), story('coding-club', slug='Coding Club'))
+        self.assertEqual(result.created, 3)
+        self.assertEqual(
+            sorted(Story.objects.values_list('slug', flat=True)), ['coding-club', 'coding-club-2', 'coding-club-3']
+        )
+
+    def test_slug_collisions_with_existing_rows_across_batches(self):
+        Story.objects.create(title='Coding Club', slug='coding-club', content='c', author='Ama')
+        Story.objects.create(title='Coding Club', slug='coding-club-2', content='c', author='Ama')
+        result = self.run_import(*[story('Coding Club') for _ in range(3)], batch_size=2)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(
+            sorted(Story.objects.values_list('slug', flat=True)),
+            ['coding-club', 'coding-club-2', 'coding-club-3', 'coding-club-4', 'coding-club-5'],
+        )
+
+    def test_invalid_rows_reported_without_aborting_batch(self):
+        result = self.run_import(
+            story('Valid one'),
+            {'title': 'No author', 'content': 'c'},
+            story('Bad flag', featured='perhaps'),
+            'not an object',
+            story('Valid two'),
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.skipped, 3)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4])
+        self.assertIn('author', result.errors[0][1])
+        self.assertIn('featured', result.errors[1][1])
+        self.assertEqual(sorted(Story.objects.values_list('title', flat=True)), ['Valid one', 'Valid two'])
+
+    def test_imported_rows_are_searchable(self):
+        self.run_import(story('Robotics', content='Girls built a solar robot'), story('Poetry'))
+        found = search.search(Story.objects.all(), 'robot')
+        self.assertEqual([obj.title for obj in found], ['Robotics'])
+
+    def test_dry_run_saves_nothing(self):
+        result = imports.Importer(Story, dry_run=True).run(rows(story('Dry')))
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Story.objects.exists())
+
+
+class DownloadImageTests(TestCase):
+    def test_rejects_non_public_hosts(self):
+        urls = {
+            'http://127.0.0.1/a.png': '127.0.0.1',
+            'http://internal.example/a.png': '10.0.0.5',
+            'http://metadata.example/latest': '169.254.169.254',
+            'http://[::1]/a.png': '::1',
+            'http://mapped.example/a.png': '::ffff:192.168.1.1',
+        }
+        with mock.patch.object(imports._opener, 'open') as fetch:
+            for url, address in urls.items():
+                with self.subTest(url), resolves_to(address), self.assertRaisesMessage(ValueError, 'not a public'):
+                    imports.download_image(url)
+        fetch.assert_not_called()
+
+    def test_rejects_other_schemes(self):
+        with self.assertRaisesMessage(ValueError, 'only http(s)'):
+            imports.download_image('file:///etc/passwd')
+
+    def test_rejects_redirect_to_private_host(self):
+        handler = imports._PublicRedirectHandler()
+        with resolves_to('127.0.0.1'), self.assertRaisesMessage(ValueError, 'not a public'):
+            handler.redirect_request(None, None, 302, 'Found', {}, 'http://localhost/admin/')
+
+    def test_downloads_from_public_host(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.return_value = buffer.getvalue()
+        with resolves_to('93.184.216.34'), mock.patch.object(imports._opener, 'open', return_value=response):
+            filename, data = imports.download_image('https://example.com/photos/Team Photo.png')
+        self.assertEqual(filename, 'team-photo.png')
+        self.assertEqual(data, buffer.getvalue())
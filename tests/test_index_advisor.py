@@ -0,0 +1,32 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from . import plain_static_files
+
+
+@plain_static_files
+class IndexAdvisorTests(TestCase):
+    def advise(self, *args):
+        out = StringIO()
+        call_command('index_advisor', '--seed', '200', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_hot_queries_use_an_index(self):
+        output = self.advise('--check')
+        self.assertIn('0 on hot tables', output)
+        # Every page rendered and ran its queries
+        for page in ('/events/', '/stories/', '/blog/', '/resources/'):
+            self.assertRegex(output, rf'{page} \(200\): [1-9]\d* queries')
+
+    def test_check_fails_on_full_scan(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX main_event_active_date_idx')
+        with self.assertRaisesMessage(CommandError, '/events/'):
+            self.advise('--check', 'events')
+
+    def test_fails_when_a_page_does_not_render(self):
+        with self.assertRaisesMessage(CommandError, '/no-such-page/: status 404'):
+            self.advise('/no-such-page/')
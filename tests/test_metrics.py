@@ -0,0 +1,28 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+
+from main import metrics
+
+
+class MetricsViewTests(SimpleTestCase):
+    def get(self, **headers):
+        request = RequestFactory().get('/metrics', REMOTE_ADDR='127.0.0.1', **headers)
+        return metrics.metrics_view(request)
+
+    @override_settings(DEBUG=False)
+    def test_proxied_requests_need_token(self):
+        # Through the reverse proxy every request comes from 127.0.0.1
+        with mock.patch.object(metrics, 'TOKEN', ''):
+            self.assertEqual(self.get().status_code, 403)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with mock.patch.object(metrics, 'TOKEN', 'secret'):
+            self.assertEqual(self.get().status_code, 403)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(DEBUG=True)
+    def test_local_address_allowed_in_debug(self):
+        with mock.patch.object(metrics, 'TOKEN', ''):
+            self.assertEqual(self.get().status_code, 200)
@@ -0,0 +1,113 @@
+import smtplib
+from datetime import timedelta
+from unittest import mock
+
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase
+from django.utils import timezone
+
+from main import outbox
+from main.models import OutboundEmail
+
+
+class StubSMTPBackend(BaseEmailBackend):
+    """Stands in for the SMTP server; pops one outcome per message"""
+    failures = []
+    sent = []
+    opened = 0
+
+    def open(self):
+        StubSMTPBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.failures.pop(0) if self.failures else None
+            if error:
+                raise error
+            self.sent.append(message)
+        return len(messages)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        StubSMTPBackend.failures = []
+        StubSMTPBackend.sent = []
+        StubSMTPBackend.opened = 0
+        self.sender = outbox.Sender(backend='tests.test_outbox.StubSMTPBackend')
+        self.addCleanup(self.sender.close)
+        self.email = outbox.enqueue('Hello', 'Body', 'someone@example.com')
+
+    def refresh(self):
+        self.email.refresh_from_db()
+        return self.email
+
+    def test_sends_queued_email(self):
+        self.assertEqual(self.sender.send_batch(), (1, 0))
+        self.assertEqual(self.refresh().status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertEqual(StubSMTPBackend.sent[0].to, ['someone@example.com'])
+
+    def test_failure_is_retried_with_backoff(self):
+        StubSMTPBackend.failures = [smtplib.SMTPServerDisconnected('gone')]
+        before = timezone.now()
+        self.assertEqual(self.sender.send_batch(), (0, 1))
+        self.refresh()
+        self.assertEqual(self.email.status, OutboundEmail.STATUS_QUEUED)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIn('SMTPServerDisconnected', self.email.last_error)
+        self.assertGreaterEqual(self.email.next_attempt_at, before + outbox.backoff(1))
+        # Not due yet
+        self.assertEqual(self.sender.send_batch(), (0, 0))
+
+        OutboundEmail.objects.filter(pk=self.email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.sender.send_batch(), (1, 0))
+        self.assertEqual(self.refresh().status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(self.email.attempts, 2)
+        # The dropped connection was reopened for the retry
+        self.assertEqual(StubSMTPBackend.opened, 2)
+
+    def test_backoff_grows_and_is_capped(self):
+        self.assertEqual(outbox.backoff(1), timedelta(seconds=outbox.BACKOFF_BASE))
+        self.assertEqual(outbox.backoff(3), timedelta(seconds=outbox.BACKOFF_BASE * 4))
+        self.assertEqual(outbox.backoff(50), timedelta(seconds=outbox.BACKOFF_MAX))
+
+    def test_gives_up_after_max_attempts(self):
+        OutboundEmail.objects.filter(pk=self.email.pk).update(attempts=outbox.MAX_ATTEMPTS - 1)
+        StubSMTPBackend.failures = [smtplib.SMTPRecipientsRefused({})]
+        self.assertEqual(self.sender.send_batch(), (0, 1))
+        self.assertEqual(self.refresh().status, OutboundEmail.STATUS_DEAD)
+
+    def stale_lock(self, attempts=0):
+        OutboundEmail.objects.filter(pk=self.email.pk).update(
+            status=OutboundEmail.STATUS_SENDING, attempts=attempts,
+            locked_at=timezone.now() - timedelta(seconds=outbox.LOCK_TIMEOUT + 1),
+        )
+
+    def test_recent_lock_is_not_reclaimed(self):
+        OutboundEmail.objects.filter(pk=self.email.pk).update(
+            status=OutboundEmail.STATUS_SENDING, locked_at=timezone.now()
+        )
+        self.assertEqual(outbox.claim(10), [])
+
+    def test_reclaiming_stale_lock_counts_as_attempt(self):
+        self.stale_lock()
+        self.assertEqual(self.sender.send_batch(), (1, 0))
+        self.refresh()
+        self.assertEqual(self.email.status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(self.email.attempts, 2)
+
+    def test_message_that_keeps_killing_workers_goes_dead(self):
+        crashing = mock.patch.object(StubSMTPBackend, 'send_messages', side_effect=SystemExit)
+        for attempt in range(outbox.MAX_ATTEMPTS):
+            self.assertEqual(self.refresh().status, OutboundEmail.STATUS_QUEUED)
+            self.assertEqual(self.email.attempts, attempt)
+            with crashing, self.assertRaises(SystemExit):
+                self.sender.send_batch()
+            self.sender.close()
+            # The worker died holding the lock; let it go stale
+            self.stale_lock(attempts=self.refresh().attempts)
+            outbox.claim(0)
+        self.assertEqual(self.refresh().status, OutboundEmail.STATUS_DEAD)
+        self.assertEqual(self.email.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(outbox.claim(10), [])
@@ -0,0 +1,107 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.middleware.csrf import _unmask_cipher_token
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from main import pagecache
+from main.models import Event, Story
+
+from . import plain_static_files
+
+
+def create_story(slug):
+    return Story.objects.create(title=slug.title(), slug=slug, content='Story', author='Ama')
+
+
+@plain_static_files
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.story = create_story('first')
+        cls.other = create_story('second')
+        Event.objects.create(
+            title='Meetup', slug='meetup', description='d', location='here',
+            date=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def status(self, path, client=None):
+        response = (client or self.client).get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.get('X-Page-Cache')
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self.status('/stories/'), 'MISS')
+        response = self.client.get('/stories/')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'First')
+        self.assertIn('main.story', response['Surrogate-Key'].split())
+
+    def test_bypassed_for_logged_in_user(self):
+        User.objects.create_user('editor', password='secret')
+        self.client.login(username='editor', password='secret')
+        self.assertIsNone(self.status('/stories/'))
+        self.assertIsNone(self.status('/stories/'))
+
+    def test_bypassed_with_flash_messages(self):
+        response = self.client.post('/contact/', {
+            'name': 'Ama', 'email': 'ama@example.com', 'subject': 'Hi', 'message': 'Hello',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(self.status('/stories/'))
+
+    def test_bypassed_for_unknown_query_parameter(self):
+        self.assertIsNone(self.status('/stories/?utm_source=mail'))
+        self.assertEqual(self.status('/stories/?page=1'), 'MISS')
+
+    def test_purging_instance_drops_only_its_pages(self):
+        for path in ('/stories/first/', '/stories/second/', '/stories/', '/events/'):
+            self.assertEqual(self.status(path), 'MISS')
+        pagecache.purge(self.story)
+        self.assertEqual(self.status('/stories/first/'), 'MISS')
+        self.assertEqual(self.status('/stories/second/'), 'HIT')
+        self.assertEqual(self.status('/stories/'), 'HIT')
+        self.assertEqual(self.status('/events/'), 'HIT')
+
+    def test_purging_model_drops_list_pages(self):
+        for path in ('/stories/first/', '/stories/', '/events/'):
+            self.assertEqual(self.status(path), 'MISS')
+        pagecache.purge(Story)
+        self.assertEqual(self.status('/stories/'), 'MISS')
+        self.assertEqual(self.status('/stories/first/'), 'HIT')
+        self.assertEqual(self.status('/events/'), 'HIT')
+
+    def test_saving_purges_once_committed(self):
+        self.assertEqual(self.status('/stories/first/'), 'MISS')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.story.title = 'Renamed'
+            self.story.save()
+            # Not yet: a page rendered now would still read the old row
+            self.assertEqual(self.status('/stories/first/'), 'HIT')
+        for callback in callbacks:
+            callback()
+        response = self.client.get('/stories/first/')
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Renamed')
+
+    def test_csrf_token_filled_per_visitor(self):
+        self.assertEqual(self.status('/stories/'), 'MISS')
+        tokens = []
+        for client in (Client(HTTP_HOST='localhost'), Client(HTTP_HOST='localhost')):
+            response = client.get('/stories/')
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+            self.assertNotContains(response, pagecache.CSRF_HOLE)
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+            self.assertEqual(_unmask_cipher_token(token), client.cookies[settings.CSRF_COOKIE_NAME].value)
+            tokens.append(token)
+        self.assertNotEqual(tokens[0], tokens[1])
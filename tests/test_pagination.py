@@ -0,0 +1,115 @@
+import base64
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.models import Story
+from main.pagination import InvalidCursor, KeysetPaginator, decode_cursor, encode_cursor
+
+from . import plain_static_files
+
+
+def create_stories(count=7):
+    now = timezone.now()
+    stories = [
+        Story.objects.create(title=f'Story {n}', slug=f'story-{n}', content='c', author='Ama')
+        for n in range(count)
+    ]
+    # Three pairs share a created_at, so the pk has to break the ties
+    for n, story in enumerate(stories):
+        Story.objects.filter(pk=story.pk).update(created_at=now - timedelta(hours=n // 2))
+    return list(Story.objects.order_by('-created_at', '-pk'))
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ordered = create_stories()
+
+    def paginator(self):
+        return KeysetPaginator(Story.objects.all(), 2, ['-created_at'])
+
+    def walk_forward(self):
+        pages = [self.paginator().page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator().page(pages[-1].next_cursor))
+        return pages
+
+    def test_next_cursors_cover_every_row_once(self):
+        pages = self.walk_forward()
+        self.assertEqual([obj for page in pages for obj in page], self.ordered)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+    def test_first_and_last_pages(self):
+        pages = self.walk_forward()
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[0].previous_cursor)
+        self.assertTrue(pages[-1].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_previous_cursors_walk_back(self):
+        pages = self.walk_forward()
+        page = pages[-1]
+        seen = [list(page)]
+        while page.has_previous():
+            page = self.paginator().page(page.previous_cursor)
+            seen.insert(0, list(page))
+        self.assertEqual(seen, [list(page) for page in pages])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_empty_queryset(self):
+        page = KeysetPaginator(Story.objects.none(), 2, ['-created_at']).page()
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_other_pages())
+
+    def test_invalid_cursors(self):
+        tampered = [
+            'not base64 at all!',
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+            encode_cursor(['2026-01-01T00:00:00+00:00', 1], 'sideways'),
+            encode_cursor(['2026-01-01T00:00:00+00:00'], 'next'),
+            encode_cursor(['yesterday', 1], 'next'),
+            encode_cursor([None, None], 'next'),
+            encode_cursor(['2026-01-01T00:00:00+00:00', 'one'], 'next'),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor), self.assertRaises(InvalidCursor):
+                self.paginator().page(cursor)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor([1, 'a'], 'prev')), ([1, 'a'], 'prev'))
+
+
+@plain_static_files
+@override_settings(CURSOR_PAGINATION=True, PAGE_CACHE_ENABLED=False)
+class CursorPaginationViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ordered = create_stories(13)
+
+    def setUp(self):
+        cache.clear()
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def titles(self, response):
+        return [story.title for story in response.context['stories']]
+
+    def test_pages_through_list(self):
+        response = self.client.get('/stories/')
+        page = response.context['cursor_page']
+        self.assertIsNotNone(page.next_query)
+        self.assertIsNone(page.previous_query)
+        following = self.client.get(f'/stories/?{page.next_query}')
+        self.assertEqual(following.status_code, 200)
+        self.assertEqual(self.titles(following), [story.title for story in self.ordered[10:]])
+
+    def test_tampered_cursor_shows_first_page(self):
+        first = self.titles(self.client.get('/stories/'))
+        for cursor in ('garbage', encode_cursor([None, None], 'next'), encode_cursor(['x', 1], 'next')):
+            with self.subTest(cursor):
+                response = self.client.get('/stories/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.titles(response), first)
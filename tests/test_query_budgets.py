@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from main import homepage
+from main.models import (
+    BlogPost, Event, ImpactStat, Resource, Story, Supporter, TeamMember, Testimonial,
+)
+from main.querybudget import assert_query_budget
+
+from . import plain_static_files
+
+
+@plain_static_files
+@override_settings(PAGE_CACHE_ENABLED=False)
+class QueryBudgetTests(TestCase):
+    """Every page in QUERY_BUDGETS stays within its budget on seeded data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_load_data', events=60, stories=60, posts=60, comments=600, donations=20,
+            stdout=StringIO(),
+        )
+        for i in range(12):
+            Resource.objects.create(
+                title=f'Resource {i}', description='d', file=f'resources/r{i}.pdf',
+                category=Resource.CATEGORY_CHOICES[i % len(Resource.CATEGORY_CHOICES)][0],
+            )
+            TeamMember.objects.create(name=f'Member {i}', role='r', bio='b')
+            Supporter.objects.create(name=f'Supporter {i}', role='r')
+            Testimonial.objects.create(name=f'Visitor {i}', quote='q')
+            ImpactStat.objects.create(label=f'Stat {i}', value=str(i))
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def pages(self):
+        """``{url_name: [(args, kwargs)]}`` covering every budget"""
+        return {
+            'home': [((), {})],
+            'home_section': [((fragment.name,), {}) for fragment in homepage.FRAGMENTS],
+            'about': [((), {})],
+            'our_team': [((), {})],
+            'contact': [((), {})],
+            'donate2': [((), {})],
+            'donate2_thank_you': [((), {})],
+            'events': [((), {})],
+            'event_detail': [((), {'slug': Event.objects.filter(is_active=True).latest('pk').slug})],
+            'stories': [((), {})],
+            'story_detail': [((), {'slug': Story.objects.filter(is_active=True).latest('pk').slug})],
+            'blog': [((), {})],
+            'blog_detail': [((), {'slug': BlogPost.objects.filter(is_active=True, published=True).latest('pk').slug})],
+            'resources': [((), {})],
+        }
+
+    def test_every_budget_is_checked(self):
+        self.assertEqual(set(self.pages()), set(settings.QUERY_BUDGETS))
+
+    def test_pages_meet_budgets(self):
+        for url_name, requests in self.pages().items():
+            for args, kwargs in requests:
+                with self.subTest(url_name, args=args, kwargs=kwargs):
+                    cache.clear()
+                    response = assert_query_budget(self.client, url_name, *args, **kwargs)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_over_budget_fails(self):
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'events': 1}):
+            with self.assertRaisesMessage(AssertionError, 'budget is 1'):
+                assert_query_budget(self.client, 'events')
@@ -0,0 +1,88 @@
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import Bank, Donation2, DonationRollup, MobileProvider
+
+
+def rollup_rows():
+    return sorted(DonationRollup.objects.values_list(
+        'period', 'period_start', 'payment_method', 'frequency', 'mobile_provider_ref', 'bank_ref',
+        'donation_count', 'total_amount',
+    ))
+
+
+def at(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class DonationRollupTests(TestCase):
+    def setUp(self):
+        self.provider = MobileProvider.objects.create(name='MTN')
+        self.bank = Bank.objects.create(name='GCB')
+
+    def donate(self, amount, created_at=None, **fields):
+        fields.setdefault('payment_method', 'mobile')
+        fields.setdefault('mobile_provider', self.provider)
+        donation = Donation2.objects.create(
+            amount=Decimal(amount), donor_name='Ama', donor_email='ama@example.com', **fields
+        )
+        if created_at is not None:
+            # auto_now_add ignores the value passed to create()
+            donation.created_at = created_at
+            donation.save()
+        return donation
+
+    def assertMatchesRebuild(self):
+        incremental = rollup_rows()
+        call_command('rebuild_donation_rollups', stdout=StringIO())
+        self.assertEqual(incremental, rollup_rows())
+        return incremental
+
+    def test_create(self):
+        self.donate('12.00')
+        self.donate('10.00', at(2026, 3, 14, 12))
+        self.donate('5.50', at(2026, 3, 14, 18))
+        self.donate('20.00', at(2026, 3, 20, 9), payment_method='bank', mobile_provider=None, bank_name=self.bank)
+        rows = self.assertMatchesRebuild()
+        self.assertIn(('month', at(2026, 3, 1).date(), 'mobile', 'one_time', self.provider.pk, 0, 2, Decimal('15.50')), rows)
+
+    def test_amount_change(self):
+        donation = self.donate('10.00', at(2026, 3, 14, 12))
+        self.donate('7.00', at(2026, 3, 14, 13))
+        donation.amount = Decimal('25.00')
+        donation.save()
+        rows = self.assertMatchesRebuild()
+        self.assertIn(('day', at(2026, 3, 14).date(), 'mobile', 'one_time', self.provider.pk, 0, 2, Decimal('32.00')), rows)
+
+    def test_date_change_across_day(self):
+        donation = self.donate('10.00', at(2026, 3, 14, 12))
+        self.donate('3.00', at(2026, 3, 14, 13))
+        donation.created_at = at(2026, 3, 15, 12)
+        donation.save()
+        self.assertMatchesRebuild()
+
+    def test_date_change_across_month(self):
+        donation = self.donate('10.00', at(2026, 3, 31, 12))
+        donation.created_at = at(2026, 4, 1, 12)
+        donation.save()
+        rows = self.assertMatchesRebuild()
+        self.assertNotIn(at(2026, 3, 1).date(), [row[1] for row in rows])
+
+    def test_dimension_change(self):
+        donation = self.donate('10.00', at(2026, 3, 14, 12))
+        donation.frequency = 'monthly'
+        donation.save()
+        self.assertMatchesRebuild()
+
+    def test_delete(self):
+        kept = self.donate('10.00', at(2026, 3, 14, 12))
+        self.donate('4.00', at(2026, 3, 14, 15)).delete()
+        self.donate('8.00', at(2026, 2, 2, 10)).delete()
+        rows = self.assertMatchesRebuild()
+        # Emptied rows are removed rather than left at zero
+        self.assertEqual({row[1] for row in rows}, {kept.created_at.date(), at(2026, 3, 1).date()})
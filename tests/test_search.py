@@ -0,0 +1,68 @@
+from importlib import import_module
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.apps import apps
+from django.db import NotSupportedError, connection, connections
+from django.template import Context, Template
+from django.test import TestCase
+
+from main import search
+from main.models import Story
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.story = Story.objects.create(
+            title='Coding club', author='Ama', slug='coding-club',
+            content='Girls built a <script>alert(1)</script> robot & a website \x03at the coding club.',
+        )
+
+    def snippet(self, query):
+        story = search.search(Story.objects.all(), query).get()
+        return story.search_snippet
+
+    def test_ranks_and_snippets_matches(self):
+        self.assertTrue(search.is_available(Story))
+        self.assertIn(f'{search.HIGHLIGHT_START}robot{search.HIGHLIGHT_END}', self.snippet('robot'))
+
+    def test_highlight_escapes_before_marking(self):
+        html = search.highlight_html(self.snippet('robot'))
+        self.assertIn('&lt;script&gt;', html)
+        self.assertIn('<mark>robot</mark>', html)
+        self.assertIn('&amp;', html)
+        self.assertNotIn('<script>', html)
+
+    def test_indexed_text_cannot_forge_markers(self):
+        html = search.highlight_html(self.snippet('website'))
+        self.assertEqual(html.count('<mark>'), html.count('</mark>'))
+        self.assertEqual(html.count('<mark>'), 1)
+
+    def test_highlight_filter_marks_escaped_terms(self):
+        snippet = f'{search.HIGHLIGHT_START}<b>{search.HIGHLIGHT_END} and more'
+        rendered = Template('{% load custom_filters %}{{ snippet|highlight }}').render(Context({'snippet': snippet}))
+        self.assertEqual(rendered, '<mark>&lt;b&gt;</mark> and more')
+
+    def test_rebuild_reindexes_rows(self):
+        self.assertEqual(search.rebuild(Story), 1)
+        self.assertEqual(search.search(Story.objects.all(), 'robot').count(), 1)
+
+    def test_migration_backfill_strips_markers(self):
+        migration = import_module('main.migrations.0003_search_index')
+        with connection.cursor() as cursor:
+            cursor.execute(search.INDEXES[Story].drop_sql())
+        # The schema editor can't be opened inside the test's transaction
+        editor = mock.Mock(connection=connection, execute=lambda sql: connection.cursor().execute(sql))
+        migration.create_search_tables(apps, editor)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM main_story_fts WHERE rowid = %s', [self.story.pk])
+            [(content,)] = cursor.fetchall()
+        self.assertEqual(content, search._indexable(self.story.content))
+        self.assertNotIn(search.HIGHLIGHT_END, content)
+
+    def test_rebuild_needs_sqlite(self):
+        with mock.patch.object(connections['default'], 'vendor', 'postgresql'):
+            with self.assertRaisesMessage(NotSupportedError, 'needs SQLite FTS5'):
+                search.rebuild(Story)
+            with self.assertRaisesMessage(CommandError, 'needs SQLite FTS5'):
+                call_command('rebuild_search_index')
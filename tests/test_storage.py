@@ -0,0 +1,79 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+
+from main.storage import StaticFilesMiddleware
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.css = b'body { color: red; }\n' * 100
+        (self.root / 'site.css').write_bytes(self.css)
+        # Not real zstd data: the middleware serves the sibling as it is
+        (self.root / 'site.css.zst').write_bytes(b'zstd-compressed')
+        (self.root / 'site.css.gz').write_bytes(b'gzip-compressed-but-longer')
+
+    def get(self, accept_encoding):
+        with override_settings(STATIC_ROOT=self.root, STATIC_URL='/static/', DEBUG=False):
+            middleware = StaticFilesMiddleware(lambda request: None)
+            request = RequestFactory().get('/static/site.css', HTTP_ACCEPT_ENCODING=accept_encoding)
+            response = middleware(request)
+        self.addCleanup(response.close)
+        return response, b''.join(response.streaming_content)
+
+    def test_serves_zstd_sibling(self):
+        response, body = self.get('zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(body, b'zstd-compressed')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_prefers_smallest_accepted_encoding(self):
+        response, body = self.get('gzip, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+
+    def test_identity_without_accept_encoding(self):
+        response, body = self.get('')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(body, self.css)
+
+
+class StaticImageTagTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # As collectstatic leaves it: only logo.png came out smaller as WebP
+        manifest = {'version': '1.1', 'paths': {
+            'images/logo.png': 'images/logo.1a2b.png',
+            'images/logo.png.webp': 'images/logo.png.3c4d.webp',
+            'images/photo.jpg': 'images/photo.5e6f.jpg',
+        }}
+        Path(directory.name, 'staticfiles.json').write_text(json.dumps(manifest))
+        storages = {**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+        }}
+        override = override_settings(STATIC_ROOT=directory.name, STATIC_URL='/static/', STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def render(self, path):
+        template = Template('{% load responsive_images %}{% static_image path alt="Logo" css_class="logo" %}')
+        return template.render(Context({'path': path}))
+
+    def test_offers_webp_sibling(self):
+        self.assertHTMLEqual(self.render('images/logo.png'), (
+            '<picture><source type="image/webp" srcset="/static/images/logo.png.3c4d.webp">'
+            '<img src="/static/images/logo.1a2b.png" alt="Logo" class="logo"></picture>'
+        ))
+
+    def test_plain_img_without_sibling(self):
+        self.assertHTMLEqual(
+            self.render('images/photo.jpg'), '<img src="/static/images/photo.5e6f.jpg" alt="Logo" class="logo">'
+        )
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from main.streaming import serve_file
+
+
+class OffloadResponseTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        self.path = os.path.join(self.media_root, 'report.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(b'%PDF-1.4')
+        self.request = RequestFactory().get('/download/')
+
+    def serve(self, filename):
+        with override_settings(MEDIA_ROOT=self.media_root, FILE_OFFLOAD='x-accel-redirect'):
+            return serve_file(self.request, self.path, filename=filename, as_attachment=True)
+
+    def test_redirects_to_internal_location(self):
+        response = self.serve('report.pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/report.pdf')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.pdf"')
+
+    def test_quotes_filename_like_file_response(self):
+        response = self.serve('annual "final".pdf')
+        self.assertEqual(response['Content-Disposition'], r'attachment; filename="annual \"final\".pdf"')
+
+    def test_encodes_non_ascii_filename(self):
+        response = self.serve('rapport année.pdf')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''rapport%20ann%C3%A9e.pdf")
@@ -0,0 +1,91 @@
+from importlib import reload
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, resolve
+
+import gywan_project.urls
+import main.urls
+from main import views_async
+from main.counters import download_counter
+from main.models import Comment, Resource, Story
+
+from . import plain_static_files
+
+
+def reload_urlconf():
+    # main/urls.py picks the view module when it is imported
+    reload(main.urls)
+    reload(gywan_project.urls)
+    clear_url_caches()
+
+
+@plain_static_files
+@override_settings(ASYNC_VIEWS=True, PAGE_CACHE_ENABLED=False)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reload_urlconf()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        reload_urlconf()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.story = Story.objects.create(title='First', slug='first', content='c', author='Ama')
+        cls.resource = Resource.objects.create(
+            title='Guide', description='d', category='other', file='resources/guide.txt', download_count=4
+        )
+
+    def setUp(self):
+        self.async_client.defaults['HTTP_HOST'] = 'localhost'
+        download_counter.flush()
+        self.addCleanup(download_counter.flush)
+
+    def test_urls_route_to_async_views(self):
+        self.assertIs(resolve('/stories/').func.view_class, views_async.StoryListView)
+        self.assertIs(resolve('/stories/first/').func.view_class, views_async.StoryDetailView)
+        self.assertIs(resolve('/api/track-download/1/').func, views_async.track_download)
+
+    async def test_list(self):
+        response = await self.async_client.get('/stories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'stories/list.html')
+        self.assertEqual([story.title for story in response.context['stories']], ['First'])
+
+    async def test_detail(self):
+        response = await self.async_client.get('/stories/first/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['story'], self.story)
+        with self.assertTemplateNotUsed('stories/detail.html'):
+            cached = await self.async_client.get('/stories/first/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual((await self.async_client.get('/stories/missing/')).status_code, 404)
+
+    async def test_list_comment_post(self):
+        response = await self.async_client.post('/stories/', {'comment': 'Inspiring'})
+        self.assertRedirects(response, '/stories/', fetch_redirect_response=False)
+        await self.async_client.post('/stories/', {'comment': ''})
+        self.assertEqual([comment.text async for comment in Comment.objects.all()], ['Inspiring'])
+
+    async def test_detail_comment_post(self):
+        form = {'comment': 'Well done', 'name': 'Kofi', 'email': 'kofi@example.com'}
+        response = await self.async_client.post('/stories/first/', form)
+        self.assertRedirects(response, '/stories/first/', fetch_redirect_response=False)
+        await self.async_client.post('/stories/first/', dict(form, email=''))
+        comment = await Comment.objects.aget()
+        self.assertEqual((comment.text, comment.name, comment.object_id), ('Well done', 'Kofi', self.story.pk))
+        self.assertEqual(comment.content_type_id, (await ContentType.objects.aget(model='story')).pk)
+        missing = await self.async_client.post('/stories/missing/', form)
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_track_download(self):
+        path = f'/api/track-download/{self.resource.pk}/'
+        response = await self.async_client.post(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True, 'download_count': 5})
+        self.assertEqual((await self.async_client.post('/api/track-download/0/')).status_code, 404)
+        self.assertEqual((await self.async_client.get(path)).status_code, 400)